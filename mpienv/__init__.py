@@ -1,7 +1,58 @@
-from .core import Mpienv, mpienv, UnknownMPI, AlreadyManagedMpi  # NOQA
+# coding: utf-8
+"""mpienv: MPI environment selector
+
+Importing the package is cheap: mpienv.core, which loads the MPI classes,
+is imported only when the global `mpienv` object is used.
+"""
+import importlib
+import os.path
 
 VERSION_MAJOR = 0
 VERSION_MINOR = 2
 VERSION_PATCH = 1
 
 __version__ = "{}.{}.{}".format(VERSION_MAJOR, VERSION_MINOR, VERSION_PATCH)
+
+# Names of mpienv.core that used to be imported by the package
+_CORE_NAMES = ['Mpienv', 'UnknownMPI', 'AlreadyManagedMpi']
+
+
+class _LazyMpienv(object):
+    """Proxy of the global Mpienv object
+
+    Loading the configuration is deferred until the object is actually
+    used, so that commands like `mpienv help` start quickly.
+    """
+
+    def __init__(self):
+        self._obj = None
+
+    def _get(self):
+        if self._obj is None:
+            core = importlib.import_module('mpienv.core')
+            root_dir = (os.environ.get("MPIENV_ROOT", None) or
+                        os.path.join(os.path.expanduser('~'), '.mpienv'))
+            self._obj = core.Mpienv(root_dir)
+        return self._obj
+
+    def __getattr__(self, attr):
+        if attr == '_obj':
+            raise AttributeError(attr)
+        return getattr(self._get(), attr)
+
+    def __contains__(self, key):
+        return key in self._get()
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+
+mpienv = _LazyMpienv()
+
+
+def __getattr__(name):
+    # Python 3.7+: import mpienv.core on first use of its names
+    if name in _CORE_NAMES:
+        return getattr(importlib.import_module('mpienv.core'), name)
+    raise AttributeError(
+        "module 'mpienv' has no attribute '{}'".format(name))
@@ -0,0 +1,32 @@
+# coding: utf-8
+"""Entry point of `python -m mpienv <command> [<args>]`
+
+Only the module of the selected command is imported.
+"""
+import importlib
+import sys
+
+from mpienv.command import command_names
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if len(argv) == 0:
+        sys.stderr.write("Usage: mpienv <command> [<args>]\n")
+        exit(1)
+
+    command = argv[0]
+    if command not in command_names():
+        sys.stderr.write("mpienv [ERROR]: Unknown command "
+                         "'{}'\n".format(command))
+        exit(1)
+
+    mod = importlib.import_module("mpienv.command.{}".format(command))
+    sys.argv = ["mpienv {}".format(command)] + list(argv[1:])
+    mod.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# coding: utf-8
+"""Batch mode of `mpienv exec`
+
+A batch file lists command lines of mpiexec (one job per line, e.g.
+`-n 4 ./sim --param 1`). The environment of the MPI is resolved once,
+and the jobs are run concurrently as long as the slots of the hosts
+allow. Each job gets its own hosts, packed onto the free slots in the
+order of the host list.
+"""
+import shlex
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # NOQA
+
+from mpienv.hosts import HostList
+
+_NP_OPTIONS = ['-n', '--n', '-np', '--np', '-c']
+
+
+class Job(object):
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.np = job_size(args)
+        self.mpi_args = None
+        self.user_args = None
+        self.hosts = None
+        self.returncode = None
+        self.start = None
+        self.seconds = None
+
+
+def read_batch(lines):
+    """Return the list of Jobs in the lines of a batch file"""
+    jobs = []
+    for line in lines:
+        args = shlex.split(line, comments=True)
+        if len(args) > 0:
+            jobs.append(Job(len(jobs) + 1, args))
+    return jobs
+
+
+def job_size(args):
+    """Return the number of processes of the mpiexec arguments `args`"""
+    for i, arg in enumerate(args[:-1]):
+        if arg in _NP_OPTIONS and args[i + 1].isdigit():
+            return int(args[i + 1])
+    return 1
+
+
+class SlotPool(object):
+    """Free slots of the hosts
+
+    If `hostlist` is empty, the jobs run on 'localhost', which has
+    `local_slots` slots. Hosts without the number of slots have one.
+    """
+
+    def __init__(self, hostlist, local_slots=1):
+        if len(hostlist) == 0:
+            self._free = [('localhost', local_slots)]
+        else:
+            self._free = [(host, slots or 1)
+                          for host, slots in hostlist.items()]
+        self._total = sum(n for _, n in self._free)
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return self._total
+
+    def allocate(self, np):
+        """Return a HostList of `np` slots, or None if not available
+
+        A job larger than all the slots is given all of them when the
+        pool is completely free.
+        """
+        with self._lock:
+            free = sum(n for _, n in self._free)
+            if np > self._total and free == self._total:
+                np = self._total
+            if np > free:
+                return None
+
+            alloc = HostList()
+            for i, (host, n) in enumerate(self._free):
+                if np == 0:
+                    break
+                take = min(n, np)
+                if take > 0:
+                    alloc.add(host, take)
+                    self._free[i] = (host, n - take)
+                    np -= take
+            return alloc
+
+    def release(self, alloc):
+        with self._lock:
+            for i, (host, n) in enumerate(self._free):
+                if host in alloc:
+                    self._free[i] = (host, n + alloc.slots(host))
+
+
+def run_batch(jobs, pool, launch, max_jobs=None):
+    """Run `jobs` on the slots of `pool`
+
+    `launch(job)` starts a job on `job.hosts` and returns a Popen
+    object. At most `max_jobs` jobs run at once, if given. Jobs are
+    started in order, but a job that fits in the free slots may start
+    before an earlier one that does not.
+    """
+    pending = list(jobs)
+    running = [0]
+    done = queue.Queue()
+
+    def wait(job, p):
+        job.returncode = p.wait()
+        job.seconds = time.time() - job.start
+        done.put(job)
+
+    while len(pending) > 0 or running[0] > 0:
+        for job in list(pending):
+            if max_jobs is not None and running[0] >= max_jobs:
+                break
+            alloc = pool.allocate(job.np)
+            if alloc is None:
+                continue
+            pending.remove(job)
+            job.hosts = alloc
+            job.start = time.time()
+            try:
+                p = launch(job)
+            except OSError:
+                job.returncode = 127
+                job.seconds = 0.0
+                pool.release(alloc)
+                continue
+            running[0] += 1
+            t = threading.Thread(target=wait, args=(job, p))
+            t.daemon = True
+            t.start()
+
+        if running[0] > 0:
+            job = done.get()
+            running[0] -= 1
+            pool.release(job.hosts)
+    return jobs
+
+
+def format_summary(jobs, wall_time):
+    """Return the lines of the summary of finished `jobs`"""
+    lines = ["{:>5} {:>5} {:>10}  {}".format(
+        'job', 'exit', 'seconds', 'command')]
+    for job in jobs:
+        cmd = ' '.join(job.args)
+        if len(cmd) > 56:
+            cmd = cmd[:53] + '...'
+        lines.append("{:>5} {:>5} {:>10.3f}  {}".format(
+            job.index, job.returncode, job.seconds or 0.0, cmd))
+
+    failed = len([j for j in jobs if j.returncode != 0])
+    total = sum(j.seconds or 0.0 for j in jobs)
+    lines.append("{} jobs, {} failed, {:.3f} sec in total, "
+                 "{:.3f} sec of wall time".format(len(jobs), failed, total,
+                                                  wall_time))
+    return lines
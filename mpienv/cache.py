@@ -0,0 +1,154 @@
+# coding: utf-8
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+
+def file_stamp(path):
+    """Return an identity stamp of `path`, or None if it does not exist
+
+    A stamp is (realpath, inode, size, mtime). If any of them changes,
+    the file is regarded as modified.
+    """
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime]
+
+
+def file_fingerprint(path):
+    """Return a short digest of the stamp of `path`, or None"""
+    stamp = file_stamp(path)
+    if stamp is None:
+        return None
+    text = json.dumps(stamp)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def write_atomic(path, text):
+    """Write `text` to `path` so that readers never see a partial file"""
+    tmp = "{}.{}.{}.tmp".format(path, os.uname()[1], os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.rename(tmp, path)
+
+
+class ProbeCache(object):
+    """On-disk cache of MPI probe results
+
+    Each entry is keyed by the path of mpiexec and holds the stamps of
+    all the files the probe depended on (mpiexec, mpicc, ompi_info and
+    mpi.h). An entry is valid only if all of the stamps are unchanged.
+    """
+    FORMAT = 1
+
+    def __init__(self, cache_dir, preload=None):
+        self._path = os.path.join(cache_dir, 'probe.json')
+        self._entries = None
+        # Entries given by the caller (e.g. from the compiled state),
+        # which are looked up before loading the cache file.
+        self._preload = preload or {}
+        # Installations may be probed concurrently
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return self._path
+
+    def _load(self):
+        with self._lock:
+            return self._load_unlocked()
+
+    def _load_unlocked(self):
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            if data.get('format') == ProbeCache.FORMAT:
+                self._entries = data.get('entries', {})
+        except (IOError, OSError, ValueError):
+            # A missing or corrupted cache is just empty.
+            pass
+
+        return self._entries
+
+    def _lookup(self, mpiexec):
+        ent = self._preload.get(mpiexec)
+        if ent is not None and self._is_valid(ent):
+            return ent
+
+        ent = self._load().get(mpiexec)
+        if ent is not None and self._is_valid(ent):
+            return ent
+        return None
+
+    @staticmethod
+    def _is_valid(ent):
+        for path, stamp in ent['stamps'].items():
+            if file_stamp(path) != stamp:
+                return False
+        return True
+
+    def get(self, mpiexec):
+        """Return the cached probe result of `mpiexec`, or None"""
+        ent = self._lookup(mpiexec)
+        if ent is None:
+            return None
+        return ent['info']
+
+    def entries(self, mpiexecs):
+        """Return raw valid entries of `mpiexecs` (used to export them)"""
+        ents = {}
+        for mpiexec in mpiexecs:
+            ent = self._lookup(mpiexec)
+            if ent is not None:
+                ents[mpiexec] = ent
+        return ents
+
+    def put(self, mpiexec, files, info, save=True):
+        """Store `info` of `mpiexec` that depends on `files`
+
+        If `save` is False, the cache file is written by a later `save`.
+        """
+        stamps = {}
+        for path in [mpiexec] + list(files):
+            if path is not None:
+                stamps[path] = file_stamp(path)
+
+        with self._lock:
+            self._load()[mpiexec] = {
+                'stamps': stamps,
+                'info': info,
+            }
+            if save:
+                self.save()
+
+    def remove(self, mpiexec):
+        with self._lock:
+            self._preload.pop(mpiexec, None)
+            if self._load().pop(mpiexec, None) is not None:
+                self.save()
+
+    def save(self):
+        with self._lock:
+            data = {
+                'format': ProbeCache.FORMAT,
+                'entries': self._load(),
+            }
+            try:
+                dir_name = os.path.dirname(self._path)
+                if not os.path.exists(dir_name):
+                    os.makedirs(dir_name)
+                write_atomic(self._path, json.dumps(data, indent=1,
+                                                    sort_keys=True))
+            except (IOError, OSError):
+                # The cache is just an optimization.
+                pass
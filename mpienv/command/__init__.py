@@ -0,0 +1,28 @@
+# coding: utf-8
+
+# Registry of the subcommands of `mpienv` and their descriptions.
+# The descriptions are duplicated from the parsers of the command
+# modules so that `mpienv help` does not need to import all of them.
+COMMANDS = [
+    ('add', 'Add a MPI environment already installed in your host.'),
+    ('autodiscover', 'Find MPI environments already installed in your host.'),
+    ('describe', 'Describe a registered MPI'),
+    ('exec', 'Call mpiexec with appropriate arguments'),
+    ('help', 'Show this help message.'),
+    ('import', 'Import MPIs installed by Spack or EasyBuild.'),
+    ('info', 'Show information of current MPI environment.'),
+    ('list', 'List all available MPI environments.'),
+    ('prefix', 'Show installed directory of the specified environment.'),
+    ('rename', 'Rename an environment.'),
+    ('restore', 'Restore the status'),
+    ('rm', 'Remove a specific MPI environment.'),
+    ('use', 'Set the specific MPI environment.'),
+]
+
+
+def command_names():
+    return [name for name, _ in COMMANDS]
+
+
+def command_description(command):
+    return dict(COMMANDS)[command]
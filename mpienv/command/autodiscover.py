@@ -3,13 +3,20 @@
 import argparse
 import errno
 import glob
+import itertools
 import os
 import os.path
 import re
 import sys
 
-from mpienv import AlreadyManagedMpi
 from mpienv import mpienv
+from mpienv.core import AlreadyManagedMpi
+from mpienv.discover import DiscoverIndex
+from mpienv.discover import quick_prefixes
+from mpienv.discover import walk
+from mpienv.locatedb import find_db
+from mpienv.locatedb import find_prefixes
+from mpienv.locatedb import LocateDbError
 
 
 parser = argparse.ArgumentParser(
@@ -21,6 +28,34 @@ parser.add_argument('-v', '--verbose', dest='verbose',
                     action="store_true", default=None)
 parser.add_argument('-q', '--quiet', dest='quiet',
                     action="store_true", default=None)
+parser.add_argument('--deep', dest='deep',
+                    action="store_true", default=False,
+                    help="Also walk the default search paths recursively "
+                    "(always done for explicitly given paths)")
+parser.add_argument('--max-depth', dest='max_depth', type=int,
+                    default=None,
+                    help="Maximum depth of directories to search")
+parser.add_argument('-x', '--one-file-system', dest='one_fs',
+                    action="store_true", default=False,
+                    help="Do not cross file system boundaries")
+parser.add_argument('--include-network', dest='include_network',
+                    action="store_true", default=False,
+                    help="Also search network file systems mounted "
+                    "under the paths")
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=8,
+                    help="Number of directories scanned in parallel")
+parser.add_argument('--full', dest='full',
+                    action="store_true", default=False,
+                    help="Scan all directories again, ignoring the index "
+                    "of the previous scan")
+parser.add_argument('--from-locatedb', dest='from_locatedb',
+                    action="store_true", default=False,
+                    help="Find MPIs from the locate database (mlocate or "
+                    "GNU findutils) instead of walking the file system")
+parser.add_argument('--locatedb', dest='locatedb', default=None,
+                    metavar='DB',
+                    help="Path of the locate database "
+                    "(implies --from-locatedb)")
 parser.add_argument('paths', nargs='*')
 
 
@@ -148,7 +183,7 @@ def install_mpi(path, mpiexec):
         prints()
 
 
-def investigate_path(path, flg_to_add, done={}):
+def investigate_path(path, to_add, done={}):
     for mpiexec in list_mpiexec(path):
         if mpiexec in done:
             continue
@@ -172,14 +207,33 @@ def investigate_path(path, flg_to_add, done={}):
             prints("--------------------------------------")
             prints("Found {}".format(mpiexec))
             mpi = mpienv.get_mpi_from_mpiexec(mpiexec)
+            if mpi.is_broken:
+                prints("Skipped: the MPI is broken or does not respond")
+                continue
             mpi.describe()
             # Install the new MPI
-            if flg_to_add:
-                install_mpi(path, mpiexec)
+            if to_add is not None:
+                to_add.append((path, mpiexec))
 
     return done
 
 
+def _locatedb_prefixes(db_path, roots):
+    """Return prefixes found in the locate database, or None"""
+    if db_path is None:
+        db_path = find_db()
+        if db_path is None:
+            printv("No locate database found. Walking the file system.")
+            return None
+
+    try:
+        return find_prefixes(db_path, roots)
+    except (IOError, OSError, LocateDbError) as e:
+        sys.stderr.write("mpienv: Warning: Cannot read the locate database "
+                         "({}). Walking the file system.\n".format(e))
+        return None
+
+
 def main():
     global _verbose
     global _quiet
@@ -206,11 +260,41 @@ def main():
                                       warn=(not using_default))
 
     done = set()
-
-    for path in search_paths:
-        for (dirpath, dirs, files) in os.walk(path):
-            # print("done = {}".format(done))
-            done = investigate_path(dirpath, to_add, done)
+    found = [] if to_add else None
+
+    # Without explicit paths, only the quick discovery runs by default
+    deep = args.deep or not using_default
+
+    prefixes = None
+    if args.from_locatedb or args.locatedb is not None:
+        prefixes = _locatedb_prefixes(args.locatedb,
+                                      None if using_default else search_paths)
+        if prefixes is None:
+            deep = True
+
+    if prefixes is None:
+        prefixes = quick_prefixes() if using_default else []
+        if deep:
+            # Directories unchanged since the previous scan are not
+            # scanned again
+            index = DiscoverIndex(mpienv.cache_dir())
+            if args.full:
+                index.clear()
+            prefixes = itertools.chain(
+                prefixes,
+                walk(search_paths, max_depth=args.max_depth,
+                     one_fs=args.one_fs,
+                     skip_network=(not args.include_network),
+                     jobs=args.jobs, index=index))
+
+    for prefix in prefixes:
+        done = investigate_path(prefix, found, done)
+
+    if found:
+        # Register all the MPIs at once
+        with mpienv.transaction():
+            for path, mpiexec in found:
+                install_mpi(path, mpiexec)
 
 
 if __name__ == "__main__":
@@ -22,14 +22,15 @@ def main():
     idx = 0
     dry_run = False
     verbose = False
-    keep = False
     no_python_abspath = False
-    while True:
+    script = False
+    nodelist = None
+    batch = {}
+    while idx < len(args):
         if args[idx] == '--dry-run':
             # --dry-run is mpienv's unique option and is not passed to mpiexec.
             args.pop(idx)
             dry_run = True
-            keep = True
             verbose = True
         elif args[idx] == '--verbose':
             # The behaviour of '--verbose' is tricky
@@ -40,16 +41,57 @@ def main():
             idx += 1
             verbose = True
         elif args[idx] == '--keep':
-            keep = True
+            # Scripts are always kept and reused now. The option is
+            # accepted for compatibility.
             args.pop(idx)
+        elif args[idx] == '--script':
+            # Run the ranks through a script instead of forwarding the
+            # environment by mpiexec's options
+            script = True
+            args.pop(idx)
+        elif args[idx] == '--nodelist':
+            # A compressed nodelist like 'node[001-128]', which is
+            # expanded to the host options of mpiexec
+            args.pop(idx)
+            if idx >= len(args):
+                sys.stderr.write("mpienv: Error: --nodelist needs "
+                                 "an argument.\n")
+                exit(1)
+            nodelist = args.pop(idx)
+        elif args[idx] in ['--batch', '--jobs', '--slots', '--batch-log']:
+            # Batch mode: run the jobs listed in a file (one line of
+            # mpiexec arguments per job) concurrently
+            opt = args.pop(idx)
+            if idx >= len(args):
+                sys.stderr.write("mpienv: Error: {} needs "
+                                 "an argument.\n".format(opt))
+                exit(1)
+            value = args.pop(idx)
+            if opt in ['--jobs', '--slots']:
+                if not value.isdigit() or int(value) == 0:
+                    sys.stderr.write("mpienv: Error: {} needs a positive "
+                                     "integer.\n".format(opt))
+                    exit(1)
+                value = int(value)
+            batch[opt.lstrip('-').replace('-', '_')] = value
         elif args[idx] == '--no-python-abspath':
             no_python_abspath = True
             args.pop(idx)
         else:
             break
 
-    mpienv.exec_(args, dry_run=dry_run, verbose=verbose, keep=keep,
-                 no_python_abspath=no_python_abspath)
+    if 'batch' in batch:
+        mpienv.exec_batch(args, batch['batch'], dry_run=dry_run,
+                          verbose=verbose,
+                          no_python_abspath=no_python_abspath, script=script,
+                          nodelist=nodelist, jobs=batch.get('jobs'),
+                          slots=batch.get('slots'),
+                          log_dir=batch.get('batch_log'))
+        return
+
+    mpienv.exec_(args, dry_run=dry_run, verbose=verbose,
+                 no_python_abspath=no_python_abspath, script=script,
+                 nodelist=nodelist)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,14 @@
 # coding: utf-8
 
 import argparse
-import glob
 import importlib
-import os
+
+from mpienv.command import command_description
+from mpienv.command import command_names
 
 
 def _get_command_description(command):
-    mod = importlib.import_module(command)
-    return mod.parser.description
+    return command_description(command)
 
 
 class MpienvHelpFormatter(argparse.HelpFormatter):
@@ -39,8 +39,7 @@ class MpienvHelpArgumentParser(argparse.ArgumentParser):
 
         # commands
         formatter.start_section('Commands')
-        for path in glob.glob(os.path.join(os.path.dirname(__file__), '*.py')):
-            command, _ = os.path.splitext(os.path.basename(path))
+        for command in command_names():
             formatter.add_command(command)
         formatter.end_section()
 
@@ -61,16 +60,18 @@ parser.add_argument('command', type=str, default=None, nargs='?',
                     help='mpienv command name')
 
 
-if __name__ == '__main__':
+def main():
     args = parser.parse_args()
 
     if args.command is None:
         parser.print_help()
+    elif args.command not in command_names():
+        print('mpienv: no such command {}'.format(args.command))
     else:
-        try:
-            command = "mpienv.command.{}".format(args.command)
-            print("command = {}".format(command))
-            mod = importlib.import_module(command)
-            mod.parser.print_help()
-        except BaseException:
-            print('mpienv: no such command {}'.format(args.command))
+        command = "mpienv.command.{}".format(args.command)
+        mod = importlib.import_module(command)
+        mod.parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
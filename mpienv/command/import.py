@@ -0,0 +1,87 @@
+# coding: utf-8
+
+import argparse
+import os
+import os.path
+import sys
+
+from mpienv import mpienv
+from mpienv.pkgdb import PkgDbError
+from mpienv.pkgdb import read_easybuild
+from mpienv.pkgdb import read_spack_db
+
+
+parser = argparse.ArgumentParser(
+    prog='mpienv import',
+    description='Import MPIs installed by Spack or EasyBuild.')
+parser.add_argument('--spack', dest='spack', nargs='?', const='',
+                    default=None, metavar='DB',
+                    help="Spack's install database (index.json) or the "
+                    "Spack root (default: $SPACK_ROOT)")
+parser.add_argument('--easybuild', dest='easybuild', nargs='?', const='',
+                    default=None, metavar='PATH',
+                    help="Install path, software directory or module tree "
+                    "of EasyBuild (default: $EASYBUILD_PREFIX or "
+                    "~/.local/easybuild)")
+parser.add_argument('--verify', dest='verify',
+                    action="store_true", default=False,
+                    help="Probe the imported MPIs (without --spack or "
+                    "--easybuild, all the MPIs not verified yet)")
+parser.add_argument('-n', '--dry-run', dest='dry_run',
+                    action="store_true", default=False,
+                    help="Only show the MPIs that would be imported")
+
+
+def _default_path(var, default=None):
+    path = os.environ.get(var) or default
+    if path is None:
+        sys.stderr.write("mpienv: Error: ${} is not set\n".format(var))
+        exit(1)
+    return os.path.expanduser(path)
+
+
+def _read(args):
+    records = []
+    try:
+        if args.spack is not None:
+            path = args.spack or _default_path('SPACK_ROOT')
+            records += read_spack_db(path)
+        if args.easybuild is not None:
+            path = args.easybuild or _default_path('EASYBUILD_PREFIX',
+                                                   '~/.local/easybuild')
+            records += read_easybuild(path)
+    except PkgDbError as e:
+        sys.stderr.write("mpienv: Error: {}\n".format(e))
+        exit(1)
+    return records
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.spack is None and args.easybuild is None:
+        if not args.verify:
+            parser.print_usage(sys.stderr)
+            exit(1)
+        if len(mpienv.verify()) > 0:
+            exit(1)
+        return
+
+    records = _read(args)
+    if args.dry_run:
+        for rec in records:
+            print("{}-{} ({}) -> {}".format(rec['package'], rec['version'],
+                                            rec['compiler'], rec['prefix']))
+        return
+
+    imported = mpienv.import_mpis(records)
+    for name, rec in imported:
+        print("Imported {} -> {}".format(name, rec['prefix']))
+
+    if args.verify and len(imported) > 0:
+        if len(mpienv.verify([name for name, _ in imported])) > 0:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,8 @@ import pprint
 import sys
 
 from mpienv import mpienv
-from mpienv import UnknownMPI
 from mpienv import util
+from mpienv.core import UnknownMPI
 
 parser = argparse.ArgumentParser(
     prog='mpienv info',
@@ -15,8 +15,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument('--json', action="store_true", default=None)
 parser.add_argument('name', nargs='?', default=None)
 
-if __name__ == "__main__":
 
+def main():
     args = parser.parse_args()
 
     try:
@@ -35,3 +35,7 @@ if __name__ == "__main__":
         else:
             print(name)
             pprint.pprint(mpienv[name])
+
+
+if __name__ == "__main__":
+    main()
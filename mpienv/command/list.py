@@ -18,8 +18,9 @@ parser.add_argument('--simple', action="store_true", default=None,
 
 def _print_info(mpi, max_label_len):
     if mpi.is_broken:
-        print("   {:<{width}} -> *** broken ***".format(
+        print("   {:<{width}} -> *** {} ***".format(
             mpi.name,
+            "unresponsive" if mpi.is_unresponsive else "broken",
             width=max_label_len
         ))
     else:
@@ -31,7 +32,7 @@ def _print_info(mpi, max_label_len):
             width=max_label_len))
 
 
-if __name__ == '__main__':
+def main():
     args = parser.parse_args()
 
     if len(mpienv.keys()) == 0:
@@ -39,6 +40,9 @@ if __name__ == '__main__':
 
     max_label_len = max(len(name) for name in mpienv.keys())
 
+    if not args.simple:
+        mpienv.probe_all()
+
     lst = [info for name, info in mpienv.items()]
     lst.sort(key=lambda x: x.name)
     if args.json:
@@ -52,3 +56,7 @@ if __name__ == '__main__':
         for info in lst:
             _print_info(info, max_label_len)
         print("")
+
+
+if __name__ == "__main__":
+    main()
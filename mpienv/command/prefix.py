@@ -10,7 +10,8 @@ parser = argparse.ArgumentParser(
     description='Show installed directory of the specified environment.')
 parser.add_argument('name', nargs='?', default=None)
 
-if __name__ == "__main__":
+
+def main():
     args = parser.parse_args()
 
     name = args.name or mpienv.get_current_name()
@@ -22,3 +23,7 @@ if __name__ == "__main__":
 
     else:
         sys.stderr.write("Error: {} is not installed.\n".format(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,13 @@ parser.add_argument('-p', '--mpi4py', action="store_true",
 parser.add_argument('--no-mpi4py', action='store_true',
                     dest='no_mpi4py', default=False,
                     help="Do not activate mpi4py library")
+parser.add_argument('--default', action='store_true',
+                    dest='default', default=False,
+                    help="Also make the MPI the default for new shells")
+parser.add_argument('-v', '--verbose', action='store_true',
+                    dest='verbose', default=False,
+                    help="Report directories removed from PATH and "
+                         "LD_LIBRARY_PATH")
 parser.add_argument('name', type=str,
                     help="MPI name to use")
 
@@ -29,7 +36,8 @@ def main():
     if args.mpi4py:
         sys.stderr.write("mpienv: Info: --mpi4py is ON by default.\n")
 
-    mpienv.use(args.name, no_mpi4py=args.no_mpi4py)
+    mpienv.use(args.name, no_mpi4py=args.no_mpi4py, default=args.default,
+               verbose=args.verbose)
 
 
 if __name__ == "__main__":
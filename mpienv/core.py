@@ -1,14 +1,35 @@
 # coding: utf-8
 
 from configparser import ConfigParser
+import contextlib
 import json
 import os.path
 import re
 import sys
 
+from mpienv.cache import file_fingerprint
+from mpienv.cache import ProbeCache
 from mpienv.mpi import BrokenMPI
-from mpienv.mpi import get_mpi_class
+from mpienv.mpi import detect_mpi
+from mpienv.mpi import get_mpi_class_by_name
+from mpienv.mpi import get_mpi_type_by_class_name
+from mpienv.mpi import LazyMPI
+from mpienv.mpi import UnresponsiveMPI
+from mpienv.pathenv import mpi_dirs
 from mpienv.py import MPI4Py
+from mpienv.state import load_state
+from mpienv.state import save_state
+from mpienv.state import state_path
+from mpienv.store import file_lock
+from mpienv.store import read_ini
+from mpienv.store import write_ini
+from mpienv.util import ProbeTimeout
+from mpienv.view import current_name
+from mpienv.view import remove_view
+from mpienv.view import rename_view
+from mpienv.wrapper import bin_path as wrapper_bin_path
+from mpienv.wrapper import remove_wrappers
+from mpienv.wrapper import rename_wrappers
 
 try:
     exec("import __builtin__")  # To avoid IDE's grammar check
@@ -56,6 +77,40 @@ def mkdir_p(path):
 
 
 DefaultConf = {
+    # Seconds to wait for each probe command (such as `mpiexec --version`)
+    'probe_timeout': 30,
+    # Number of installations probed concurrently
+    'probe_jobs': 8,
+    # How `use` activates an MPI: 'env' rewrites PATH and LD_LIBRARY_PATH
+    # of the calling shell, 'view' switches $MPIENV_ROOT/current, and
+    # 'wrappers' uses launch wrappers that need no LD_LIBRARY_PATH
+    'activation': 'env',
+    # Commands to copy the scripts of `mpienv exec` to remote hosts
+    # ({src}, {host} and {dst} are replaced) and to run relays on them
+    # (null: scp and ssh in batch mode, see mpienv/fanout.py)
+    'copy_cmd': None,
+    'ssh_cmd': None,
+    # Number of concurrent copies, and the degree of the relay tree
+    # (0: the local host copies to all the hosts)
+    'fanout_jobs': 16,
+    'fanout_tree': 0,
+    # Share ssh connections to each host (needs OpenSSH >= 6.7)
+    'ssh_multiplex': True,
+    # How `mpienv exec` sets the environment of the ranks: 'native'
+    # forwards it by the options of mpiexec (-x, -genv), and 'script'
+    # runs the ranks through a script
+    'exec_mode': 'native',
+    # Maximum number of concurrent jobs of `mpienv exec --batch` (null:
+    # as many as the slots allow)
+    'batch_jobs': None,
+    # Directory of the scripts of `mpienv exec` ({uid} is replaced, null:
+    # /tmp/mpienv-{uid}), which must have the same path on all the hosts.
+    # Scripts are not copied if it is shared by the hosts
+    # (script_dir_shared, null: detected from the file system).
+    'script_dir': None,
+    'script_dir_shared': None,
+    # Scripts not used for this number of seconds are removed (0: never)
+    'script_max_age': 7 * 24 * 3600,
     'mpich': {
     },
     'mvapich': {
@@ -77,9 +132,18 @@ class Mpienv(object):
         self._pybuild_dir = os.path.join(self._vers_dir, 'pybuild', pybin_enc)
         self._cache_dir = os.path.join(root_dir, 'cache')
         self._build_dir = os.path.join(root_dir, 'builds')
-
-        self._make_directories()
-        self._setup_config()
+        self._txn_depth = 0
+
+        state = load_state(self.state_file_path(), self._state_sources())
+        if state is not None:
+            # Fast path: no directory creation and no ini parsing.
+            self._setup_config_from_state(state)
+            self._probe_cache = ProbeCache(self._cache_dir,
+                                           preload=state['probe'])
+        else:
+            self._make_directories()
+            self._setup_config()
+            self._probe_cache = ProbeCache(self._cache_dir)
 
         self._load_mpi_info()
 
@@ -90,6 +154,8 @@ class Mpienv(object):
         self._conf['pybuild_dir'] = self._pybuild_dir
         self._conf['cache_dir'] = self._cache_dir
         self._conf['build_dir'] = self._build_dir
+        # A stale state is not rewritten here: read-only commands may run
+        # on thousands of ranks at once. Mutating commands recompile it.
 
     def _make_directories(self):
         mkdir_p(self._root_dir)
@@ -101,22 +167,82 @@ class Mpienv(object):
         mkdir_p(self._build_dir)
 
     def _setup_config(self):
-        self.config2 = ConfigParser()
-
-        if os.path.exists(self.config_file_path()):
-            self.config2.read(self.config_file_path())
-
+        self.config2 = read_ini(self.config_file_path())
         self._load_config()
 
+    def _setup_config_from_state(self, state):
+        self.config2 = ConfigParser()
+        self.config2.read_dict(state['sections'])
+        self._apply_config(state['conf'])
+
+    def state_file_path(self):
+        return state_path(self._root_dir)
+
+    def _state_sources(self):
+        return [self.config_file_path(), self.config_json_path()]
+
+    def compile_state(self):
+        """Write the compiled state used by the fast path of __init__"""
+        defaults = self.config2.defaults()
+        sections = {'DEFAULT': dict(defaults)}
+        for name in self.config2.sections():
+            sections[name] = dict(
+                (k, self.config2.get(name, k, raw=True))
+                for k in self.config2.options(name)
+                if k not in defaults)
+
+        mpiexecs = [sections[name]['mpiexec'] for name in sections
+                    if 'mpiexec' in sections[name]]
+        save_state(self.state_file_path(), self._state_sources(),
+                   sections, self._conf_json,
+                   self._probe_cache.entries(mpiexecs))
+
     def root_dir(self):
         return self._root_dir
 
     def config_file_path(self):
         return os.path.join(self._root_dir, 'mpienv.ini')
 
+    def config_json_path(self):
+        return os.path.join(self._root_dir, 'config.json')
+
     def config_save(self):
-        with open(self.config_file_path(), 'w') as f:
-            self.config2.write(f)
+        if self._txn_depth > 0:
+            # Written when the outermost transaction commits
+            return
+        # Directories are created only by commands that modify the state
+        self._make_directories()
+        with file_lock(self.config_file_path() + '.lock'):
+            write_ini(self.config_file_path(), self.config2)
+        self.compile_state()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Modify mpienv.ini exclusively and atomically
+
+        The ini is re-read under the lock, so modifications must be
+        made inside the `with` block. Nested transactions are merged
+        into the outermost one, which is written once on exit.
+        """
+        if self._txn_depth > 0:
+            self._txn_depth += 1
+            try:
+                yield self.config2
+            finally:
+                self._txn_depth -= 1
+            return
+
+        self._make_directories()
+        with file_lock(self.config_file_path() + '.lock'):
+            self.config2 = read_ini(self.config_file_path())
+            self._load_mpi_info()
+            self._txn_depth = 1
+            try:
+                yield self.config2
+            finally:
+                self._txn_depth = 0
+            write_ini(self.config_file_path(), self.config2)
+        self.compile_state()
 
     def build_dir(self):
         return self._build_dir
@@ -139,35 +265,79 @@ class Mpienv(object):
 
         for name in self.config2:
             if name != 'DEFAULT':
-                mpiexec = self.config2[name]['mpiexec']
-                mpi = self.get_mpi_from_mpiexec(mpiexec)
-                mpi.name = name
-                self._installed[name] = mpi
+                self._add_handle(name)
+
+    def _add_handle(self, name):
+        # Installations are probed lazily, so commands that only
+        # need names and paths do not spawn any subprocesses.
+        mpiexec = self.config2[name]['mpiexec']
+        self._installed[name] = LazyMPI(name, mpiexec,
+                                        self.get_mpi_from_name)
+
+    def known_mpi_dirs(self):
+        """Return bin/lib directories of all the registered MPIs"""
+        dirs = []
+        for name, mpi in self._installed.items():
+            dirs += mpi_dirs(mpi.mpiexec)
+            dirs.append(wrapper_bin_path(self._root_dir, name))
+            # The probed library directory, if known without probing
+            info = self._probe_cache.get(mpi.mpiexec) or {}
+            if info.get('lib_dir'):
+                dirs.append(info['lib_dir'])
+        return dirs
 
     def _load_config(self):
-        conf_json = os.path.join(self._root_dir, "config.json")
+        conf_json = self.config_json_path()
         if os.path.exists(conf_json):
-            with open(conf_json) as f:
-                pass  # sys.stderr.write(f.read())
             with open(conf_json) as f:
                 conf = json.load(f)
         else:
             # sys.stderr.write("Warning: Cannot find config file\n")
             conf = {}
 
+        self._apply_config(conf)
+
+    def _apply_config(self, conf):
+        self._conf_json = conf
         self._conf = DefaultConf.copy()
         self._conf.update(conf)
 
+        if os.environ.get('MPIENV_PROBE_TIMEOUT'):
+            self._conf['probe_timeout'] = float(
+                os.environ['MPIENV_PROBE_TIMEOUT'])
+
     def config(self):
         return self._conf
 
+    def _get_cached_mpi(self, mpiexec, name=None):
+        info = self._probe_cache.get(mpiexec)
+        if info is None:
+            return None
+        try:
+            mpi_class = get_mpi_class_by_name(info['class'])
+        except KeyError:
+            return None
+        return mpi_class.from_probe_dict(mpiexec, info, self._conf, name)
+
+    def _construct_mpi(self, mpiexec, name=None):
+        mpi_class, probe = detect_mpi(self, mpiexec)
+        mpi = mpi_class(mpiexec, self._conf, name, probe=probe)
+        if not mpi.is_broken:
+            self._probe_cache.put(mpiexec, mpi.probe_files(),
+                                  mpi.to_probe_dict())
+        return mpi
+
     def get_mpi_from_mpiexec(self, mpiexec):
+        mpi = self._get_cached_mpi(mpiexec)
+        if mpi is not None:
+            return mpi
+
         try:
-            mpi_class = get_mpi_class(self, mpiexec)
+            return self._construct_mpi(mpiexec)
         except FileNotFoundError:
             return BrokenMPI(mpiexec, self._conf)
-
-        return mpi_class(mpiexec, self._conf)
+        except ProbeTimeout as e:
+            return UnresponsiveMPI(mpiexec, self._conf, reason=str(e))
 
     def prefix(self, name):
         return os.path.join(self._mpi_dir, name)
@@ -180,8 +350,42 @@ class Mpienv(object):
             exit(-1)
 
         mpiexec = self.config2[name]['mpiexec']
-        mpi_class = get_mpi_class(self, mpiexec)
-        return mpi_class(mpiexec, self._conf, name)
+        mpi = self._get_cached_mpi(mpiexec, name)
+        if mpi is not None:
+            return mpi
+
+        try:
+            return self._construct_mpi(mpiexec, name)
+        except FileNotFoundError:
+            return BrokenMPI(mpiexec, self._conf, name)
+        except ProbeTimeout as e:
+            return UnresponsiveMPI(mpiexec, self._conf, name, str(e))
+
+    def probe_all(self, names=None):
+        """Resolve registered MPIs concurrently.
+
+        Probes run in a bounded thread pool, so the wall time is roughly
+        that of the slowest probe rather than the sum of all of them.
+        """
+        if names is None:
+            names = list(self.keys())
+        handles = [self[name] for name in names]
+
+        jobs = min(int(self._conf.get('probe_jobs') or 1), len(handles))
+        if jobs <= 1:
+            for mpi in handles:
+                mpi.resolve()
+            return
+
+        # multiprocessing is imported here because it is slow to import
+        # and most commands do not need it.
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(jobs)
+        try:
+            pool.map(lambda mpi: mpi.resolve(), handles)
+        finally:
+            pool.close()
+            pool.join()
 
     def items(self):
         return self._installed.items()
@@ -190,11 +394,7 @@ class Mpienv(object):
         return self._installed.keys()
 
     def __getitem__(self, key):
-        try:
-            return next(mpi for name, mpi in self._installed.items()
-                        if name == key)
-        except StopIteration:
-            raise KeyError()
+        return self._installed[key]
 
     def __contains__(self, key):
         return key in self._installed
@@ -218,11 +418,25 @@ class Mpienv(object):
         return None
 
     def get_current_name(self):
+        # The MPI activated in the calling shell by `mpienv use`
+        name = os.environ.get('MPIENV_ACTIVE')
+        if name:
+            fingerprint = os.environ.get('MPIENV_ACTIVE_FINGERPRINT')
+            if (name not in self or
+                    fingerprint != file_fingerprint(self[name].mpiexec)):
+                sys.stderr.write("mpienv: Error: '{}' activated in this "
+                                 "shell is modified or removed. Please hit "
+                                 "'mpienv use' command to refresh the "
+                                 "status.\n".format(name))
+                exit(1)
+            return name
+
+        # Otherwise, the default MPI
         if 'DEFAULT' in self.config2 and 'active' in self.config2['DEFAULT']:
             name = self.config2['DEFAULT']['active']
 
             # Check
-            if not self.get_mpi_from_name(name).is_active:
+            if name not in self or not self[name].is_active:
                 sys.stderr.write("mpienv: Error: Internal status is "
                                  "inconsistent. Please hit 'mpienv use' "
                                  "command to refresh the status.\n")
@@ -231,6 +445,11 @@ class Mpienv(object):
         else:
             raise RuntimeError("No MPI is activated.")
 
+    def is_mpi4py_active(self):
+        if os.environ.get('MPIENV_ACTIVE'):
+            return os.environ.get('MPIENV_MPI4PY') == '1'
+        return self.config2.getboolean('DEFAULT', 'mpi4py', fallback=False)
+
     def add(self, target, name=None):
         # `target` is expected to be an mpiexec command or its prefix
         if os.path.isdir(target):
@@ -249,68 +468,208 @@ class Mpienv(object):
                              "seems to be broken.\n".format(target))
             exit(-1)
 
-        n = self.is_installed(target)
-        if n is not None:
-            sys.stderr.write("'{}' is already managed "
-                             "as '{}'\n".format(target, n))
-            raise AlreadyManagedMpi()
-
-        if self._installed.get(name) is not None:
-            sys.stderr.write("Specifed name '{}' is "
-                             "already taken\n".format(name))
-        elif name is None:
-            name = mpi.default_name
-            if name in self:
-                sys.stderr.write("Error: "
-                                 "Recommended name for {} is {}, "
-                                 "but the name is "
-                                 "already used. "
-                                 "Try -n option.\n".format(target, name))
-                exit(-1)
-
-        if name in self.config2:
-            sys.stderr.write("{} is already registered.\n".format(name))
-        else:
-            self.config2.add_section(name)
-            self.config2[name]['name'] = name
-            self.config2[name]['mpiexec'] = target
-            self.config_save()
+        with self.transaction():
+            n = self.is_installed(target)
+            if n is not None:
+                sys.stderr.write("'{}' is already managed "
+                                 "as '{}'\n".format(target, n))
+                raise AlreadyManagedMpi()
+
+            if self._installed.get(name) is not None:
+                sys.stderr.write("Specifed name '{}' is "
+                                 "already taken\n".format(name))
+            elif name is None:
+                name = mpi.default_name
+                if name in self:
+                    sys.stderr.write("Error: "
+                                     "Recommended name for {} is {}, "
+                                     "but the name is "
+                                     "already used. "
+                                     "Try -n option.\n".format(
+                                         target, name))
+                    exit(-1)
+
+            if name in self.config2:
+                sys.stderr.write("{} is already registered.\n".format(name))
+            else:
+                self.config2.add_section(name)
+                self.config2[name]['name'] = name
+                self.config2[name]['mpiexec'] = target
+                self._add_handle(name)
 
         return name
 
+    def _import_name(self, rec):
+        base = "{}-{}".format(rec['package'], rec['version'])
+        cands = [base]
+        if rec['compiler']:
+            base = "{}-{}".format(base, rec['compiler'])
+            cands.append(base)
+        for name in cands:
+            if name not in self.config2:
+                return name
+        i = 2
+        while "{}-{}".format(base, i) in self.config2:
+            i += 1
+        return "{}-{}".format(base, i)
+
+    def _imported_probe_dict(self, mpiexec, rec):
+        prefix = rec['prefix']
+        lib_dir = os.path.join(prefix, 'lib')
+        if not os.path.isdir(lib_dir) and os.path.isdir(lib_dir + '64'):
+            lib_dir += '64'
+        d = {
+            'class': rec['class'],
+            'prefix': prefix,
+            'mpicc': os.path.join(prefix, 'bin', 'mpicc'),
+            'inc_dir': os.path.join(prefix, 'include'),
+            'lib_dir': lib_dir,
+            '_type': get_mpi_type_by_class_name(rec['class']),
+            '_version': rec['version'],
+            '_conf_params': rec['variants'],
+            '_default_name': "{}-{}".format(rec['package'], rec['version']),
+        }
+        mpi_class = get_mpi_class_by_name(rec['class'])
+        mpi = mpi_class.from_probe_dict(mpiexec, d, self._conf)
+        info = mpi.to_probe_dict()
+        # Marks the result as not obtained by probing
+        info['imported'] = rec['source']
+        return mpi.probe_files(), info
+
+    def import_mpis(self, records):
+        """Register MPIs described by a package manager without probing
+
+        `records` are the ones read by mpienv.pkgdb. The probe cache is
+        filled from them, and they are not verified until `verify` is
+        called. Return the list of (name, record) imported.
+        """
+        imported = []
+        with self.transaction():
+            for rec in records:
+                mpiexec = os.path.join(rec['prefix'], 'bin', 'mpiexec')
+                if not os.path.exists(mpiexec):
+                    sys.stderr.write("mpienv: Warning: {} does not exist. "
+                                     "Skipped.\n".format(mpiexec))
+                    continue
+                n = self.is_installed(mpiexec)
+                if n is not None:
+                    sys.stderr.write("'{}' is already managed "
+                                     "as '{}'\n".format(mpiexec, n))
+                    continue
+
+                files, info = self._imported_probe_dict(mpiexec, rec)
+                self._probe_cache.put(mpiexec, files, info, save=False)
+
+                name = self._import_name(rec)
+                self.config2.add_section(name)
+                self.config2[name]['name'] = name
+                self.config2[name]['mpiexec'] = mpiexec
+                self._add_handle(name)
+                imported.append((name, rec))
+            self._probe_cache.save()
+        return imported
+
+    def verify(self, names=None):
+        """Probe MPIs whose probe results were imported
+
+        If `names` is None, all the MPIs not verified yet are probed.
+        Return the names of the MPIs found to be broken.
+        """
+        if names is None:
+            names = [name for name, mpi in self.items()
+                     if (self._probe_cache.get(mpi.mpiexec) or
+                         {}).get('imported')]
+
+        expected = {}
+        for name in names:
+            mpiexec = self[name].mpiexec
+            expected[name] = self._probe_cache.get(mpiexec) or {}
+            self._probe_cache.remove(mpiexec)
+            self._add_handle(name)
+
+        try:
+            self.probe_all(names)
+        except RuntimeError as e:
+            sys.stderr.write("mpienv: Error: {}\n".format(e))
+            exit(1)
+
+        broken = []
+        for name in names:
+            mpi = self[name].resolve()
+            if mpi.is_broken:
+                sys.stderr.write("mpienv: Warning: '{}' is broken\n".format(
+                    name))
+                broken.append(name)
+            elif (mpi.type_, mpi.version) != (expected[name].get('_type'),
+                                              expected[name].get('_version')):
+                sys.stderr.write("mpienv: Warning: '{}' is {} {}, but {} {} "
+                                 "is recorded by {}\n".format(
+                                     name, mpi.type_, mpi.version,
+                                     expected[name].get('_type'),
+                                     expected[name].get('_version'),
+                                     expected[name].get('imported')))
+
+        # The compiled state holds the probe results as well
+        self.compile_state()
+        return broken
+
     def rm(self, name, prompt=False):
-        mpi = self.get_mpi_from_name(name)
+        if name not in self:
+            sys.stderr.write("mpienv: Error: "
+                             "unknown MPI installation: "
+                             "'{}'\n".format(name))
+            exit(-1)
 
-        if not mpi.is_broken and mpi.is_active:
+        # A broken MPI is never active, so no need to probe it here.
+        if self[name].is_active or current_name(self._root_dir) == name:
             sys.stderr.write("You cannot remove active MPI: "
                              "'{}'\n".format(name))
             exit(-1)
 
+        # Do not hold the lock while waiting for the answer
         if (not prompt) or yes_no_input("Remove '{}' ?".format(name)):
-            self.config2.remove_section(name)
-            self.config_save()
+            with self.transaction():
+                if name in self.config2:
+                    self.config2.remove_section(name)
+                    del self._installed[name]
+            remove_view(self._root_dir, name)
+            remove_wrappers(self._root_dir, name)
 
         mpi4py = MPI4Py(self._conf, name)
         if mpi4py.is_installed():
             mpi4py.rm()
 
     def rename(self, name_from, name_to):
-        if name_from not in self.config2:
-            raise RuntimeError("No such MPI: '{}'".format(name_from))
-
-        if name_to in self.config2:
-            raise RuntimeError("Name '{}' already exists".format(name_to))
-
-        v = self.config2[name_from]
-        self.config2[name_to] = v
-        self.config2.remove_section(name_from)
-        self.config_save()
+        with self.transaction():
+            if name_from not in self.config2:
+                raise RuntimeError("No such MPI: '{}'".format(name_from))
+
+            if name_to in self.config2:
+                raise RuntimeError("Name '{}' already exists".format(
+                    name_to))
+
+            v = self.config2[name_from]
+            self.config2[name_to] = v
+            self.config2.remove_section(name_from)
+            default = self.config2['DEFAULT']
+            if default.get('active') == name_from:
+                # Keep the default, so that `mpienv restore` finds it
+                default['active'] = name_to
+
+            mpi = self._installed.pop(name_from)
+            mpi.name = name_to
+            self._installed[name_to] = mpi
 
         mpi4py = MPI4Py(self._conf, name_from)
         if mpi4py.is_installed():
             mpi4py.rename(name_to)
 
-    def use(self, name, no_mpi4py=False):
+        rename_view(self._root_dir, name_from, name_to,
+                    MPI4Py(self._conf, name_to).pylib_dir)
+        rename_wrappers(self._root_dir, name_from, name_to)
+
+    def use(self, name, no_mpi4py=False, default=False, verbose=False,
+            snapshot=False):
         mpi = self.get_mpi_from_name(name)
 
         if isinstance(mpi, BrokenMPI):
@@ -326,7 +685,8 @@ class Mpienv(object):
                              "".format(name))
             exit(-1)
 
-        mpi.use(name, no_mpi4py=no_mpi4py)
+        mpi.use(name, no_mpi4py=no_mpi4py, default=default, verbose=verbose,
+                snapshot=snapshot)
 
     def exec_(self, cmds, **kwargs):
         try:
@@ -336,6 +696,15 @@ class Mpienv(object):
         mpi = self.get_mpi_from_name(name)
         mpi.exec_(cmds, **kwargs)
 
+    def exec_batch(self, cmds, batch_file, **kwargs):
+        try:
+            name = self.get_current_name()
+        except RuntimeError:
+            sys.stderr.write("mpienv: Error: No MPI is currently activated.\n")
+            exit(1)
+        mpi = self.get_mpi_from_name(name)
+        mpi.exec_batch(cmds, batch_file, **kwargs)
+
     def restore(self):
         if 'DEFAULT' in self.config2:
             try:
@@ -346,13 +715,14 @@ class Mpienv(object):
                     mpi4py = True
             except KeyError:
                 return
-            self.use(mpi_name, mpi4py)
+            # Also rewrite the snapshot, which is stale if new shells
+            # fall back to `mpienv restore`
+            self.use(mpi_name, no_mpi4py=(not mpi4py), snapshot=True)
 
     def describe(self, name):
         mpi = self.get_mpi_from_name(name)
         mpi.describe()
 
 
-_root_dir = (os.environ.get("MPIENV_ROOT", None) or
-             os.path.join(os.path.expanduser('~'), '.mpienv'))
-mpienv = Mpienv(_root_dir)
+# The global Mpienv object, which is defined in the package
+from mpienv import mpienv  # NOQA
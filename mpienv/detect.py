@@ -0,0 +1,161 @@
+# coding: utf-8
+"""Detect the flavor of an MPI installation without running anything
+
+The flavor is identified from the ELF metadata of mpiexec and libmpi
+(DT_NEEDED, SONAME and version strings in .rodata/.comment) and from
+mpi.h under the prefix.
+"""
+import glob
+import os.path
+import re
+
+from mpienv.elf import ElfError
+from mpienv.elf import ElfFile
+from mpienv.header import scan_mpi_h
+
+# Flavors of the MPICH family share Hydra and the MPICH ABI
+MPICH_FAMILY = ['MPICH', 'MVAPICH', 'Intel MPI']
+
+# Strings found in binaries, in order of precedence
+_markers = [
+    (b'MVAPICH2', 'MVAPICH'),
+    (b'Intel(R) MPI Library', 'Intel MPI'),
+    (b'OpenRTE', 'Open MPI'),
+    (b'Open MPI', 'Open MPI'),
+    (b'HYDRA build details', 'MPICH'),
+    (b'MPICH', 'MPICH'),
+]
+
+# Libraries only Open MPI's launchers depend on
+_ompi_needed_re = re.compile(r'^lib(open-rte|open-pal|prrte)\b')
+
+_soname_flavors = {
+    'libmpi.so.12': 'MPICH',  # MPICH ABI compatibility initiative
+    'libmpi.so.20': 'Open MPI',  # Open MPI 2.x
+    'libmpi.so.40': 'Open MPI',  # Open MPI 3.x and 4.x
+}
+
+
+class StaticInfo(object):
+    """Result of the static detection"""
+
+    def __init__(self, flavor, version, evidence, header=None,
+                 lib_dir=None):
+        self.flavor = flavor
+        self.version = version
+        # List of (file, flavor) that the decision is based on
+        self.evidence = evidence
+        # MpiHeader of mpi.h and the directory of libmpi, if found
+        self.header = header
+        self.lib_dir = lib_dir
+
+    def __repr__(self):
+        return "StaticInfo({!r}, {!r})".format(self.flavor, self.version)
+
+
+def _family(flavor):
+    return 'MPICH' if flavor in MPICH_FAMILY else flavor
+
+
+def _scan_markers(elf):
+    for sect in ['.rodata', '.comment']:
+        data = elf.section(sect)
+        if not data:
+            continue
+        for marker, flavor in _markers:
+            if data.find(marker) >= 0:
+                return flavor
+    return None
+
+
+def _inspect_elf(path, is_lib):
+    """Return the flavor suggested by an ELF file, or None"""
+    try:
+        with ElfFile(path) as elf:
+            if not is_lib and any(_ompi_needed_re.match(n)
+                                  for n in elf.needed):
+                return 'Open MPI'
+            flavor = _scan_markers(elf)
+            if flavor is None and is_lib:
+                flavor = _soname_flavors.get(elf.soname)
+            return flavor
+    except (ElfError, IOError, OSError):
+        return None
+
+
+def _find_libmpi(prefix):
+    for lib_dir in ['lib', 'lib64']:
+        libs = sorted(glob.glob(os.path.join(prefix, lib_dir, 'libmpi.so*')))
+        for lib in libs:
+            # libmpi.so may be a linker script
+            if os.path.isfile(lib) and not os.path.islink(lib):
+                return lib
+        if len(libs) > 0:
+            return os.path.realpath(libs[0])
+    return None
+
+
+def detect_static(mpiexec):
+    """Detect the flavor and version of the MPI of `mpiexec`
+
+    Returns StaticInfo, or None if the evidence is missing or
+    contradicting. In that case, the caller should fall back to running
+    `mpiexec --version`.
+    """
+    real = os.path.realpath(mpiexec)
+    prefixes = []
+    for ex in [mpiexec, real]:
+        prefix = os.path.dirname(os.path.dirname(os.path.abspath(ex)))
+        if prefix not in prefixes:
+            prefixes.append(prefix)
+
+    evidence = []
+
+    flavor = _inspect_elf(real, is_lib=False)
+    if flavor is not None:
+        evidence.append((real, flavor))
+
+    header = None
+    lib_dir = None
+    for prefix in prefixes:
+        lib = _find_libmpi(prefix)
+        if lib is not None:
+            if lib_dir is None:
+                lib_dir = os.path.dirname(lib)
+            flavor = _inspect_elf(lib, is_lib=True)
+            if flavor is not None:
+                evidence.append((lib, flavor))
+
+        mpi_h = os.path.join(prefix, 'include', 'mpi.h')
+        if header is None and os.path.isfile(mpi_h):
+            try:
+                header = scan_mpi_h(mpi_h)
+            except (IOError, OSError):
+                header = None
+            if header is not None and header.flavor is not None:
+                evidence.append((mpi_h, header.flavor))
+
+    if len(evidence) == 0:
+        return None
+
+    families = set(_family(f) for _, f in evidence)
+    if len(families) != 1:
+        # Contradicting evidence (e.g. mpiexec and mpi.h of different
+        # MPIs installed in the same prefix)
+        return None
+
+    flavors = set(f for _, f in evidence)
+    # MVAPICH and Intel MPI are built on MPICH, so the more specific
+    # flavor wins.
+    for f in ['MVAPICH', 'Intel MPI', 'MPICH', 'Open MPI']:
+        if f in flavors:
+            flavor = f
+            break
+
+    version = None
+    if header is not None and header.flavor == flavor:
+        version = header.version
+    if header is not None and header.flavor is None:
+        header = None
+
+    return StaticInfo(flavor, version, evidence, header, lib_dir)
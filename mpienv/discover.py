@@ -0,0 +1,428 @@
+# coding: utf-8
+"""Parallel filesystem walker used by `mpienv autodiscover`
+
+Subtrees are scanned by a pool of threads with scandir, and prefixes
+whose `bin` directory contains mpiexec are streamed to the caller as
+soon as they are found. Trees that never contain MPI installations
+(VCS metadata, Python packages, caches, ...) are pruned, and network
+mounts below the search roots are skipped by default.
+"""
+import glob
+import json
+import os
+import os.path
+import re
+import threading
+import time
+
+from mpienv.cache import write_atomic
+from mpienv.ldcache import read_ld_cache
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # NOQA
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+# Directories never descended into
+PRUNE = set([
+    '.cache',
+    '.git',
+    '.hg',
+    '.svn',
+    '__pycache__',
+    'dist-packages',
+    'node_modules',
+    'site-packages',
+])
+
+NETWORK_FS = set([
+    '9p',
+    'afs',
+    'beegfs',
+    'ceph',
+    'cifs',
+    'fuse.sshfs',
+    'glusterfs',
+    'gpfs',
+    'lustre',
+    'ncpfs',
+    'nfs',
+    'nfs4',
+    'panfs',
+    'smb3',
+    'smbfs',
+])
+
+# Layouts of MPIs installed by distributions, vendors and package
+# managers, checked by the quick discovery. '~' and environment
+# variables are expanded.
+WELL_KNOWN_PREFIXES = [
+    # Distributions
+    '/usr/lib/*/openmpi',
+    '/usr/lib/*/mpich',
+    '/usr/lib64/openmpi*',
+    '/usr/lib64/mpich*',
+    '/usr/lib64/mvapich2*',
+    '/usr/mpi/*/*',
+    # Vendors and manual installations
+    '/opt/*',
+    '/opt/*/mpi',
+    '/opt/*/mpi/*',
+    '/opt/intel/oneapi/mpi/*',
+    '/opt/intel/*/linux/mpi/intel64',
+    '/usr/local/*',
+    '~/local',
+    '~/opt/*',
+    # Homebrew and MacPorts
+    '/usr/local/opt/*',
+    '/opt/homebrew/opt/*',
+    '/opt/local',
+    # Spack
+    '$SPACK_ROOT/opt/spack/*/*',
+    '$SPACK_ROOT/opt/spack/*/*/*',
+    '~/spack/opt/spack/*/*',
+    '~/spack/opt/spack/*/*/*',
+    # EasyBuild and software trees of environment modules
+    '$EASYBUILD_PREFIX/software/*/*',
+    '~/.local/easybuild/software/*/*',
+    '/opt/apps/*/*',
+    '/apps/*/*',
+    '/sw/*/*',
+]
+
+_libmpi_re = re.compile(r'^lib(mpi|mpich)\.so')
+
+_DONE = object()
+
+
+class _Entry(object):
+    """Minimal substitute of os.DirEntry for Python < 3.5"""
+
+    def __init__(self, dir_path, name):
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and os.path.islink(self.path):
+            return False
+        return os.path.isdir(self.path)
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self.path) if follow_symlinks else os.lstat(self.path)
+
+
+def _scandir(path):
+    if scandir is not None:
+        return list(scandir(path))
+    return [_Entry(path, name) for name in os.listdir(path)]
+
+
+def _unescape(s):
+    # /proc/mounts escapes spaces etc. as octal (e.g. '\040')
+    return s.encode('latin-1').decode('unicode_escape')
+
+
+def network_mounts(mounts='/proc/mounts'):
+    """Return the set of mount points of network file systems"""
+    points = set()
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] in NETWORK_FS:
+                    points.add(_unescape(fields[1]))
+    except (IOError, OSError):
+        pass
+    return points
+
+
+def mount_type(path, mounts='/proc/mounts'):
+    """Return the type of the file system `path` is on, or None"""
+    path = os.path.join(os.path.realpath(path), '')
+    best, fs_type = '', None
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                point = os.path.join(_unescape(fields[1]), '')
+                # The last one wins if mounted on the same point
+                if path.startswith(point) and len(point) >= len(best):
+                    best, fs_type = point, fields[2]
+    except (IOError, OSError):
+        pass
+    return fs_type
+
+
+def _is_pruned(entry):
+    if entry.name in PRUNE:
+        return True
+    # Package caches of conda
+    if entry.name == 'pkgs' and os.path.exists(
+            os.path.join(entry.path, 'urls.txt')):
+        return True
+    return False
+
+
+def _has_mpiexec(bin_dir):
+    try:
+        return any('mpiexec' in e.name for e in _scandir(bin_dir))
+    except OSError:
+        return False
+
+
+def _mtime(st):
+    return getattr(st, 'st_mtime_ns', st.st_mtime)
+
+
+class DiscoverIndex(object):
+    """Persistent index of the directories scanned by `walk`
+
+    For each directory, the index records its mtime, the subdirectories
+    to descend into, and whether its bin/ has mpiexec (with the mtime of
+    bin/). The mtime of a directory changes only when entries are added
+    to or removed from it, so a directory with an unchanged mtime is
+    not scanned again. Its subdirectories are still checked one by one.
+    """
+    FORMAT = 1
+
+    def __init__(self, cache_dir):
+        self._path = os.path.join(cache_dir, 'discover.json')
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._visited = {}
+        self._racy_after = time.time() - 2
+
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+            if data.get('format') == self.FORMAT:
+                self._entries = data['dirs']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def clear(self):
+        self._entries = {}
+
+    def get(self, path, mtime):
+        ent = self._entries.get(path)
+        if ent is None or ent['mtime'] != mtime:
+            return None
+        return ent
+
+    def is_racy(self, st):
+        return st.st_mtime >= self._racy_after
+
+    def put(self, path, st, subdirs, bin_mtime, hit):
+        ent = {
+            'mtime': _mtime(st),
+            'subdirs': subdirs,
+            'bin_mtime': bin_mtime,
+            'hit': hit,
+        }
+        with self._lock:
+            self._visited[path] = ent
+
+    def save(self, roots):
+        """Replace the entries under `roots` with the ones visited"""
+        roots = [os.path.join(os.path.abspath(r), '') for r in roots]
+        with self._lock:
+            dirs = dict((p, e) for p, e in self._entries.items()
+                        if not any(os.path.join(p, '').startswith(r)
+                                   for r in roots))
+            dirs.update(self._visited)
+        data = {'format': self.FORMAT, 'dirs': dirs}
+        try:
+            dir_name = os.path.dirname(self._path)
+            if not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+            write_atomic(self._path, json.dumps(data))
+        except (IOError, OSError):
+            # The index is just an optimization.
+            pass
+
+
+def _scan(path, st, index):
+    """Return (subdirs, has_mpiexec) of directory `path`"""
+    bin_dir = os.path.join(path, 'bin')
+    bin_st = None
+    ent = index.get(path, _mtime(st)) if index is not None else None
+    if ent is not None:
+        subdirs = ent['subdirs']
+        bin_mtime = ent['bin_mtime']
+        hit = ent['hit']
+        if bin_mtime is not None:
+            try:
+                bin_st = os.stat(bin_dir)
+                cur = _mtime(bin_st)
+            except OSError:
+                cur = None
+            if cur != bin_mtime:
+                bin_mtime = cur
+                hit = cur is not None and _has_mpiexec(bin_dir)
+    else:
+        subdirs = []
+        bin_mtime = None
+        hit = False
+        for e in _scandir(path):
+            try:
+                if e.name == 'bin':
+                    if e.is_dir():
+                        bin_st = e.stat()
+                        bin_mtime = _mtime(bin_st)
+                        hit = _has_mpiexec(e.path)
+                elif e.is_dir(follow_symlinks=False) and not _is_pruned(e):
+                    subdirs.append(e.name)
+            except OSError:
+                continue
+
+    # Directories modified just now are not recorded, because another
+    # modification within the same mtime tick would be missed.
+    if index is not None and not (
+            index.is_racy(st) or (bin_st is not None and
+                                  index.is_racy(bin_st))):
+        index.put(path, st, subdirs, bin_mtime, hit)
+    return subdirs, hit
+
+
+def _path_prefixes(env):
+    for d in env.get('PATH', '').split(':'):
+        if d == '' or not _has_mpiexec(d):
+            continue
+        yield os.path.dirname(d)
+        # mpiexec in PATH may be a symlink to another installation
+        for mpiexec in glob.glob(os.path.join(d, '*mpiexec*')):
+            yield os.path.dirname(os.path.dirname(os.path.realpath(mpiexec)))
+
+
+def _ld_cache_prefixes():
+    for name, path in read_ld_cache():
+        if _libmpi_re.match(name):
+            lib_dir = os.path.dirname(path)
+            yield os.path.dirname(lib_dir)
+            yield os.path.dirname(os.path.realpath(lib_dir))
+
+
+def _well_known_prefixes(env):
+    for pat in WELL_KNOWN_PREFIXES:
+        if pat.startswith('$'):
+            var, _, rest = pat[1:].partition('/')
+            if not env.get(var):
+                continue
+            pat = os.path.join(env[var], rest)
+        for prefix in sorted(glob.glob(os.path.expanduser(pat))):
+            yield prefix
+
+    # EasyBuild modules set $EBROOT<NAME> to the installation prefix
+    for var in sorted(env):
+        if var.startswith('EBROOT'):
+            yield env[var]
+
+
+def quick_prefixes(env=None):
+    """Return prefixes with bin/*mpiexec* found without walking
+
+    PATH, the library directories of libmpi in ld.so.cache and the
+    well-known layouts are checked.
+    """
+    if env is None:
+        env = os.environ
+
+    prefixes = []
+    seen = set()
+    for gen in [_path_prefixes(env), _ld_cache_prefixes(),
+                _well_known_prefixes(env)]:
+        for prefix in gen:
+            # e.g. /bin and /usr/bin are the same on merged-/usr systems
+            bin_dir = os.path.realpath(os.path.join(prefix, 'bin'))
+            if bin_dir in seen:
+                continue
+            seen.add(bin_dir)
+            if _has_mpiexec(bin_dir):
+                prefixes.append(os.path.normpath(prefix))
+    return prefixes
+
+
+def walk(roots, max_depth=None, one_fs=False, skip_network=True, jobs=8,
+         index=None):
+    """Generate prefixes under `roots` that have bin/*mpiexec*
+
+    `max_depth` limits the depth of directories scanned below each
+    root. If `one_fs` is True, other file systems are not crossed.
+    Network mounts below the roots are skipped if `skip_network`.
+    If `index` (a DiscoverIndex) is given, directories unchanged since
+    the last walk are not scanned again.
+    """
+    roots = [os.path.abspath(r) for r in roots]
+    tasks = queue.Queue()
+    results = queue.Queue()
+    skip = network_mounts() if skip_network else set()
+    stop = threading.Event()
+
+    def visit(path, depth, dev):
+        try:
+            st = os.stat(path)
+            if one_fs and st.st_dev != dev:
+                return
+            subdirs, hit = _scan(path, st, index)
+        except OSError:
+            return
+
+        if hit:
+            results.put(path)
+        if max_depth is not None and depth >= max_depth:
+            return
+        for name in subdirs:
+            if stop.is_set():
+                return
+            sub = os.path.join(path, name)
+            if sub not in skip:
+                tasks.put((sub, depth + 1, dev))
+
+    def worker():
+        while True:
+            item = tasks.get()
+            try:
+                if item is None:
+                    return
+                if not stop.is_set():
+                    visit(*item)
+            finally:
+                tasks.task_done()
+
+    def monitor():
+        tasks.join()
+        results.put(_DONE)
+
+    for root in roots:
+        try:
+            tasks.put((root, 0, os.stat(root).st_dev))
+        except OSError:
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(max(jobs, 1))]
+    threads.append(threading.Thread(target=monitor))
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    completed = False
+    try:
+        while True:
+            prefix = results.get()
+            if prefix is _DONE:
+                completed = True
+                break
+            yield prefix
+    finally:
+        stop.set()
+        for _ in range(len(threads) - 1):
+            tasks.put(None)
+        if completed and index is not None:
+            index.save(roots)
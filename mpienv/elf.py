@@ -0,0 +1,172 @@
+# coding: utf-8
+"""A minimal pure-Python ELF reader
+
+Only the features mpienv needs are implemented: section lookup and the
+SONAME, NEEDED, RPATH and RUNPATH entries of the dynamic section.
+"""
+import mmap
+import struct
+
+ELF_MAGIC = b'\x7fELF'
+
+# Section types
+SHT_NOBITS = 8
+SHT_DYNAMIC = 6
+
+# Dynamic tags
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+
+class ElfError(Exception):
+    pass
+
+
+def is_elf(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) == ELF_MAGIC
+    except (IOError, OSError):
+        return False
+
+
+class ElfFile(object):
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as f:
+            try:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ElfError("{} is empty".format(path))
+
+        try:
+            self._parse_header()
+        except (struct.error, IndexError):
+            self.close()
+            raise ElfError("{} is a broken ELF file".format(path))
+        except ElfError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._buf is not None:
+            self._buf.close()
+            self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _parse_header(self):
+        buf = self._buf
+        if buf[:4] != ELF_MAGIC:
+            raise ElfError("{} is not an ELF file".format(self._path))
+
+        ei_class = ord(buf[4:5])
+        ei_data = ord(buf[5:6])
+        if ei_class not in (1, 2) or ei_data not in (1, 2):
+            raise ElfError("{}: unknown ELF class".format(self._path))
+
+        self._is64 = (ei_class == 2)
+        self._endian = '<' if ei_data == 1 else '>'
+
+        if self._is64:
+            hdr = struct.unpack_from(self._endian + 'HHIQQQIHHHHHH', buf, 16)
+            self._sh_fmt = self._endian + 'IIQQQQIIQQ'
+            self._dyn_fmt = self._endian + 'qQ'
+        else:
+            hdr = struct.unpack_from(self._endian + 'HHIIIIIHHHHHH', buf, 16)
+            self._sh_fmt = self._endian + 'IIIIIIIIII'
+            self._dyn_fmt = self._endian + 'iI'
+
+        shoff, shentsize, shnum, shstrndx = hdr[5], hdr[10], hdr[11], hdr[12]
+
+        self._sections = []
+        for i in range(shnum):
+            sh = struct.unpack_from(self._sh_fmt, buf, shoff + i * shentsize)
+            # name, type, offset, size, link
+            self._sections.append([sh[0], sh[1], sh[4], sh[5], sh[6]])
+
+        if shnum > 0 and shstrndx < shnum:
+            strtab = self._section_data(self._sections[shstrndx])
+            for sect in self._sections:
+                sect[0] = _cstring(strtab, sect[0])
+        else:
+            for sect in self._sections:
+                sect[0] = ''
+
+    def _section_data(self, sect):
+        _, sh_type, offset, size, _ = sect
+        if sh_type == SHT_NOBITS:
+            return b''
+        return self._buf[offset:offset + size]
+
+    @property
+    def section_names(self):
+        return [s[0] for s in self._sections]
+
+    def section(self, name):
+        """Return the contents of section `name`, or None"""
+        for sect in self._sections:
+            if sect[0] == name:
+                return self._section_data(sect)
+        return None
+
+    def _dynamic_values(self, tag):
+        """Return string values of `tag` in the dynamic section"""
+        for sect in self._sections:
+            if sect[1] != SHT_DYNAMIC or sect[4] >= len(self._sections):
+                continue
+            data = self._section_data(sect)
+            strtab = self._section_data(self._sections[sect[4]])
+            size = struct.calcsize(self._dyn_fmt)
+            values = []
+            for off in range(0, len(data) - size + 1, size):
+                t, val = struct.unpack_from(self._dyn_fmt, data, off)
+                if t == DT_NULL:
+                    break
+                if t == tag:
+                    values.append(_cstring(strtab, val))
+            return values
+        return []
+
+    @property
+    def interp(self):
+        """Path of the program interpreter (the dynamic loader), or None"""
+        data = self.section('.interp')
+        if not data:
+            return None
+        return _cstring(data, 0)
+
+    @property
+    def soname(self):
+        names = self._dynamic_values(DT_SONAME)
+        return names[0] if names else None
+
+    @property
+    def needed(self):
+        return self._dynamic_values(DT_NEEDED)
+
+    @property
+    def rpath(self):
+        return _split_paths(self._dynamic_values(DT_RPATH))
+
+    @property
+    def runpath(self):
+        return _split_paths(self._dynamic_values(DT_RUNPATH))
+
+
+def _cstring(buf, offset):
+    end = buf.find(b'\0', offset)
+    if end < 0:
+        end = len(buf)
+    return buf[offset:end].decode('utf-8', 'replace')
+
+
+def _split_paths(values):
+    return [p for v in values for p in v.split(':') if p != '']
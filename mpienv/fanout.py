@@ -0,0 +1,237 @@
+# coding: utf-8
+"""Distribution of a file to remote hosts for `mpienv exec`
+
+The file is copied to the hosts by a bounded number of concurrent copy
+commands. With a tree degree `k` >= 2, the local host copies the file
+to the first `k` hosts only, and each host that has received the file
+relays it to its `k` children (through `ssh <parent> <copy command>`),
+so the number of copies started by the local host does not grow with
+the number of hosts. A host whose parent failed is served directly.
+
+ssh and scp share one connection per host through OpenSSH's connection
+multiplexing (ControlMaster), so the relays and later sessions to the
+same host skip the handshake.
+
+If `skip_existing` is set, each host is first asked (over ssh) whether
+it already has the file with the same size, and the copy is skipped if
+so. The directory of the file is created on the host by the same query.
+"""
+import os
+import os.path
+import shlex
+import subprocess
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # NOQA
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote  # NOQA
+
+DEFAULT_COPY_CMD = 'scp -q -o BatchMode=yes {src} {host}:{dst}'
+DEFAULT_SSH_CMD = 'ssh -o BatchMode=yes'
+
+_LOCAL_HOSTS = ['localhost', '127.0.0.1']
+
+# Commands that accept the multiplexing options of OpenSSH
+_SSH_COMMANDS = ['scp', 'sftp', 'ssh']
+
+
+class CopyResult(object):
+    """Result of the copy to a host"""
+
+    def __init__(self, host, via, seconds, returncode, error,
+                 skipped=False):
+        self.host = host
+        self.via = via  # The host the file was copied from, or None
+        self.seconds = seconds
+        self.returncode = returncode
+        self.error = error
+        self.skipped = skipped  # The host already had the file
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+def remote_hosts(hosts):
+    """Return `hosts` except the local host, without duplicates"""
+    local = _LOCAL_HOSTS + [os.uname()[1]]
+    result = []
+    for host in hosts:
+        if host not in local and host not in result:
+            result.append(host)
+    return result
+
+
+def multiplex_options(control_path, persist=60):
+    return ['-o', 'ControlMaster=auto',
+            '-o', 'ControlPath={}'.format(control_path),
+            '-o', 'ControlPersist={}'.format(persist)]
+
+
+def _with_options(args, options):
+    if len(options) > 0 and os.path.basename(args[0]) in _SSH_COMMANDS:
+        return args[:1] + options + args[1:]
+    return args
+
+
+def _format(template, **kwargs):
+    return [a.format(**kwargs) for a in shlex.split(template)]
+
+
+def _join(args):
+    return ' '.join(quote(a) for a in args)
+
+
+def _sh(script):
+    # The login shell of a remote host may not be a POSIX shell
+    return 'sh -c ' + quote(script)
+
+
+def _run(args):
+    """Return (returncode, stdout, error message) of `args`"""
+    try:
+        with open(os.devnull) as devnull:
+            p = subprocess.Popen(args, stdin=devnull,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            out, err = p.communicate()
+    except OSError as e:
+        return -1, '', str(e)
+    out = out.decode('utf-8', 'replace').strip()
+    err = err.decode('utf-8', 'replace').strip()
+    return p.returncode, out, err or out
+
+
+class _Fanout(object):
+    def __init__(self, src, dst, hosts, copy_cmd, ssh_cmd, tree,
+                 options, skip_existing):
+        self._src = src
+        self._dst = dst
+        self._hosts = hosts
+        self._copy_cmd = copy_cmd
+        self._ssh_cmd = ssh_cmd
+        self._tree = tree
+        self._options = options
+        self._size = os.path.getsize(src) if skip_existing else None
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self.results = {}
+
+    def _children(self, index):
+        # Index 0 is the local host, and host i (1-origin) has
+        # children k*i+1, ..., k*i+k as in a k-ary heap.
+        k = self._tree
+        first = index * k + 1
+        return range(first, min(first + k, len(self._hosts) + 1))
+
+    def _ssh(self, host, script):
+        ssh = _with_options(shlex.split(self._ssh_cmd), self._options)
+        return ssh + [host, _sh(script)]
+
+    def _check_script(self):
+        # Prints 'present' if the host has the file of the same size
+        return ('d={}; p={}; '
+                'if [ -d "$d" ] && [ ! -O "$d" ]; then '
+                'echo "$d is owned by another user" >&2; exit 1; fi; '
+                'mkdir -p "$d" || exit 1; '
+                'if [ -f "$p" ] && [ "$(wc -c < "$p")" -eq {} ]; then '
+                'echo present; else echo absent; fi').format(
+                    quote(os.path.dirname(self._dst) or '.'),
+                    quote(self._dst), self._size)
+
+    def _relay_script(self, host):
+        # Run on the parent, which has the file at `dst`
+        copy = _join(_format(self._copy_cmd, src=self._dst, host=host,
+                             dst=self._dst))
+        if self._size is None:
+            return copy
+        check = _join(shlex.split(self._ssh_cmd) +
+                      [host, _sh(self._check_script())])
+        return ('r=$({}) || exit 1; if [ "$r" = present ]; then '
+                'echo present; else {}; fi'.format(check, copy))
+
+    def _copy(self, index, via):
+        host = self._hosts[index - 1]
+        start = time.time()
+        if via is not None:
+            returncode, out, error = _run(
+                self._ssh(via, self._relay_script(host)))
+        else:
+            returncode, out, error = 0, '', ''
+            if self._size is not None:
+                returncode, out, error = _run(
+                    self._ssh(host, self._check_script()))
+            if returncode == 0 and out != 'present':
+                copy = _format(self._copy_cmd, src=self._src, host=host,
+                               dst=self._dst)
+                returncode, out, error = _run(
+                    _with_options(copy, self._options))
+        result = CopyResult(host, via, time.time() - start, returncode,
+                            error, returncode == 0 and out == 'present')
+        with self._lock:
+            self.results[host] = result
+
+        if self._tree >= 2:
+            # Children of a failed host are served directly
+            parent = host if result.ok else None
+            for child in self._children(index):
+                self._tasks.put((child, parent))
+
+    def _worker(self):
+        while True:
+            item = self._tasks.get()
+            try:
+                if item is None:
+                    return
+                self._copy(*item)
+            finally:
+                self._tasks.task_done()
+
+    def run(self, jobs):
+        if self._tree >= 2:
+            first = self._children(0)
+        else:
+            first = range(1, len(self._hosts) + 1)
+        for index in first:
+            self._tasks.put((index, None))
+
+        threads = [threading.Thread(target=self._worker)
+                   for _ in range(max(min(jobs, len(self._hosts)), 1))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        self._tasks.join()
+        for _ in threads:
+            self._tasks.put(None)
+        return [self.results[h] for h in self._hosts]
+
+
+def distribute(src, hosts, dst=None, copy_cmd=None, ssh_cmd=None, jobs=16,
+               tree=0, control_path=None, skip_existing=False):
+    """Copy `src` to `dst` (default: the same path) on `hosts`
+
+    `copy_cmd` is a template of the copy command with {src}, {host} and
+    {dst}, and `ssh_cmd` is the command to run the relays in a tree of
+    degree `tree`. If `control_path` is given, ssh connections are
+    multiplexed through it. If `skip_existing`, hosts that already have
+    `dst` of the same size are skipped. Return the list of CopyResult of
+    the remote hosts in `hosts`.
+    """
+    hosts = remote_hosts(hosts)
+    if len(hosts) == 0:
+        return []
+
+    options = []
+    if control_path is not None:
+        options = multiplex_options(control_path)
+    fanout = _Fanout(src, dst or src, hosts, copy_cmd or DEFAULT_COPY_CMD,
+                     ssh_cmd or DEFAULT_SSH_CMD, tree, options,
+                     skip_existing)
+    return fanout.run(jobs)
@@ -0,0 +1,126 @@
+# coding: utf-8
+import mmap
+import re
+
+import mpienv.util as util
+
+# Version macros we are interested in
+MACROS = [
+    'MVAPICH2_VERSION',
+    'MPICH_VERSION',
+    'OMPI_MAJOR_VERSION',
+    'OMPI_MINOR_VERSION',
+    'OMPI_RELEASE_VERSION',
+    'I_MPI_VERSION',
+    'MPI_VERSION',
+    'MPI_SUBVERSION',
+]
+
+_define_re = re.compile(
+    br'^[ \t]*#[ \t]*define[ \t]+(' +
+    br'|'.join(m.encode('ascii') for m in MACROS) +
+    br')[ \t]+([^\r\n]*)$', re.MULTILINE)
+
+
+def _parse_value(val):
+    """Strip comments, quotes and parentheses from a macro value"""
+    val = re.sub(r'/\*.*?\*/', '', val)
+    val = re.sub(r'//.*$', '', val)
+    val = val.strip()
+    while val.startswith('(') and val.endswith(')'):
+        val = val[1:-1].strip()
+    if len(val) >= 2 and val.startswith('"') and val.endswith('"'):
+        val = val[1:-1]
+    return val
+
+
+class MpiHeader(object):
+    """Version macros defined in an mpi.h file"""
+
+    def __init__(self, path, macros):
+        self._path = path
+        self._macros = macros
+
+    @property
+    def path(self):
+        return self._path
+
+    def get(self, name, default=None):
+        return self._macros.get(name, default)
+
+    def __contains__(self, name):
+        return name in self._macros
+
+    def __getitem__(self, name):
+        return self._macros[name]
+
+    def to_dict(self):
+        return dict(self._macros)
+
+    @property
+    def flavor(self):
+        """MPI implementation the header belongs to, or None if unknown"""
+        # MVAPICH and Intel MPI are derived from MPICH and define
+        # MPICH_VERSION too, so they must be checked first.
+        if 'MVAPICH2_VERSION' in self:
+            return 'MVAPICH'
+        if 'I_MPI_VERSION' in self:
+            return 'Intel MPI'
+        if 'MPICH_VERSION' in self:
+            return 'MPICH'
+        if 'OMPI_MAJOR_VERSION' in self:
+            return 'Open MPI'
+        return None
+
+    @property
+    def version(self):
+        """Version of the MPI implementation, or None if unknown"""
+        flavor = self.flavor
+        if flavor == 'MVAPICH':
+            return self.get('MVAPICH2_VERSION')
+        if flavor == 'Intel MPI':
+            return self.get('I_MPI_VERSION')
+        if flavor == 'MPICH':
+            return self.get('MPICH_VERSION')
+        if flavor == 'Open MPI':
+            return '.'.join(self.get(m, '0') for m in
+                            ['OMPI_MAJOR_VERSION',
+                             'OMPI_MINOR_VERSION',
+                             'OMPI_RELEASE_VERSION'])
+        return None
+
+    @property
+    def mpi_version(self):
+        """Version of the MPI standard (such as '3.1'), or None"""
+        if 'MPI_VERSION' not in self:
+            return None
+        return "{}.{}".format(self.get('MPI_VERSION'),
+                              self.get('MPI_SUBVERSION', '0'))
+
+
+def scan_mpi_h(path):
+    """Extract all version macros from mpi.h in a single pass
+
+    The file is memory-mapped, so no subprocess is spawned and the file
+    is read only once.
+    """
+    macros = {}
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            return MpiHeader(path, macros)
+
+        try:
+            for m in _define_re.finditer(buf):
+                name = util.decode(m.group(1))
+                # The first definition wins
+                if name not in macros:
+                    macros[name] = _parse_value(util.decode(m.group(2)))
+                    if len(macros) == len(MACROS):
+                        break
+        finally:
+            buf.close()
+
+    return MpiHeader(path, macros)
@@ -0,0 +1,237 @@
+# coding: utf-8
+"""Hosts of `mpienv exec`
+
+Hosts are taken from the options of mpiexec (-H, --hostfile, ...), a
+Slurm-style compressed nodelist (`node[001-512,600]`) or the
+allocation of the batch scheduler ($SLURM_JOB_NODELIST, $PBS_NODEFILE).
+The order of the hosts and their numbers of slots are preserved.
+"""
+import collections
+import itertools
+import re
+import sys
+
+_HOST_OPTIONS = ['-H', '-host', '--host', '-hosts']
+_HOSTFILE_OPTIONS = ['-hostfile', '--hostfile', '-machinefile',
+                     '--machinefile', '-f']
+
+_tasks_re = re.compile(r'^(\d+)(?:\(x(\d+)\))?$')
+
+
+class HostList(object):
+    """Ordered hosts with their numbers of slots
+
+    The number of slots of a host is None if not specified. A host
+    added more than once gets the sum of the slots (counting 1 for
+    unspecified ones), as in MPICH's machinefiles and $PBS_NODEFILE.
+    """
+
+    def __init__(self, hosts=None):
+        self._slots = collections.OrderedDict()
+        for host in hosts or []:
+            self.add(host)
+
+    def add(self, host, slots=None):
+        if host in self._slots:
+            self._slots[host] = (self._slots[host] or 1) + (slots or 1)
+        else:
+            self._slots[host] = slots
+
+    def extend(self, other):
+        for host, slots in other.items():
+            self.add(host, slots)
+
+    @property
+    def hosts(self):
+        return list(self._slots)
+
+    def slots(self, host):
+        return self._slots[host]
+
+    def items(self):
+        return self._slots.items()
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, host):
+        return host in self._slots
+
+    def __repr__(self):
+        return "HostList({})".format(list(self._slots.items()))
+
+
+def _parse_entry(entry):
+    # host, host:N, host:slots=N
+    host, _, rest = entry.partition(':')
+    rest = rest.split(':')[0]
+    if rest.startswith('slots='):
+        rest = rest[6:]
+    return host, (int(rest) if rest.isdigit() else None)
+
+
+def parse_hostfile(lines, hostlist=None):
+    """Parse the lines of a hostfile into a HostList
+
+    Open MPI's hostfiles (`host slots=N`) and MPICH's machinefiles
+    (`host:N`) are accepted.
+    """
+    if hostlist is None:
+        hostlist = HostList()
+    add = hostlist.add
+    for line in lines:
+        if '#' in line:
+            line = line[:line.index('#')]
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        host, slots = fields[0], None
+        if ':' in host:
+            host, slots = _parse_entry(host)
+            if host == '':
+                continue
+        for field in fields[1:]:
+            if field.startswith('slots='):
+                n = field[6:]
+                slots = int(n) if n.isdigit() else slots
+        add(host, slots)
+    return hostlist
+
+
+def read_hostfile(path, hostlist=None):
+    with open(path) as f:
+        return parse_hostfile(f, hostlist)
+
+
+def _split_top(s):
+    # Split at commas not in brackets
+    items = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(s):
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            items.append(s[start:i])
+            start = i + 1
+    items.append(s[start:])
+    return [item for item in items if item != '']
+
+
+def _expand_range(r):
+    values = []
+    for part in r.split(','):
+        lo, sep, hi = part.partition('-')
+        if sep == '':
+            values.append(lo)
+            continue
+        if not (lo.isdigit() and hi.isdigit()) or int(lo) > int(hi):
+            raise ValueError("Invalid range: '{}'".format(part))
+        width = len(lo) if lo.startswith('0') else 0
+        values += [str(i).zfill(width)
+                   for i in range(int(lo), int(hi) + 1)]
+    return values
+
+
+def expand_nodelist(nodelist):
+    """Expand a Slurm-style compressed nodelist into a list of hosts
+
+    e.g. 'node[01-03,7],login' -> node01, node02, node03, node7, login
+    """
+    hosts = []
+    for item in _split_top(nodelist.strip()):
+        # Literal parts and bracketed ranges
+        parts = re.split(r'\[([^\]]*)\]', item)
+        if '[' in parts[-1] or ']' in parts[-1]:
+            raise ValueError("Unbalanced brackets: '{}'".format(item))
+        choices = []
+        for i, part in enumerate(parts):
+            choices.append(_expand_range(part) if i % 2 == 1 else [part])
+        hosts += [''.join(p) for p in itertools.product(*choices)]
+    return hosts
+
+
+def from_nodelist(nodelist):
+    """Return the HostList of a compressed nodelist
+
+    Each host may have the number of slots (e.g. 'node[1-4]:2').
+    """
+    hostlist = HostList()
+    for entry in expand_nodelist(nodelist):
+        host, slots = _parse_entry(entry)
+        hostlist.add(host, slots)
+    return hostlist
+
+
+def _tasks_per_node(value):
+    # '2(x3),1' -> [2, 2, 2, 1]
+    counts = []
+    for item in value.split(','):
+        m = _tasks_re.match(item)
+        if m is None:
+            return None
+        counts += [int(m.group(1))] * int(m.group(2) or 1)
+    return counts
+
+
+def from_env(env):
+    """Return the HostList of the scheduler's allocation, or None"""
+    nodelist = env.get('SLURM_JOB_NODELIST') or env.get('SLURM_NODELIST')
+    if nodelist:
+        hosts = expand_nodelist(nodelist)
+        counts = _tasks_per_node(env.get('SLURM_TASKS_PER_NODE', ''))
+        if counts is None or len(counts) != len(hosts):
+            counts = [None] * len(hosts)
+        hostlist = HostList()
+        for host, n in zip(hosts, counts):
+            hostlist.add(host, n)
+        return hostlist
+
+    if env.get('PBS_NODEFILE'):
+        try:
+            return read_hostfile(env['PBS_NODEFILE'])
+        except (IOError, OSError):
+            pass
+    return None
+
+
+def _needs_argument(opt):
+    sys.stderr.write("mpienv: Error: {} needs an argument.\n".format(opt))
+    exit(1)
+
+
+def from_mpi_args(args):
+    """Return the HostList given by the options of mpiexec in `args`"""
+    hostlist = HostList()
+    args = iter(args)
+    for arg in args:
+        if arg in _HOSTFILE_OPTIONS:
+            path = next(args, None)
+            if path is None:
+                _needs_argument(arg)
+            read_hostfile(path, hostlist)
+        elif arg in _HOST_OPTIONS:
+            value = next(args, None)
+            if value is None:
+                _needs_argument(arg)
+            for entry in value.split(','):
+                host, slots = _parse_entry(entry)
+                hostlist.add(host, slots)
+    return hostlist
+
+
+def strip_host_options(args):
+    """Return `args` without the host options of mpiexec"""
+    result = []
+    args = iter(args)
+    for arg in args:
+        if arg in _HOSTFILE_OPTIONS or arg in _HOST_OPTIONS:
+            next(args, None)
+        else:
+            result.append(arg)
+    return result
@@ -0,0 +1,102 @@
+# coding: utf-8
+"""Launcher scripts of `mpienv exec`
+
+A launcher script sets up the environment of the MPI on each host and
+runs the user's program. Scripts are named by the digest of their
+content and kept in the script directory, so a launch with the same
+environment as a previous one reuses the script on all the hosts
+instead of writing and copying a new one. Scripts not used for a while
+are removed.
+"""
+import hashlib
+import os
+import os.path
+import time
+
+from mpienv.discover import mount_type
+from mpienv.discover import NETWORK_FS
+
+# '{uid}' is replaced with the user ID
+DEFAULT_SCRIPT_DIR = '/tmp/mpienv-{uid}'
+
+
+def script_dir(conf):
+    path = conf.get('script_dir') or DEFAULT_SCRIPT_DIR
+    return os.path.expanduser(path.format(uid=os.getuid()))
+
+
+def script_name(text):
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return 'mpienv.{}.sh'.format(digest[:20])
+
+
+def is_shared(path, conf):
+    """Check if `path` is on a file system shared by the hosts
+
+    The `script_dir_shared` configuration overrides the detection,
+    which regards network file systems as shared.
+    """
+    shared = conf.get('script_dir_shared')
+    if shared is not None:
+        return bool(shared)
+    return mount_type(path) in NETWORK_FS
+
+
+def _check_dir(dir_name):
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name, 0o700)
+    # Others must not be able to plant scripts that we would run
+    st = os.stat(dir_name)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise RuntimeError("{} must be owned by you and must not be "
+                           "writable by others".format(dir_name))
+
+
+def store_script(dir_name, text):
+    """Write `text` as a script in `dir_name` and return its path
+
+    The script is not written again if it already exists.
+    """
+    _check_dir(dir_name)
+    path = os.path.join(dir_name, script_name(text))
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                # Mark as used so that it is not pruned
+                os.utime(path, None)
+                return path
+    except (IOError, OSError):
+        pass
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.chmod(tmp, 0o744)
+    os.rename(tmp, path)
+    return path
+
+
+def prune_scripts(dir_name, max_age, keep=None):
+    """Remove scripts in `dir_name` not used for `max_age` seconds
+
+    The script `keep` (e.g. the one about to be run) is never removed,
+    and nothing is removed if `max_age` <= 0.
+    """
+    if max_age <= 0:
+        return
+    limit = time.time() - max_age
+    try:
+        names = os.listdir(dir_name)
+    except OSError:
+        return
+    for name in names:
+        if not (name.startswith('mpienv.') and name.endswith('.sh')):
+            continue
+        path = os.path.join(dir_name, name)
+        if keep is not None and os.path.basename(keep) == name:
+            continue
+        try:
+            if os.stat(path).st_mtime < limit:
+                os.remove(path)
+        except OSError:
+            pass
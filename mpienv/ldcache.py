@@ -0,0 +1,79 @@
+# coding: utf-8
+"""A minimal reader of /etc/ld.so.cache
+
+Both the old format ("ld.so-1.7.0") and the new format
+("glibc-ld.so.cache1.1"), which may follow the old one in the same
+file, are supported. Only the library names and paths are read.
+"""
+import struct
+
+OLD_MAGIC = b'ld.so-1.7.0'
+NEW_MAGIC = b'glibc-ld.so.cache1.1'
+
+
+class LdCacheError(Exception):
+    pass
+
+
+def _cstring(buf, offset):
+    end = buf.find(b'\0', offset)
+    if end < 0:
+        raise LdCacheError("broken string table")
+    return buf[offset:end].decode('utf-8', 'replace')
+
+
+def _parse_new(buf, start):
+    # magic, nlibs, len_strings, flags, 3 bytes padding,
+    # extension_offset, 3 unused words
+    nlibs, = struct.unpack_from('<I', buf, start + len(NEW_MAGIC))
+    entries = []
+    pos = start + 48
+    for _ in range(nlibs):
+        # flags, key, value, osversion, hwcap
+        _, key, value, _, _ = struct.unpack_from('<iIIIQ', buf, pos)
+        pos += 24
+        # String offsets are relative to the beginning of the new header
+        entries.append((_cstring(buf, start + key),
+                        _cstring(buf, start + value)))
+    return entries
+
+
+def _parse_old(buf):
+    # magic (padded to 12 bytes), nlibs, and entries of (flags, key, value)
+    nlibs, = struct.unpack_from('<I', buf, 12)
+    pos = 16
+    strings = pos + nlibs * 12
+
+    # The new format may follow the old entries (aligned to 8 bytes)
+    new_start = (strings + 7) & ~7
+    if buf[new_start:new_start + len(NEW_MAGIC)] == NEW_MAGIC:
+        return _parse_new(buf, new_start)
+
+    entries = []
+    for _ in range(nlibs):
+        _, key, value = struct.unpack_from('<iII', buf, pos)
+        pos += 12
+        entries.append((_cstring(buf, strings + key),
+                        _cstring(buf, strings + value)))
+    return entries
+
+
+def parse_ld_cache(buf):
+    """Return a list of (library name, path) in `buf`"""
+    try:
+        if buf.startswith(NEW_MAGIC):
+            return _parse_new(buf, 0)
+        elif buf.startswith(OLD_MAGIC):
+            return _parse_old(buf)
+    except struct.error:
+        raise LdCacheError("ld.so.cache is broken")
+    raise LdCacheError("Unknown format of ld.so.cache")
+
+
+def read_ld_cache(path='/etc/ld.so.cache'):
+    """Return the list of (library name, path), or [] if unavailable"""
+    try:
+        with open(path, 'rb') as f:
+            return parse_ld_cache(f.read())
+    except (IOError, OSError, LdCacheError):
+        return []
@@ -0,0 +1,141 @@
+# coding: utf-8
+"""Reader of the system locate databases
+
+Two formats are supported:
+
+ * mlocate.db of mlocate: a header, followed by directories, each of
+   which has its path and the names of its entries.
+ * LOCATE02 of GNU findutils: front-compressed full paths.
+
+plocate's database compresses the path lists with zstd, which is not
+available in the standard library. It is reported as unsupported, and
+callers fall back to walking the file system.
+"""
+import mmap
+import os.path
+import struct
+
+DEFAULT_PATHS = [
+    '/var/lib/mlocate/mlocate.db',
+    '/var/lib/plocate/plocate.db',
+    '/var/cache/locate/locatedb',
+    '/var/lib/locate/locatedb',
+]
+
+MLOCATE_MAGIC = b'\0mlocate'
+LOCATE02_MAGIC = b'\0LOCATE02\0'
+
+
+class LocateDbError(Exception):
+    pass
+
+
+def find_db(paths=None):
+    """Return the path of the first readable locate database, or None"""
+    for path in paths or DEFAULT_PATHS:
+        if os.access(path, os.R_OK):
+            return path
+    return None
+
+
+def _cstring_end(buf, pos):
+    end = buf.find(b'\0', pos)
+    if end < 0:
+        raise LocateDbError("Unexpected end of the database")
+    return end
+
+
+def _iter_mlocate(buf, pattern):
+    # Header: magic, size of the configuration block (u32 BE), version,
+    # visibility flag, 2 bytes padding, and the root path.
+    conf_size, version = struct.unpack_from('>IB', buf, len(MLOCATE_MAGIC))
+    if version != 0:
+        raise LocateDbError("Unknown mlocate version: {}".format(version))
+    pos = _cstring_end(buf, 16) + 1 + conf_size
+
+    size = len(buf)
+    while pos < size:
+        # Directory header: time (u64 + u32 BE) and 4 bytes padding
+        pos += 16
+        end = _cstring_end(buf, pos)
+        dir_path = buf[pos:end]
+        pos = end + 1
+        is_bin = dir_path.endswith(b'/bin')
+
+        while True:
+            entry_type = buf[pos:pos + 1]
+            pos += 1
+            if entry_type == b'\2':  # End of the directory
+                break
+            end = _cstring_end(buf, pos)
+            if is_bin and entry_type == b'\0':
+                name = buf[pos:end]
+                if pattern in name:
+                    yield dir_path + b'/' + name
+            pos = end + 1
+
+
+def _iter_locate02(buf, pattern):
+    pos = len(LOCATE02_MAGIC)
+    size = len(buf)
+    prev = b''
+    count = 0
+    while pos < size:
+        offset = struct.unpack_from('b', buf, pos)[0]
+        pos += 1
+        if offset == -128:  # Escape: followed by a 2-byte offset
+            offset = struct.unpack_from('>h', buf, pos)[0]
+            pos += 2
+        count += offset
+        end = _cstring_end(buf, pos)
+        path = prev[:count] + buf[pos:end]
+        pos = end + 1
+        prev = path
+        if pattern in path:
+            head, _, name = path.rpartition(b'/')
+            if pattern in name and head.endswith(b'/bin'):
+                yield path
+
+
+def iter_matches(db_path, pattern=b'mpiexec'):
+    """Generate paths of files in bin/ whose name contains `pattern`"""
+    with open(db_path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise LocateDbError("{} is empty".format(db_path))
+
+    try:
+        if buf[:len(MLOCATE_MAGIC)] == MLOCATE_MAGIC:
+            gen = _iter_mlocate(buf, pattern)
+        elif buf[:len(LOCATE02_MAGIC)] == LOCATE02_MAGIC:
+            gen = _iter_locate02(buf, pattern)
+        else:
+            raise LocateDbError("{}: unsupported database format".format(
+                db_path))
+        try:
+            for path in gen:
+                yield path.decode('utf-8', 'surrogateescape')
+        except (struct.error, IndexError):
+            raise LocateDbError("{} is broken".format(db_path))
+    finally:
+        buf.close()
+
+
+def find_prefixes(db_path, roots=None):
+    """Return prefixes that have bin/*mpiexec* according to the database
+
+    If `roots` is given, only prefixes under them are returned.
+    """
+    if roots is not None:
+        roots = [os.path.join(os.path.abspath(r), '') for r in roots]
+    prefixes = []
+    for path in iter_matches(db_path):
+        prefix = os.path.dirname(os.path.dirname(path))
+        if prefix in prefixes:
+            continue
+        if roots is not None and not any(
+                os.path.join(prefix, '').startswith(r) for r in roots):
+            continue
+        prefixes.append(prefix)
+    return prefixes
@@ -2,22 +2,13 @@
 
 import os.path
 import re
-from subprocess import call
-from subprocess import PIPE
-from subprocess import Popen
 import sys
 
+import mpienv.mpibase as mpibase
 import mpienv.mpich as mpich
 import mpienv.mvapich as mvapich
 import mpienv.openmpi as openmpi
-import mpienv.util as util
-
-
-try:
-    from subprocess import DEVNULL  # py3k
-except ImportError:
-    import os
-    DEVNULL = open(os.devnull, 'wb')
+from mpienv.probe import get_probe
 
 
 def _is_broken_symlink(path):
@@ -25,7 +16,7 @@ def _is_broken_symlink(path):
 
 
 class BrokenMPI(object):
-    def __init__(self, mpiexec, conf, name=None):
+    def __init__(self, mpiexec, conf, name=None, probe=None):
         # assert os.path.islink(mpiexec)
         self._mpiexec = mpiexec
         self._conf = conf
@@ -35,39 +26,134 @@ class BrokenMPI(object):
     def is_broken(self):
         return True
 
+    @property
+    def is_unresponsive(self):
+        return False
+
     def remove(self):
         link = os.path.join(self._conf['mpi_dir'], self._name)
         os.remove(link)
 
+    def to_dict(self):
+        return {
+            'broken': self.is_broken,
+            'mpiexec': self._mpiexec,
+        }
+
+
+class UnresponsiveMPI(BrokenMPI):
+    """An MPI whose probe commands did not finish within the timeout"""
+
+    def __init__(self, mpiexec, conf, name=None, reason=None):
+        super(UnresponsiveMPI, self).__init__(mpiexec, conf, name)
+        self._reason = reason
+
+    @property
+    def is_unresponsive(self):
+        return True
+
+    @property
+    def reason(self):
+        return self._reason
+
+
+class LazyMPI(object):
+    """A handle of a registered MPI installation
+
+    The name and mpiexec are known from the configuration file, so they
+    are available without probing. Other attributes are resolved by
+    `loader` on first access.
+    """
+
+    def __init__(self, name, mpiexec, loader):
+        self._name = name
+        self._mpiexec = mpiexec
+        self._loader = loader
+        self._mpi = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        if self._mpi is not None:
+            self._mpi.name = name
+
+    @property
+    def mpiexec(self):
+        return self._mpiexec
+
+    @property
+    def is_active(self):
+        return mpibase.is_active_mpiexec(self._mpiexec)
+
+    def resolve(self):
+        if self._mpi is None:
+            self._mpi = self._loader(self._name)
+        return self._mpi
+
+    def __getattr__(self, attr):
+        # Called only if `attr` is not found in the handle itself
+        if attr.startswith('__') or attr in ['_mpi', '_loader']:
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+
+def get_mpi_class_by_name(class_name):
+    """Return the MPI class from its name stored in the probe cache"""
+    for cls in [openmpi.OpenMPI, mpich.Mpich, mvapich.Mvapich]:
+        if cls.__name__ == class_name:
+            return cls
+    raise KeyError(class_name)
+
+
+_static_classes = {
+    'Open MPI': openmpi.OpenMPI,
+    'MPICH': mpich.Mpich,
+    'MVAPICH': mvapich.Mvapich,
+}
+
+
+def get_mpi_type_by_class_name(class_name):
+    """Return the type name (e.g. 'Open MPI') of an MPI class"""
+    for type_, cls in _static_classes.items():
+        if cls.__name__ == class_name:
+            return type_
+    raise KeyError(class_name)
+
+
+def detect_mpi(mpienv, mpiexec):
+    """Return the class of the MPI and the Probe object used to detect it
+
+    The Probe object should be passed to the constructor of the class so
+    that each external tool runs only once.
+    """
+    probe = get_probe(mpiexec, mpienv.config().get('probe_timeout'))
 
-def get_mpi_class(mpienv, mpiexec):
-    """Return the class of the MPI"""
     if not os.path.exists(mpiexec):
         # prefix directory does exist but prefix/bin/mpiexec
         # does not. --> It seems that the MPI has been
         # uninstalled after registered to mpienv?
         sys.stderr.write("'{}' seems to be broken because "
                          "there's no such file or directory\n".format(mpiexec))
-        return BrokenMPI
+        return BrokenMPI, probe
 
     if _is_broken_symlink(mpiexec):
-        return BrokenMPI
+        return BrokenMPI, probe
 
-    # Add LD_LIBRARY_PATH
-    bin_dir = os.path.dirname(mpiexec)
-    lib_dir = os.path.abspath(os.path.join(bin_dir, os.pardir, 'lib'))
+    # Try to detect the flavor from ELF metadata and headers first,
+    # because running mpiexec may be slow on some systems.
+    static = probe.static
+    if static is not None and static.flavor in _static_classes:
+        return _static_classes[static.flavor], probe
 
-    env = os.environ.copy()
-    ld_lib_path = [lib_dir] + env.get('LD_LIBRARY_PATH', '').split(':')
-    env['LD_LIBRARY_PATH'] = ':'.join(ld_lib_path)
-
-    p = Popen([mpiexec, '--version'], stderr=PIPE, stdout=PIPE, env=env)
-    out, err = p.communicate()
-    ver_str = util.decode(out + err)
+    ver_str = probe.version_text
 
     if re.search(r'OpenRTE', ver_str, re.MULTILINE):
         # Open MPI
-        return openmpi.OpenMPI
+        return openmpi.OpenMPI, probe
 
     if re.search(r'HYDRA', ver_str, re.MULTILINE):
         # MPICH or MVAPICH
@@ -75,20 +161,23 @@ def get_mpi_class(mpienv, mpiexec):
         # the MPI type.
         # This is because MVAPCIH uses MPICH's mpiexec,
         # so we cannot distinguish them only from mpiexec.
-        mpi_h = mpich.find_mpi_h(mpiexec, ver_str)
-        ret = call(['grep', 'MVAPICH2_VERSION', '-q', mpi_h],
-                   stderr=DEVNULL)
-        if ret == 0:
+        if 'MVAPICH2_VERSION' in probe.header:
             # MVAPICH
-            return mvapich.Mvapich
+            return mvapich.Mvapich, probe
         else:
             # MPICH
             # on some platform, sometimes only runtime
             # is installed and developemnt kit (i.e. compilers)
             # are not installed.
             # In this case, we assume it's mpich.
-            return mpich.Mpich
+            return mpich.Mpich, probe
 
     # Failed to detect MPI
     sys.stderr.write("ver_str = {}\n".format(ver_str))
     raise RuntimeError("Unknown MPI type '{}'".format(mpiexec))
+
+
+def get_mpi_class(mpienv, mpiexec):
+    """Return the class of the MPI"""
+    mpi_class, _ = detect_mpi(mpienv, mpiexec)
+    return mpi_class
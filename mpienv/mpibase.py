@@ -1,22 +1,38 @@
 # coding: utf-8
 
-import datetime
-import distutils.spawn
 import os.path
-import re
 import shutil
 from subprocess import check_call
 from subprocess import PIPE
 from subprocess import Popen
+from subprocess import STDOUT
 import sys  # NOQA
+import time
 
 import mpienv
+from mpienv.cache import file_fingerprint
+import mpienv.hosts
+import mpienv.pathenv as pathenv
 from mpienv.py import MPI4Py
+from mpienv.snapshot import snapshot_path
+from mpienv.snapshot import write_snapshot
 import mpienv.util as util
+import mpienv.view as view
+import mpienv.wrapper as wrapper
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote  # NOQA
+
+try:
+    from shutil import which as _find_executable  # py3k
+except ImportError:
+    from distutils.spawn import find_executable as _find_executable
 
 
 def _which(cmd):
-    exe = distutils.spawn.find_executable(cmd)
+    exe = _find_executable(cmd)
     if exe is None:
         return None
 
@@ -24,68 +40,24 @@ def _which(cmd):
     return exe
 
 
-def _gen_temp_script_name():
-    host_name = os.uname()[1]
-    pid = os.getpid()
-    tm = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    name = '{}.{:>05}.{}.mpienv.sh'.format(host_name, pid, tm)
-    tempfile = os.path.join('/tmp', name)
-    return tempfile
-
-
-def _parse_hostfile(file_name):
-    with open(file_name, 'r') as f:
-        lines = f.readlines()
-
-    hosts = []
-
-    for line in lines:
-        line = line.strip()
-        if line == '':
-            continue
+def is_active_mpiexec(mpiexec):
+    """Check if `mpiexec` is the one found in PATH"""
+    ex2 = _which('mpiexec')
 
-        # Remove comments
-        line = re.sub(r'#.*$', '', line)
-
-        # Remove options
-        line = re.sub(r':.*$', '', line)
+    if ex2 is None or not os.path.exists(ex2):
+        return False
 
-        hosts.append(line)
+    ex1 = os.path.realpath(mpiexec)
+    ex2 = os.path.realpath(wrapper.wrapped_command(ex2))
 
-    return hosts
+    return ex1 == ex2
 
 
 def parse_hosts(cmds):
-    hosts = []
-
-    cmds = list(cmds)
-
-    while len(cmds) > 0:
-        head = cmds.pop(0)
-        if re.match(r'--?(machine|host)file$', head):
-            if len(cmds) == 0:
-                sys.stderr.write("mpienv: Error: "
-                                 "{} needs an argument.".format(head))
-                exit(1)
-            file_name = cmds.pop(0)
-            hosts += _parse_hostfile(file_name)
-        elif head in ['-H', '-host', '--host']:
-            if len(cmds) == 0:
-                sys.stderr.write("mpienv: Error: "
-                                 "{} needs an argument.".format(head))
-                exit(1)
-            hosts2 = cmds.pop(0).split(',')
-            # Remote options
-            hosts2 = [re.sub(':.*$', '', h) for h in hosts2]
-            hosts += hosts2
-        else:
-            continue
-
-    hosts = sorted(list(set(hosts)))
-
+    """Return the hosts given by the options of mpiexec, in order"""
+    hosts = mpienv.hosts.from_mpi_args(cmds).hosts
     if len(hosts) == 0:
         hosts = ['localhost']
-
     return hosts
 
 
@@ -93,8 +65,8 @@ def split_mpi_user_prog(cmds):
     """An ad-hoc parser that splits mpiexec args and user program's args"""
 
     opt_with_one_arg = [
-        '-H', '-host', '--host',
-        '-machinefile', '--machinefile',
+        '-H', '-host', '--host', '-hosts',
+        '-machinefile', '--machinefile', '-f',
         '-hostfile', '--hostfile',
         '-c', '-n', '--n', '-np',
         '-npersocker', '--npersocker', '-npernode', '--npernode',
@@ -123,7 +95,7 @@ def split_mpi_user_prog(cmds):
     ]
 
     opt_with_two_arg = [
-        '--gmca', '--mca',
+        '--gmca', '--mca', '-genv',
     ]
 
     idx = 0
@@ -154,6 +126,10 @@ def _get_python_interp(python):
 
 
 class MpiBase(object):
+    # Attributes obtained by probing the installation, which are
+    # stored in (and restored from) the probe cache.
+    _probe_attrs = ['_type', '_version', '_conf_params', '_default_name']
+
     def __init__(self, prefix, mpiexec, mpicc,
                  inc_dir, lib_dir,
                  conf, name=None):
@@ -180,6 +156,35 @@ class MpiBase(object):
             'version': self.version,
         }
 
+    def probe_files(self):
+        """Files that the probe result of this MPI depends on"""
+        files = [self._mpicc]
+        if self._inc_dir is not None:
+            files.append(os.path.join(self._inc_dir, 'mpi.h'))
+        return files
+
+    def to_probe_dict(self):
+        d = {
+            'class': type(self).__name__,
+            'prefix': self._prefix,
+            'mpicc': self._mpicc,
+            'inc_dir': self._inc_dir,
+            'lib_dir': self._lib_dir,
+        }
+        for attr in self._probe_attrs:
+            d[attr] = getattr(self, attr, None)
+        return d
+
+    @classmethod
+    def from_probe_dict(cls, mpiexec, d, conf, name=None):
+        """Construct an object from a cached probe result without probing"""
+        mpi = cls.__new__(cls)
+        MpiBase.__init__(mpi, d['prefix'], mpiexec, d['mpicc'],
+                         d['inc_dir'], d['lib_dir'], conf, name)
+        for attr in cls._probe_attrs:
+            setattr(mpi, attr, d.get(attr))
+        return mpi
+
     @property
     def prefix(self):
         pref = self._prefix
@@ -233,21 +238,16 @@ class MpiBase(object):
 
     @property
     def is_active(self):
-        ex1 = self.mpiexec
-        ex2 = _which('mpiexec')
-
-        if ex2 is None or not os.path.exists(ex2):
-            return False
-
-        ex1 = os.path.realpath(ex1)
-        ex2 = os.path.realpath(ex2)
-
-        return ex1 == ex2
+        return is_active_mpiexec(self.mpiexec)
 
     @property
     def is_broken(self):
         return False
 
+    @property
+    def is_unresponsive(self):
+        return False
+
     def _mirror_file(self, f, dst_dir, dst_bname=None):
         if dst_bname is None:
             dst = os.path.join(dst_dir, os.path.basename(f))
@@ -284,62 +284,153 @@ class MpiBase(object):
     def libexec_files(self):
         assert False, "Must be overriden"
 
-    def _generate_exec_script(self, file_name, mpi_args, user_args, keep):
-        with open(file_name, 'w') as f:
-            shells = ['/bin/bash', '/bin/ash', '/bin/sh']
-            for shell in shells:
-                if os.path.exists(shell):
-                    f.write('#!{}\n\n'.format(shell))
-                    break
-            else:
-                sys.stderr.write("No available shell found: {}".format(shells))
-                exit(1)
-
-            # Write MPIENV_HOME
-            f.write("export MPIENV_HOME={}\n\n".format(self.conf['root_dir']))
-
-            # Write PATH
-            path = self._generate_path()
-            f.write("export PATH={}\n\n".format(':'.join(path)))
-
-            # Write LD_LIBRARY_PATH
-            ldlib = self._generate_ldlib()
-            f.write("export LD_LIBRARY_PATH={}\n\n".format(':'.join(ldlib)))
-
-            # Write PYTHONPATH
-            cur_name = mpienv.mpienv.config2['DEFAULT']['active']
-            py = MPI4Py(self._conf, cur_name)
-            pypath = py.gen_pythonpath()
-            f.write("export PYTHONPATH={}\n\n".format(':'.join(pypath)))
+    def view_files(self):
+        """Return a list of (subdir, file, name) that make up the view
+
+        Whole directories are mirrored, unless the prefix is shared with
+        other software (e.g. /usr). In that case, only the files listed
+        by *_files() are.
+        """
+        files = []
+        if os.path.normpath(self.prefix) in pathenv.shared_prefixes():
+            files += [('bin', f, None) for f in self.bin_files()]
+            for ex in [self.mpiexec, self.mpicc, self.mpicxx]:
+                if os.path.exists(ex):
+                    files.append(('bin', ex, os.path.basename(ex)))
+            files += self._probed_dir_files()
+            files += [('lib', f, None) for f in self.lib_files()]
+            files += [('include', f, None) for f in self.inc_files()]
+            files += [('libexec', f, None) for f in self.libexec_files()]
+        else:
+            files += self._probed_dir_files()
+            for sub in ['bin', 'lib', 'lib64', 'include', 'libexec']:
+                src = os.path.join(self.prefix, sub)
+                if os.path.isdir(src):
+                    files += [(sub, os.path.join(src, f), None)
+                              for f in sorted(os.listdir(src))]
+        return files
+
+    def _probed_dir_files(self):
+        # The probed lib_dir and inc_dir (e.g. lib/openmpi/lib of Debian)
+        # are mirrored to lib/ and include/, unless they are the common
+        # directories of the prefix, which have other software's files.
+        prefix = os.path.normpath(self.prefix)
+        common = [os.path.join(prefix, d) for d in ['lib', 'lib64',
+                                                    'include']]
+        files = []
+        for sub, d in [('lib', self._lib_dir), ('include', self._inc_dir)]:
+            if d is None or not os.path.isdir(d):
+                continue
+            d = os.path.normpath(d)
+            # Multiarch directories like lib/x86_64-linux-gnu are common
+            if d in common or (os.path.dirname(d) in common and
+                               '-linux-' in os.path.basename(d)):
+                continue
+            files += [(sub, os.path.join(d, f), None)
+                      for f in sorted(os.listdir(d))]
+        return files
+
+    def mirror_to(self, dst_dir):
+        """Create symlinks to the files of the MPI under `dst_dir`"""
+        for sub, f, bname in self.view_files():
+            d = os.path.join(dst_dir, sub)
+            if not os.path.exists(d):
+                os.makedirs(d)
+            dst = os.path.join(d, bname or os.path.basename(f))
+            if not os.path.lexists(dst):
+                self._mirror_file(f, d, bname)
+
+    def _exec_env(self, removed=None):
+        """Environment variables set for the ranks, as a list of pairs"""
+        py = MPI4Py(self._conf, self.name)
+        return [
+            ('MPIENV_HOME', self.conf['root_dir']),
+            ('PATH', ':'.join(self._generate_path(removed))),
+            ('LD_LIBRARY_PATH', ':'.join(self._generate_ldlib(removed))),
+            ('PYTHONPATH', ':'.join(py.gen_pythonpath())),
+            ('MPIENV_MPI_TYPE', self.type_),
+            ('MPIENV_MPI_VERSION', self.version),
+            ('MPIENV_MPI_NAME', self.name),
+        ]
+
+    def _env_args(self, env):
+        """mpiexec options that set `env` for the ranks, or None
+
+        None means the MPI cannot forward environment variables, and
+        the ranks are run through a script.
+        """
+        return None
 
-            # Write some extra environmental variables
-            f.write("export MPIENV_MPI_TYPE=\"{}\"\n".format(self.type_))
-            f.write("export MPIENV_MPI_VERSION=\"{}\"\n".format(self.version))
-            f.write("export MPIENV_MPI_NAME=\"{}\"\n".format(self.name))
-            f.write("\n")
+    def _host_list_arg(self, hostlist):
+        return ','.join(host if slots is None else
+                        '{}:{}'.format(host, slots)
+                        for host, slots in hostlist.items())
+
+    def _host_args(self, hostlist):
+        """mpiexec options to run on the hosts of `hostlist`"""
+        return ['-host', ','.join(hostlist.hosts)]
+
+    def _batch_args(self, mpi_args):
+        """mpiexec options for jobs that run concurrently in batch mode
+
+        `mpi_args` are the options given by the user.
+        """
+        return []
+
+    def _generate_exec_script(self, env):
+        lines = []
+        shells = ['/bin/bash', '/bin/ash', '/bin/sh']
+        for shell in shells:
+            if os.path.exists(shell):
+                lines.append('#!{}\n'.format(shell))
+                break
+        else:
+            sys.stderr.write("No available shell found: {}".format(shells))
+            exit(1)
+
+        # MPIENV_HOME, PATH, LD_LIBRARY_PATH and PYTHONPATH, and some
+        # extra environmental variables
+        for name, value in env:
+            if name.startswith('MPIENV_MPI_'):
+                lines.append("export {}=\"{}\"".format(name, value))
+            else:
+                lines.append("export {}={}\n".format(name, value))
+        lines[-1] += "\n"
 
-            # construct the command line
-            user_args = mpienv.util.escape_shell_commands(user_args)
-            f.write(' '.join(user_args) + "\n")
+        # The user's command line is given as the arguments, so that the
+        # script depends only on the environment and is reused by runs
+        # of other programs.
+        lines.append('exec "$@"')
 
-            # remove the script itself
-            if not keep:
-                f.write('rm -f {}\n'.format(file_name))
+        # The script is named by its content and reused by later runs
+        # with the same environment, so it does not remove itself.
+        return "\n".join(lines) + "\n"
 
-        os.chmod(file_name, 0o744)
+    def exec_(self, cmds, dry_run, verbose, no_python_abspath, script=False,
+              nodelist=None):
+        # Run the mpiexec command
+        mpi_args, user_args = split_mpi_user_prog(cmds)
 
-    def exec_(self, cmds, keep, dry_run, verbose, no_python_abspath):
-        # We use '/tmp/%%%%.mpienv.sh as a script name
-        # I think this is OK in most cases
-        tempfile = _gen_temp_script_name()
-        remote_hosts = parse_hosts(cmds)
+        # Hosts given to mpiexec, by --nodelist, or allocated by the
+        # batch scheduler (which mpiexec finds by itself)
+        hostlist = mpienv.hosts.from_mpi_args(mpi_args)
+        if nodelist is not None:
+            try:
+                hostlist = mpienv.hosts.from_nodelist(nodelist)
+            except ValueError as e:
+                sys.stderr.write("mpienv: Error: {}\n".format(e))
+                exit(1)
+            mpi_args = self._host_args(hostlist) + mpi_args
+        elif len(hostlist) == 0:
+            hostlist = (mpienv.hosts.from_env(os.environ) or
+                        mpienv.hosts.HostList())
 
         if verbose:
-            print("mpienv exec: INFO: tempfile = {}".format(tempfile))
-            print("mpienv exec: INFO: hosts = {}".format(remote_hosts))
-
-        # Run the mpiexec command
-        mpi_args, user_args = split_mpi_user_prog(cmds)
+            hosts = hostlist.hosts
+            if len(hosts) > 8:
+                hosts = hosts[:8] + ['...']
+            print("mpienv exec: INFO: hosts = {} ({} hosts)".format(
+                hosts, len(hostlist)))
 
         # Warn if user tries to run python program while --mpi4py is not active
         if user_args[0] == 'python':
@@ -350,33 +441,237 @@ class MpiBase(object):
                         user_args[0]
                     ))
 
-            if not mpienv.mpienv.config2['DEFAULT'].getboolean('mpi4py'):
+            if not mpienv.mpienv.is_mpi4py_active():
                 sys.stderr.write("mpienv: Warning: "
                                  "It seems that you are trying"
                                  " to run a python program, but mpi4py is not"
                                  " installed")
 
-        # Generate a proxy shell script that runs user programs
-        self._generate_exec_script(tempfile, mpi_args, user_args, keep)
-
-        # Copy script file
-        for host in remote_hosts:
-            if host not in ['localhost', '127.0.0.1']:
-                check_call(['scp', tempfile, '{}:{}'.format(host, tempfile)])
+        removed = []
+        env = self._exec_env(removed)
+        if verbose:
+            for var, p in removed:
+                print("mpienv exec: INFO: removed '{}' from {}".format(p, var))
+
+        # Forward the environment by the options of mpiexec if possible,
+        # so that the ranks run the user program directly.
+        env_args = None
+        if not script and self._conf.get('exec_mode') != 'script':
+            env_args = self._env_args(env)
+        if env_args is not None:
+            args = env_args + mpi_args + user_args
+        else:
+            script_path = self._prepare_script(env, hostlist.hosts, verbose)
+            args = mpi_args + [script_path] + user_args
 
         # Execute mpiexec
         mpiexec = self.mpiexec
         if dry_run:
-            print(' '.join([mpiexec] + mpi_args + [tempfile]))
-            if verbose:
+            print(' '.join(mpienv.util.escape_shell_commands(
+                [mpiexec] + args)))
+            if verbose and env_args is None:
                 print("")
-                print(tempfile)
+                print(script_path)
                 print("---")
-                check_call(['cat', tempfile])
+                check_call(['cat', script_path])
         else:
             sys.stdout.flush()
             sys.stderr.flush()
-            os.execv(mpiexec, [mpiexec] + mpi_args + [tempfile])
+            os.execv(mpiexec, [mpiexec] + args)
+
+    def exec_batch(self, cmds, batch_file, verbose, no_python_abspath,
+                   dry_run=False, script=False, nodelist=None, jobs=None,
+                   slots=None, log_dir=None):
+        """Run the jobs listed in `batch_file` concurrently
+
+        The environment (and the script, if any) is prepared once for all
+        the jobs. `cmds` are mpiexec options common to the jobs. Each job
+        runs on the free slots of the hosts, which are given by `cmds`,
+        `nodelist` or the batch scheduler (the local host with `slots`
+        slots otherwise).
+        """
+        # Modules only for `mpienv exec` are imported in its methods, so
+        # that the other commands do not load them.
+        import mpienv.batch as batch
+
+        try:
+            with open(batch_file) as f:
+                batch_jobs = batch.read_batch(f)
+        except (IOError, OSError, ValueError) as e:
+            sys.stderr.write("mpienv: Error: {}: {}\n".format(batch_file, e))
+            exit(1)
+
+        # The hosts are assigned to each job
+        hostlist = mpienv.hosts.from_mpi_args(cmds)
+        common_args = mpienv.hosts.strip_host_options(cmds)
+        if nodelist is not None:
+            try:
+                hostlist = mpienv.hosts.from_nodelist(nodelist)
+            except ValueError as e:
+                sys.stderr.write("mpienv: Error: {}\n".format(e))
+                exit(1)
+        elif len(hostlist) == 0:
+            hostlist = (mpienv.hosts.from_env(os.environ) or
+                        mpienv.hosts.HostList())
+        if slots is None:
+            # multiprocessing is imported here because it is slow to
+            # import and most commands do not need it.
+            from multiprocessing import cpu_count
+            slots = cpu_count()
+        pool = batch.SlotPool(hostlist, slots)
+        if jobs is None and self._conf.get('batch_jobs'):
+            jobs = int(self._conf['batch_jobs'])
+
+        if verbose:
+            print("mpienv exec: INFO: {} jobs on {} slots of {} hosts".format(
+                len(batch_jobs), pool.total, len(hostlist) or 1))
+
+        removed = []
+        env = self._exec_env(removed)
+        if verbose:
+            for var, p in removed:
+                print("mpienv exec: INFO: removed '{}' from {}".format(p, var))
+
+        env_args = None
+        if not script and self._conf.get('exec_mode') != 'script':
+            env_args = self._env_args(env)
+        if env_args is not None:
+            launch_args = env_args + common_args
+            exe = []
+        else:
+            launch_args = common_args
+            exe = [self._prepare_script(env, hostlist.hosts, verbose)]
+
+        interps = {}
+        for job in batch_jobs:
+            try:
+                # '' stops the parser if the job has no program
+                mpi_args, user_args = split_mpi_user_prog(job.args + [''])
+                user_args = user_args[:-1]
+            except IndexError:
+                user_args = []
+            if len(user_args) == 0:
+                sys.stderr.write("mpienv: Error: {}: job {} has no "
+                                 "program.\n".format(batch_file, job.index))
+                exit(1)
+            if user_args[0] == 'python' and not no_python_abspath:
+                if 'python' not in interps:
+                    interps['python'] = _get_python_interp('python')
+                user_args[0] = interps['python']
+            job.mpi_args = mpi_args
+            job.user_args = user_args
+
+        def command(job):
+            # The slots assigned to the job (on localhost if no hosts are
+            # given), unless the job has its own hosts
+            args = []
+            if len(mpienv.hosts.from_mpi_args(job.mpi_args)) == 0:
+                args += self._host_args(job.hosts)
+            args += self._batch_args(launch_args + job.mpi_args)
+            return ([self.mpiexec] + launch_args + args + job.mpi_args +
+                    exe + job.user_args)
+
+        if dry_run:
+            for job in batch_jobs:
+                job.hosts = pool.allocate(job.np)
+                print(' '.join(mpienv.util.escape_shell_commands(
+                    command(job))))
+                pool.release(job.hosts)
+            return
+
+        if log_dir is not None and not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+
+        def launch(job):
+            if verbose:
+                print("mpienv exec: INFO: job {} started on {}".format(
+                    job.index, job.hosts.hosts))
+            if log_dir is None:
+                return Popen(command(job))
+            log = os.path.join(log_dir, 'job-{}.out'.format(job.index))
+            with open(log, 'w') as out:
+                return Popen(command(job), stdout=out, stderr=STDOUT)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        start = time.time()
+        batch.run_batch(batch_jobs, pool, launch, jobs)
+        for line in batch.format_summary(batch_jobs, time.time() - start):
+            print(line)
+        if any(job.returncode != 0 for job in batch_jobs):
+            exit(1)
+
+    def _prepare_script(self, env, hosts, verbose):
+        import mpienv.fanout as fanout
+        import mpienv.launcher as launcher
+
+        # Generate a proxy shell script that runs user programs
+        text = self._generate_exec_script(env)
+        script_dir = launcher.script_dir(self._conf)
+        try:
+            tempfile = launcher.store_script(script_dir, text)
+        except (RuntimeError, IOError, OSError) as e:
+            sys.stderr.write("mpienv: Error: {}\n".format(e))
+            exit(1)
+        launcher.prune_scripts(script_dir,
+                               float(self._conf.get('script_max_age') or 0),
+                               keep=tempfile)
+        if verbose:
+            print("mpienv exec: INFO: tempfile = {}".format(tempfile))
+
+        # Copy script file unless the hosts share the directory
+        hosts = fanout.remote_hosts(hosts)
+        if len(hosts) > 0:
+            if launcher.is_shared(script_dir, self._conf):
+                if verbose:
+                    print("mpienv exec: INFO: {} is shared with the "
+                          "hosts".format(script_dir))
+            else:
+                self._distribute(tempfile, hosts, verbose)
+        return tempfile
+
+    def _distribute(self, path, hosts, verbose):
+        import mpienv.fanout as fanout
+
+        conf = self._conf
+        control_path = None
+        if conf.get('ssh_multiplex'):
+            ssh_dir = os.path.join(conf['root_dir'], 'ssh')
+            if not os.path.exists(ssh_dir):
+                os.makedirs(ssh_dir, 0o700)
+            control_path = os.path.join(ssh_dir, '%C')
+
+        start = time.time()
+        results = fanout.distribute(path, hosts,
+                                    copy_cmd=conf.get('copy_cmd'),
+                                    ssh_cmd=conf.get('ssh_cmd'),
+                                    jobs=int(conf.get('fanout_jobs') or 1),
+                                    tree=int(conf.get('fanout_tree') or 0),
+                                    control_path=control_path,
+                                    skip_existing=True)
+        if verbose:
+            for r in results:
+                if r.skipped:
+                    action = "found on"
+                elif r.ok:
+                    action = "copied to"
+                else:
+                    action = "FAILED to copy to"
+                print("mpienv exec: INFO: {} {} in {:.3f} sec{}".format(
+                    action, r.host,
+                    r.seconds, "" if r.via is None else
+                    " (via {})".format(r.via)))
+            print("mpienv exec: INFO: distributed {} to {} hosts "
+                  "in {:.3f} sec ({} already had it)".format(
+                      path, len(results), time.time() - start,
+                      len([r for r in results if r.skipped])))
+
+        failed = [r for r in results if not r.ok]
+        for r in failed:
+            sys.stderr.write("mpienv: Error: failed to copy {} to {}: "
+                             "{}\n".format(path, r.host, r.error))
+        if len(failed) > 0:
+            exit(1)
 
     def run_cmd(self, cmd, extra_envs):
         envs = os.environ.copy()
@@ -395,64 +690,146 @@ class MpiBase(object):
         p.wait()
         exit(p.returncode)
 
-    def _generate_path(self):
-        env_path = os.environ.get('PATH', '').split(':')
-        # Remove all directory that contains 'mpiexec' from PATH
-        bin_dir = os.path.join(self.prefix, 'bin')
+    def _generate_path(self, removed=None, bin_dir=None):
+        # Remove directories of all the known MPIs from PATH
+        if bin_dir is None:
+            bin_dir = os.path.join(self.prefix, 'bin')
         assert os.path.exists(os.path.join(bin_dir, 'mpiexec'))
-        if bin_dir in env_path:
-            env_path.remove(bin_dir)
-        env_path = [bin_dir] + env_path
+        env_path, rm = pathenv.normalize(
+            pathenv.split(os.environ.get('PATH')),
+            mpienv.mpienv.known_mpi_dirs(), [bin_dir])
+        if removed is not None:
+            removed += [('PATH', p) for p in rm]
 
         return env_path
 
-    def _generate_ldlib(self):
-        env_ldlib = os.environ.get('LD_LIBRARY_PATH', '').split(':')
-
-        for dir_name in ['lib', 'lib64']:
-            lib_dir = os.path.join(self.prefix, dir_name)
-            if os.path.exists(lib_dir):
-                # Remove if lib_is already a part of LD_LIBRARY_PATH
-                # to avoid LD_LIBRARY_PATH is too long.
-                if lib_dir in env_ldlib:
-                    env_ldlib.remove(lib_dir)
-                env_ldlib = [lib_dir] + env_ldlib
+    def _lib_dirs(self):
+        """Library directories of the MPI, the probed one first
+
+        lib and lib64 of a prefix shared with other software (e.g. /usr)
+        are searched by the dynamic loader anyway, and are not included.
+        """
+        lib_dirs = []
+        if self._lib_dir is not None:
+            lib_dirs.append(os.path.normpath(self._lib_dir))
+        if os.path.normpath(self.prefix) not in pathenv.shared_prefixes():
+            lib_dirs += [os.path.join(self.prefix, d)
+                         for d in ['lib', 'lib64']]
+        return [d for i, d in enumerate(lib_dirs)
+                if os.path.exists(d) and d not in lib_dirs[:i]]
+
+    def _generate_ldlib(self, removed=None, lib_dirs=None):
+        # Remove directories of all the known MPIs from LD_LIBRARY_PATH
+        # so that the dynamic loader does not pick up a wrong libmpi.
+        if lib_dirs is None:
+            lib_dirs = self._lib_dirs()
+        env_ldlib, rm = pathenv.normalize(
+            pathenv.split(os.environ.get('LD_LIBRARY_PATH')),
+            mpienv.mpienv.known_mpi_dirs(), lib_dirs)
+        if removed is not None:
+            removed += [('LD_LIBRARY_PATH', p) for p in rm]
 
         return env_ldlib
 
-    def use(self, name, no_mpi4py=False):
-        # Check if the specified `name` is the same as the current one
-        try:
-            cur_name = mpienv.mpienv.config2['DEFAULT']['name']
-            cur_mpi4py = mpienv.mpienv.config2.getboolean('DEFAULT', 'mpi4py')
-            if cur_name == name and cur_mpi4py == (not no_mpi4py):
-                return
-        except KeyError:
-            pass
-
-        env_path = self._generate_path()
-        env_ldlib = self._generate_ldlib()
-
-        mpienv.mpienv.config2['DEFAULT']['active'] = name
-        mpienv.mpienv.config2['DEFAULT']['mpi4py'] = str(not no_mpi4py)
-        mpienv.mpienv.config_save()
-
-        print('export PATH={}'.format(':'.join(env_path)))
-        print('export LD_LIBRARY_PATH={}'.format(':'.join(env_ldlib)))
+    def use(self, name, no_mpi4py=False, default=False, verbose=False,
+            snapshot=False):
+        root_dir = self._conf['root_dir']
+        # With views, `current` is shared by all shells, so switching is
+        # always global.
+        view_mode = self._conf.get('activation') == 'view'
+
+        removed = []
+        env_path = self._generate_path(removed)
+        env_ldlib = self._generate_ldlib(removed)
+
+        # The active MPI is a property of the calling shell, so
+        # mpienv.ini is written only when the default is changed.
+        save_default = (view_mode or default or
+                        not mpienv.mpienv.config2.has_option(
+                            'DEFAULT', 'active'))
+        if save_default:
+            with mpienv.mpienv.transaction() as config:
+                config['DEFAULT']['active'] = name
+                config['DEFAULT']['mpi4py'] = str(not no_mpi4py)
 
         env = os.environ.copy()
         env['PATH'] = ':'.join(env_path)
         env['LD_LIBRARY_PATH'] = ':'.join(env_ldlib)
 
         py = MPI4Py(self._conf, name)
-        if not no_mpi4py:
-            if not py.is_installed():
-                py.install(env)
-            py.use()
+        if not no_mpi4py and not py.is_installed():
+            py.install(env)
+        pylib_dir = None if no_mpi4py else py.pylib_dir
+
+        if view_mode:
+            if not view.is_up_to_date(root_dir, name, self.mpiexec):
+                view.build_view(root_dir, name, self, py.pylib_dir)
+            view.switch_view(root_dir, name)
+
+            # PATH and LD_LIBRARY_PATH point to the constant `current`
+            current = view.current_path(root_dir)
+            bin_dir = os.path.join(current, 'bin')
+            lib_dirs = [os.path.join(current, 'lib'),
+                        os.path.join(current, 'lib64')]
+            removed = []
+            env_path = self._generate_path(removed, bin_dir)
+            env_ldlib = self._generate_ldlib(removed, lib_dirs)
+            if pylib_dir is not None:
+                pylib_dir = os.path.join(current, 'python')
+        elif self._conf.get('activation') == 'wrappers':
+            if not wrapper.is_up_to_date(root_dir, name, self.mpiexec):
+                wrapper.generate_wrappers(root_dir, name, self,
+                                          self._lib_dirs())
+
+            # The wrappers find libmpi without LD_LIBRARY_PATH
+            bin_dir = wrapper.bin_path(root_dir, name)
+            lib_dirs = []
+            removed = []
+            env_path = self._generate_path(removed, bin_dir)
+            env_ldlib = self._generate_ldlib(removed, lib_dirs)
         else:
+            bin_dir = os.path.join(self.prefix, 'bin')
+            lib_dirs = self._lib_dirs()
+
+        if verbose:
+            for var, p in removed:
+                sys.stderr.write("mpienv: Info: removed '{}' "
+                                 "from {}\n".format(p, var))
+
+        print('export PATH={}'.format(':'.join(env_path)))
+        if len(env_ldlib) > 0:
+            print('export LD_LIBRARY_PATH={}'.format(':'.join(env_ldlib)))
+        else:
+            print('unset LD_LIBRARY_PATH;')
+        if view_mode:
+            print('unset MPIENV_ACTIVE MPIENV_ACTIVE_FINGERPRINT '
+                  'MPIENV_MPI4PY;')
+        else:
+            print('export MPIENV_ACTIVE={}'.format(quote(name)))
+            print('export MPIENV_ACTIVE_FINGERPRINT={}'.format(
+                file_fingerprint(self.mpiexec)))
+            print('export MPIENV_MPI4PY={}'.format(0 if no_mpi4py else 1))
+
+        if no_mpi4py:
             # If --mpi4py is not specified, must modify PYTHONPATH
             # to remove mismatched path to mpi4py module
             py.clear()
+        elif view_mode:
+            pypath = [pylib_dir] + py.gen_pythonpath()[1:]
+            print("export PYTHONPATH={}".format(':'.join(pypath)))
+        else:
+            py.use()
+
+        if not (save_default or snapshot):
+            return
+
+        # Write the activation snapshot so that new shells can activate
+        # the default MPI without running mpienv.
+        write_snapshot(snapshot_path(root_dir), name,
+                       mpienv.mpienv.config_file_path(), self.mpiexec,
+                       bin_dir, lib_dirs, pylib_dir,
+                       strip_dirs=mpienv.mpienv.known_mpi_dirs(),
+                       per_shell=(not view_mode))
 
     def is_installed_by_mpienv(self):
         if self._name is None:
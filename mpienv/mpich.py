@@ -1,56 +1,24 @@
 # coding: utf-8
 import os
 import re
-from subprocess import check_output
-from subprocess import PIPE
-from subprocess import Popen
 import sys  # NOQA
 
 import mpienv.mpibase as mpibase
+from mpienv.probe import get_probe
+from mpienv.probe import search_mpi_h
 import mpienv.util as util
 
-try:
-    FileNotFoundError
-except NameError:
-    FileNotFoundError = IOError
 
-
-def find_mpi_h(mpiexec, ver_str=None):
+def find_mpi_h(mpiexec, ver_str=None, timeout=None):
     """Find mpi.h file from MPICH mpiexec binary"""
     if ver_str is None:
-        p = Popen([mpiexec, '--version'], stderr=PIPE, stdout=PIPE)
-        out, err = p.communicate()
-        ver_str = util.decode(out + err)
-
-    # Search prefix from configure options
-    line = next(ln for ln in ver_str.split("\n")
-                if re.search(r'Configure options', ln))
-    dir_cands = re.findall(r'--includedir=([^\' \n]+)', line)
-    inc_paths = re.findall(r'--includedir=([^\' \n]+)', line)
-    prefixes = [d for d in re.findall(r'--prefix=([^\' \n]+)', line)
-                if os.path.isdir(d)]
-
-    # Search prefix from the binary's path
-    m = re.match(r'^(.*)/bin/[^/]+$', mpiexec)
-    if m is not None:
-        incdir = m.group(1)
-        if os.path.isdir(incdir):
-            prefixes += [incdir]
-
-    dir_cands = set(inc_paths + [os.path.join(d, 'include') for d in prefixes])
-    try:
-        inc_dir = next(p for p in dir_cands
-                       if os.path.exists(os.path.join(p, 'mpi.h')))
-    except StopIteration:
-        raise FileNotFoundError(
-            "mpi.h not found in {}".format(",".join(dir_cands)))
-
-    return os.path.join(inc_dir, 'mpi.h')
-
-
-def find_prefix(mpiexec, info=None):
+        ver_str = get_probe(mpiexec, timeout).version_text
+    return search_mpi_h(mpiexec, ver_str)
+
+
+def find_prefix(mpiexec, info=None, timeout=None):
     if info is None:
-        info = _parse_mpich_version(mpiexec)
+        info = get_probe(mpiexec, timeout).mpich_version
 
     prefix = info['Configure options']['--prefix']
     if not os.path.isdir(prefix):
@@ -60,36 +28,8 @@ def find_prefix(mpiexec, info=None):
     return prefix
 
 
-def _parse_mpich_version(mpiexec):
-    out = util.decode(check_output([mpiexec, '--version']))
-
-    # Split the --version output into lines.
-    lines = out.split("\n")[1:]
-    lines = [ln.strip() for ln in lines]
-    d = {}
-    for ln in lines:
-        if len(ln.strip()) == 0:
-            continue
-        m = re.match(r'^([^:]*):\s*(\S.*)?$', ln)
-        if m is None:
-            print("Internal warning: m is None!!! ln='{}'".format(ln))
-        else:
-            d[m.group(1)] = m.group(2)
-
-    conf = re.findall(r'\'[^\']+\'', d['Configure options'])
-    conf = [re.sub(r'\'$', '', re.sub(r'^\'', '', c)) for c in conf]
-    d['Configure options'] = {}
-    for c in conf:
-        m = c.split('=')
-        if len(m) == 1:
-            m[1:] = [True]
-        d['Configure options'][m[0]] = m[1]
-    return d
-
-
-def _parse_mpich_mpicc_show(mpicc):
+def _parse_mpich_mpicc_show(out):
     """Obtain inc_dir and lib_dir by parsing `mpicc -show` of MPICH"""
-    out = util.decode(check_output([mpicc, '-show']))
     # returns inc_dir, lib_dir
     m = re.search(r'-I(\S+)', out)
     inc_dir = m.group(1)
@@ -101,7 +41,7 @@ def _parse_mpich_mpicc_show(mpicc):
 
 
 class Mpich(mpibase.MpiBase):
-    def __init__(self, mpiexec, conf, name=None):
+    def __init__(self, mpiexec, conf, name=None, probe=None):
         # `mpiexec` might be 'mpiexec' or 'mpiexec.mpich' etc.
         mpiexec = mpiexec
         mpicc = re.sub('mpiexec', 'mpicc', mpiexec)
@@ -109,13 +49,29 @@ class Mpich(mpibase.MpiBase):
         if not os.path.exists(mpicc):
             sys.stderr.write("mpicc does not exist: {}".format(mpicc))
 
-        info = _parse_mpich_version(mpiexec)
-        self._mpich_ver_info = info
-        inc_dir, lib_dir = _parse_mpich_mpicc_show(mpicc)
+        if probe is None:
+            probe = get_probe(mpiexec, conf.get('probe_timeout'))
+        self._probe = probe
+
+        static = probe.static
+        header = static.header if static is not None else None
+        if header is not None and 'MPICH_VERSION' in header:
+            # mpi.h and libmpi were found under the prefix of mpiexec
+            # (see mpienv/detect.py), so neither `mpiexec --version`
+            # nor `mpicc -show` is run.
+            inc_dir = os.path.dirname(header.path)
+            prefix = os.path.dirname(inc_dir)
+            lib_dir = static.lib_dir or os.path.join(prefix, 'lib')
+            version = header['MPICH_VERSION']
+            conf_params = None  # Read on demand (see conf_params)
+        else:
+            info = probe.mpich_version
+            inc_dir, lib_dir = _parse_mpich_mpicc_show(
+                probe.mpicc_show(mpicc))
+            prefix = find_prefix(mpiexec, info)
+            version = info['Version']
+            conf_params = info['Configure options']
 
-        prefix = find_prefix(mpiexec, info)
-        inc_dir = inc_dir
-        lib_dir = lib_dir
         super(Mpich, self).__init__(prefix, mpiexec, mpicc,
                                     inc_dir, lib_dir, conf, name)
 
@@ -124,10 +80,31 @@ class Mpich(mpibase.MpiBase):
         # Parse 'Configure options' section
         # Config options are like this:
         # '--disable-option-checking' '--prefix=NONE' '--enable-cuda'
-        self._conf_params = info['Configure options']
-        self._version = info['Version']
+        self._conf_params = conf_params
+        self._version = version
         self._default_name = "mpich-{}".format(self._version)
 
+    @property
+    def conf_params(self):
+        # Configure options are only available from `mpiexec --version`,
+        # which is run on first use.
+        if self._conf_params is None:
+            if getattr(self, '_probe', None) is None:
+                self._probe = get_probe(self.mpiexec,
+                                        self.conf.get('probe_timeout'))
+            self._conf_params = self._probe.conf_params
+        return self._conf_params
+
+    def _env_args(self, env):
+        # Hydra's mpiexec (also used by MVAPICH)
+        args = []
+        for name, value in env:
+            args += ['-genv', name, value]
+        return args
+
+    def _host_args(self, hostlist):
+        return ['-hosts', self._host_list_arg(hostlist)]
+
     def bin_files(self):
         # MPICH-specific files, which would not conflict with
         # other MPI implementations.
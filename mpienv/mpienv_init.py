@@ -27,89 +27,33 @@ function mpienv() {
     shift
 
     case "$command" in
-        "use" )
+        "use" | "restore" )
             {
-                eval "$(env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} $PYTHON -m mpienv.command.use $*)"  # NOQA
+                eval "$(env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} $PYTHON -m mpienv "$command" "$@")"  # NOQA
                 if [ -z "${BASH_VERSION:-}" -a ! -z "${ZSH_VERSION:-}" ]; then
                     rehash
                 fi
             }
             ;;
-        "add" )
-            {
-               env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                   $PYTHON -m mpienv.command.add $*
-            }
-            ;;
-        "restore" )
-            {
-                eval "$(env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} $PYTHON -m mpienv.command.restore $*)"  # NOQA
-                if [ -z "${BASH_VERSION:-}" -a ! -z "${ZSH_VERSION:-}" ]; then
-                    rehash
-                fi
-            }
-            ;;
-        "rm" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.rm "$@"
-            }
-            ;;
-        "describe" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.describe "$@"
-            }
-            ;;
-        "rename" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.rename "$@"
-            }
-            ;;
-        "list" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.list "$@"
-            }
-            ;;
-        "info" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.info "$@"
-            }
-            ;;
-        "autodiscover" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.autodiscover "$@"
-            }
-            ;;
-        "prefix" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.prefix "$@"
-            }
-            ;;
-        "exec" )
-            {
-                env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.exec "$@"
-            }
-            ;;
-        "help" )
+        * )
             {
                 env PYTHONPATH=$MPIENV_ROOT:${PYTHONPATH:-} \
-                    $PYTHON -m mpienv.command.help "$@"
+                    $PYTHON -m mpienv "$command" "$@"
             }
             ;;
-        * )
-            echo "mpienv [ERROR]: Unknown command '$command'"
-            ;;
     esac
 }
 
-mpienv restore
+# Activate the MPI from the snapshot written by `mpienv use`, which
+# does not launch Python. Fall back to `mpienv restore` if it is stale.
+__mpienv_snapshot_ok=
+if [ -f "$MPIENV_ROOT/shell/active.sh" ]; then
+    . "$MPIENV_ROOT/shell/active.sh"
+fi
+if [ -z "$__mpienv_snapshot_ok" ]; then
+    mpienv restore
+fi
+unset __mpienv_snapshot_ok
 """
 
 
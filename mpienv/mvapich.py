@@ -1,33 +1,33 @@
 # coding: utf-8
 import os.path
 import re
-from subprocess import check_output
 
 import mpienv.mpich as mpich
+from mpienv.probe import get_probe
 import mpienv.util as util
 
 
 class Mvapich(mpich.Mpich):
-    def __init__(self, *args):
-        super(Mvapich, self).__init__(*args)
+    _probe_attrs = mpich.Mpich._probe_attrs + ['_mpich_ver']
+
+    def __init__(self, mpiexec, conf, name=None, probe=None):
+        if probe is None:
+            probe = get_probe(mpiexec, conf.get('probe_timeout'))
+        super(Mvapich, self).__init__(mpiexec, conf, name, probe)
 
         self._type = 'MVAPICH'
-        mpi_h = mpich.find_mpi_h(self.mpiexec)
+        # mpi.h is taken from the static detection if available, so
+        # mpiexec is not run (see Probe.header)
+        mpi_h = probe.mpi_h
         if not os.path.exists(mpi_h):
             raise RuntimeError("Error: Cannot find {}".format(mpi_h))
 
-        mv_ver = check_output(['grep', '-E',
-                               'define *MVAPICH2_VERSION', mpi_h],
-                              stderr=util.DEVNULL)
-        mch_ver = check_output(['grep', '-E',
-                                'define *MPICH_VERSION', mpi_h],
-                               stderr=util.DEVNULL)
-
-        mv_ver = util.decode(mv_ver)
-        mch_ver = util.decode(mch_ver)
+        macros = probe.header
+        mv_ver = macros.get('MVAPICH2_VERSION', '')
+        mch_ver = macros.get('MPICH_VERSION', '')
 
-        mv_ver = re.search(r'"([.0-9]+(a\d*|b\d*|rc\d*)?)"', mv_ver).group(1)
-        mch_ver = re.search(r'"([.0-9]+)"', mch_ver).group(1)
+        mv_ver = re.search(r'([.0-9]+(a\d*|b\d*|rc\d*)?)', mv_ver).group(1)
+        mch_ver = re.search(r'([.0-9]+)', mch_ver).group(1)
 
         self._version = mv_ver
         self._mpich_ver = mch_ver
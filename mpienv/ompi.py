@@ -2,6 +2,8 @@
 
 import re
 
+import mpienv.util as util
+
 
 class OmpiInfo(object):
     def __init__(self):
@@ -28,18 +30,85 @@ def _parse_single_val(val):
     return val
 
 
+def _parse_line(line):
+    """Parse a line of `ompi_info --parsable` into (key, value)"""
+    line = line.strip()
+    if len(line) == 0:
+        return None
+    m = re.search(r'^(.*):([^:]+)?$', line)
+    if m is None:
+        return None
+
+    return m.group(1), _parse_single_val(m.group(2))
+
+
 def parse_ompi_info(out):
     info = OmpiInfo()
     lines = out.split("\n")
 
     for line in lines:
-        line = line.strip()
-        if len(line) == 0:
-            continue
-        m = re.search(r'^(.*):([^:]+)?$', line)
+        kv = _parse_line(line)
+        if kv is not None:
+            info.set(*kv)
+
+    return info
+
+
+def _query_args(key):
+    """ompi_info arguments of the section that contains `key`"""
+    fields = key.split(':')
+    if fields[0] == 'mca' and len(fields) > 2:
+        # mca:<framework>:<component>:param:<name>:value
+        return ['--parsable', '--param', fields[1], fields[2],
+                '--level', '9']
+    if fields[0] == 'path':
+        return ['--parsable', '--path', 'all']
+    # Versions, bindings etc. are in the default output
+    return ['--parsable']
+
+
+def parse_ompi_info_lines(lines, keys, info=None):
+    """Parse lines of `ompi_info --parsable` incrementally
+
+    Only `keys` are stored in the result and the parsing stops as soon
+    as all of them are found.
+    """
+    if info is None:
+        info = OmpiInfo()
+    rest = set(keys)
+    if len(rest) == 0:
+        return info
+
+    for line in lines:
+        kv = _parse_line(line)
+        if kv is not None and kv[0] in rest:
+            info.set(*kv)
+            rest.discard(kv[0])
+            if len(rest) == 0:
+                break
 
-        key, val = m.group(1), _parse_single_val(m.group(2))
+    return info
 
-        info.set(key, val)
+
+def query_ompi_info(ompi_info, keys, timeout=None):
+    """Ask ompi_info only for `keys`
+
+    Keys are grouped by the section of ompi_info they belong to, and
+    only the needed sections are queried. The output is parsed as it
+    is read from the pipe, and ompi_info is terminated once all the
+    keys in the section are found.
+    """
+    sections = {}
+    for key in keys:
+        sections.setdefault(tuple(_query_args(key)), []).append(key)
+
+    info = OmpiInfo()
+    for args, sect_keys in sorted(sections.items()):
+        lines = util.iter_output_lines([ompi_info] + list(args),
+                                       timeout=timeout)
+        try:
+            parse_ompi_info_lines(lines, sect_keys, info)
+        finally:
+            lines.close()
 
     return info
@@ -1,24 +1,50 @@
 # coding: utf-8
 import os.path
 import re
-from subprocess import check_output
 
 import mpienv.mpibase as mpibase
 from mpienv.ompi import parse_ompi_info
+from mpienv.probe import get_probe
 import mpienv.util as util
 
 
-def _call_ompi_info(bin):
+_cuda_key = 'mca:opal:base:param:opal_built_with_cuda_support:value'
+
+# ompi_info keys needed to construct an OpenMPI object
+_ompi_info_keys = [
+    'path:incdir',
+    'path:libdir',
+    'ompi:version:full',
+    'mpi-api:version:full',
+    'bindings:c',
+    'bindings:cxx',
+    'bindings:mpif.h',
+    _cuda_key,
+]
+
+
+def _check_ompi_info(bin):
     if not os.path.exists(bin):
         raise RuntimeError("ompi_info does not exist: {}".format(bin))
-    out = check_output([bin, '--all', '--parsable'], stderr=util.DEVNULL)
-    out = util.decode(out)
+
+
+def _call_ompi_info(bin, probe):
+    _check_ompi_info(bin)
+    return probe.ompi_info_query(bin, _ompi_info_keys)
+
+
+def _call_ompi_info_all(bin, probe):
+    _check_ompi_info(bin)
+    out = probe.ompi_info(bin, ['--all', '--parsable'])
 
     return parse_ompi_info(out)
 
 
 class OpenMPI(mpibase.MpiBase):
-    def __init__(self, mpiexec, conf, name=None):
+    _probe_attrs = mpibase.MpiBase._probe_attrs + [
+        '_mpi_version', '_c', '_cxx', '_fortran', '_cuda']
+
+    def __init__(self, mpiexec, conf, name=None, probe=None):
         # `mpiexec` might be 'mpiexec' or 'mpiexec.ompi'
         mpicc = re.sub('mpiexec', 'mpicc', mpiexec)
 
@@ -29,10 +55,12 @@ class OpenMPI(mpibase.MpiBase):
             os.path.join(os.path.dirname(mpiexec), os.path.pardir))
         ompi_info = os.path.join(prefix, 'bin', 'ompi_info')
 
-        info = _call_ompi_info(ompi_info)
+        if probe is None:
+            probe = get_probe(mpiexec, conf.get('probe_timeout'))
+        info = _call_ompi_info(ompi_info, probe)
 
-        inc_dir = info.get('path:incdir')
-        lib_dir = info.get('path:libdir')
+        inc_dir = info.get('path:incdir') or os.path.join(prefix, 'include')
+        lib_dir = info.get('path:libdir') or os.path.join(prefix, 'lib')
 
         super(OpenMPI, self).__init__(prefix, mpiexec, mpicc,
                                       inc_dir, lib_dir, conf, name)
@@ -53,18 +81,49 @@ class OpenMPI(mpibase.MpiBase):
         self._fortran = info.get('bindings:mpif.h')
         self._default_name = "openmpi-{}".format(ver)
 
-        self._cuda = info.get(
-            'mca:opal:base:param:opal_built_with_cuda_support')
+        self._cuda = info.get(_cuda_key)
+        self._probe = probe
+
+    def ompi_info_all(self):
+        """Full output of `ompi_info --all` including all MCA parameters
+
+        This is expensive and only run when explicitly requested.
+        """
+        ompi_info = os.path.join(self.prefix, 'bin', 'ompi_info')
+        if getattr(self, '_probe', None) is None:
+            self._probe = get_probe(self.mpiexec,
+                                    self.conf.get('probe_timeout'))
+        return _call_ompi_info_all(ompi_info, self._probe)
+
+    def _env_args(self, env):
+        args = []
+        for name, value in env:
+            args += ['-x', '{}={}'.format(name, value)]
+        return args
+
+    def _host_args(self, hostlist):
+        return ['-H', self._host_list_arg(hostlist)]
+
+    def _batch_args(self, mpi_args):
+        # Jobs sharing a host would be bound to the same cores, since
+        # each mpiexec binds its ranks from the first core
+        if any(a in ['--bind-to', '-bind-to'] for a in mpi_args):
+            return []
+        return ['--bind-to', 'none']
+
+    def probe_files(self):
+        files = super(OpenMPI, self).probe_files()
+        return files + [os.path.join(self._prefix, 'bin', 'ompi_info')]
 
     def bin_files(self):
         return util.glob_list([self.prefix, 'bin'],
                               ['ompi-*',
                                'ompi_*',
                                'orte*',
-                               'opal_'])
+                               'opal_*'])
 
     def lib_files(self):
-        return util.glob_list([self.prefix, 'bin'],
+        return util.glob_list([self.prefix, 'lib'],
                               ['libmpi*',
                                'libmca*',
                                'libompi*',
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""Normalization of PATH-like environment variables
+
+Switching MPIs used to leave the directories of previously active MPIs
+in PATH and LD_LIBRARY_PATH, so the dynamic loader could pick up a
+wrong libmpi. `normalize` removes the directories of all the known MPI
+installations, duplicates and empty entries (which mean the current
+directory), while keeping the order of the other entries.
+"""
+import os.path
+
+# Prefixes shared with other software. Their directories are never
+# removed even if an MPI is installed there (e.g. /usr/bin/mpiexec).
+SHARED_PREFIXES = [
+    "/",
+    "/usr",
+    "/usr/local",
+    "/opt/local",
+    os.path.expanduser("~"),
+    os.path.expanduser("~/local"),
+]
+
+
+def shared_prefixes():
+    return set(os.path.normpath(p) for p in SHARED_PREFIXES)
+
+
+def mpi_dirs(mpiexec):
+    """Return the bin/lib/lib64 directories of the MPI of `mpiexec`"""
+    shared = shared_prefixes()
+    prefixes = []
+    for ex in [os.path.abspath(mpiexec), os.path.realpath(mpiexec)]:
+        prefix = os.path.dirname(os.path.dirname(ex))
+        if prefix not in prefixes and prefix not in shared:
+            prefixes.append(prefix)
+
+    return [os.path.join(prefix, d)
+            for prefix in prefixes
+            for d in ['bin', 'lib', 'lib64']]
+
+
+def normalize(paths, known_dirs, prepend=None):
+    """Normalize the list of directories `paths`
+
+    Entries in `known_dirs` are removed, and `prepend` is put at the
+    head. Returns a tuple of the new list and the removed entries.
+    """
+    known = set(os.path.normpath(d) for d in known_dirs)
+    prepend = prepend or []
+
+    result = []
+    removed = []
+    seen = set()
+    for p in prepend:
+        key = os.path.normpath(p)
+        if key not in seen:
+            seen.add(key)
+            result.append(p)
+    for p in paths:
+        if p == '':
+            removed.append(p)
+            continue
+        key = os.path.normpath(p)
+        if key in seen:
+            # A duplicate, or a directory moved to the head
+            if key not in known:
+                removed.append(p)
+            continue
+        if key in known:
+            removed.append(p)
+            continue
+        seen.add(key)
+        result.append(p)
+
+    return result, removed
+
+
+def split(value):
+    if value is None or value == '':
+        return []
+    return value.split(':')
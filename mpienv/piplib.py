@@ -1,7 +1,6 @@
 # coding: utf-8
 
 import os
-import pip
 import re
 from subprocess import check_call
 from subprocess import check_output  # NOQA
@@ -16,6 +15,8 @@ _pip_ver = None
 def _get_pip_ver():
     global _pip_ver
 
+    # pip is imported only when needed because it is slow to import
+    import pip
     ver = pip.__version__
     m = re.match(r'(\d+)[.](\S+)', ver)
     major_ver = int(m.group(1))
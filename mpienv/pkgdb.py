@@ -0,0 +1,239 @@
+# coding: utf-8
+"""Readers of the metadata of package managers
+
+MPIs installed by Spack or EasyBuild are described by the package
+manager (prefix, version, compiler, variants), so they can be
+registered without running any of their commands. Each reader returns
+a list of records (dicts) with the following keys:
+
+ * package:  name of the package (e.g. 'openmpi')
+ * class:    name of the mpienv class of the MPI (e.g. 'OpenMPI')
+ * version:  version of the MPI
+ * prefix:   installation prefix
+ * compiler: compiler (or toolchain) used to build it, or None
+ * variants: build options, as a dict
+ * id:       identifier in the package manager (e.g. Spack's hash)
+ * source:   'spack' or 'easybuild'
+"""
+import glob
+import json
+import os
+import os.path
+import re
+
+# Package names of Spack and EasyBuild -> mpienv classes
+SPACK_PACKAGES = {
+    'mpich': 'Mpich',
+    'mvapich': 'Mvapich',
+    'mvapich2': 'Mvapich',
+    'openmpi': 'OpenMPI',
+}
+
+EASYBUILD_PACKAGES = {
+    'MPICH': 'Mpich',
+    'MVAPICH2': 'Mvapich',
+    'OpenMPI': 'OpenMPI',
+}
+
+# Compiler flags recorded by Spack as parameters, which are not variants
+_SPACK_FLAGS = set(['cflags', 'cppflags', 'cxxflags', 'fflags',
+                    'ldflags', 'ldlibs'])
+
+
+class PkgDbError(Exception):
+    pass
+
+
+def find_spack_db(path):
+    """Return the path of the install database of Spack under `path`"""
+    if os.path.isfile(path):
+        return path
+    for sub in ['opt/spack/.spack-db/index.json',
+                '.spack-db/index.json',
+                'index.json']:
+        db = os.path.join(path, sub)
+        if os.path.isfile(db):
+            return db
+    raise PkgDbError("Cannot find Spack's database in {}".format(path))
+
+
+def _spack_node(spec):
+    # Database version >= 6: a node with 'name'
+    # Older versions: {name: node}
+    if 'name' in spec:
+        return spec['name'], spec
+    if len(spec) == 1:
+        name, node = list(spec.items())[0]
+        if isinstance(node, dict):
+            return name, node
+    raise PkgDbError("Unknown spec format")
+
+
+def _spack_compiler(node):
+    compiler = node.get('compiler')
+    if not isinstance(compiler, dict):
+        return None
+    return "{}-{}".format(compiler.get('name'),
+                          compiler.get('version')).rstrip('-')
+
+
+def parse_spack_db(data):
+    """Return the records of MPIs in Spack's install database `data`"""
+    try:
+        installs = data['database']['installs']
+    except (KeyError, TypeError):
+        raise PkgDbError("Not a Spack database")
+
+    records = []
+    for dag_hash, rec in sorted(installs.items()):
+        if not rec.get('installed', True):
+            continue
+        name, node = _spack_node(rec.get('spec', {}))
+        if name not in SPACK_PACKAGES:
+            continue
+
+        prefix = rec.get('path')
+        if not prefix:
+            # Externals may have the prefix only in the spec
+            prefix = (node.get('external') or {}).get('path')
+        if not prefix:
+            continue
+
+        params = node.get('parameters', {})
+        variants = dict((k, v) for k, v in params.items()
+                        if k not in _SPACK_FLAGS)
+        records.append({
+            'package': name,
+            'class': SPACK_PACKAGES[name],
+            'version': str(node.get('version')),
+            'prefix': prefix,
+            'compiler': _spack_compiler(node),
+            'variants': variants,
+            'id': dag_hash,
+            'source': 'spack',
+        })
+    return records
+
+
+def read_spack_db(path):
+    """Return the records of MPIs installed by the Spack at `path`"""
+    db = find_spack_db(path)
+    try:
+        with open(db) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        raise PkgDbError("Cannot read {}: {}".format(db, e))
+    return parse_spack_db(data)
+
+
+def _eb_value(text, key):
+    m = re.search(r'^{}\s*=\s*([\'"])(.*?)\1'.format(key), text, re.M)
+    return m.group(2) if m is not None else None
+
+
+def parse_easyconfig(text):
+    """Return (version, toolchain, configopts) in an easyconfig file"""
+    version = _eb_value(text, 'version')
+
+    toolchain = None
+    m = re.search(r'^toolchain\s*=\s*(.*)$', text, re.M)
+    if m is not None:
+        name = re.search(r'[\'"]name[\'"]\s*:\s*[\'"]([^\'"]*)', m.group(1))
+        ver = re.search(r'[\'"]version[\'"]\s*:\s*[\'"]([^\'"]*)',
+                        m.group(1))
+        if name is not None and name.group(1) != 'system':
+            toolchain = name.group(1)
+            if ver is not None:
+                toolchain += '-' + ver.group(1)
+
+    configopts = _eb_value(text, 'configopts')
+    return version, toolchain, configopts
+
+
+def _easybuild_record(package, prefix):
+    # Installation directories are <software>/<name>/<version>[-<toolchain>]
+    dir_name = os.path.basename(os.path.normpath(prefix))
+    version, toolchain, configopts = dir_name, None, None
+
+    eb = os.path.join(prefix, 'easybuild', '{}-{}.eb'.format(package,
+                                                             dir_name))
+    if not os.path.exists(eb):
+        ebs = glob.glob(os.path.join(prefix, 'easybuild', '*.eb'))
+        eb = ebs[0] if len(ebs) > 0 else None
+    if eb is not None:
+        try:
+            with open(eb) as f:
+                version, toolchain, configopts = parse_easyconfig(f.read())
+        except (IOError, OSError):
+            pass
+        version = version or dir_name
+
+    variants = {}
+    if configopts:
+        variants['configopts'] = configopts
+    return {
+        'package': package.lower(),
+        'class': EASYBUILD_PACKAGES[package],
+        'version': version,
+        'prefix': prefix,
+        'compiler': toolchain,
+        'variants': variants,
+        'id': '{}/{}'.format(package, dir_name),
+        'source': 'easybuild',
+    }
+
+
+def _module_root(path):
+    # `root` in modules generated by EasyBuild:
+    #   local root = "/path"   (Lua)
+    #   set root /path         (Tcl)
+    try:
+        with open(path) as f:
+            text = f.read()
+    except (IOError, OSError):
+        return None
+    m = re.search(r'^\s*local\s+root\s*=\s*"([^"]+)"', text, re.M)
+    if m is None:
+        m = re.search(r'^\s*set\s+root\s+(\S+)', text, re.M)
+    return m.group(1) if m is not None else None
+
+
+def _easybuild_prefixes(path):
+    software = path
+    if os.path.isdir(os.path.join(path, 'software')):
+        software = os.path.join(path, 'software')
+
+    found = False
+    for package in sorted(EASYBUILD_PACKAGES):
+        for prefix in sorted(glob.glob(os.path.join(software, package, '*'))):
+            if os.path.isdir(os.path.join(prefix, 'easybuild')):
+                found = True
+                yield package, prefix
+    if found:
+        return
+
+    # Otherwise `path` is a module tree (e.g. <installpath>/modules/all)
+    for dir_path, dirs, files in os.walk(path):
+        package = os.path.basename(dir_path)
+        if package not in EASYBUILD_PACKAGES:
+            continue
+        del dirs[:]
+        for name in sorted(files):
+            root = _module_root(os.path.join(dir_path, name))
+            if root is not None:
+                yield package, root
+
+
+def read_easybuild(path):
+    """Return the records of MPIs installed by EasyBuild
+
+    `path` is the install path of EasyBuild (which has `software`), the
+    software directory or a module tree.
+    """
+    if not os.path.isdir(path):
+        raise PkgDbError("No such directory: {}".format(path))
+    records = []
+    for package, prefix in _easybuild_prefixes(path):
+        if not any(r['prefix'] == prefix for r in records):
+            records.append(_easybuild_record(package, prefix))
+    return records
@@ -0,0 +1,176 @@
+# coding: utf-8
+import os
+import os.path
+import re
+import threading
+
+from mpienv.detect import detect_static
+from mpienv.header import scan_mpi_h
+from mpienv.ompi import query_ompi_info
+import mpienv.util as util
+
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
+
+
+def parse_mpich_version(ver_str):
+    """Parse the output of MPICH's `mpiexec --version`"""
+    # Split the --version output into lines.
+    lines = ver_str.split("\n")[1:]
+    lines = [ln.strip() for ln in lines]
+    d = {}
+    for ln in lines:
+        if len(ln.strip()) == 0:
+            continue
+        m = re.match(r'^([^:]*):\s*(\S.*)?$', ln)
+        if m is None:
+            print("Internal warning: m is None!!! ln='{}'".format(ln))
+        else:
+            d[m.group(1)] = m.group(2)
+
+    conf = re.findall(r'\'[^\']+\'', d['Configure options'])
+    conf = [re.sub(r'\'$', '', re.sub(r'^\'', '', c)) for c in conf]
+    d['Configure options'] = {}
+    for c in conf:
+        m = c.split('=')
+        if len(m) == 1:
+            m[1:] = [True]
+        d['Configure options'][m[0]] = m[1]
+    return d
+
+
+def search_mpi_h(mpiexec, ver_str):
+    """Find mpi.h file from MPICH mpiexec binary and its --version output"""
+    # Search prefix from configure options
+    line = next(ln for ln in ver_str.split("\n")
+                if re.search(r'Configure options', ln))
+    inc_paths = re.findall(r'--includedir=([^\' \n]+)', line)
+    prefixes = [d for d in re.findall(r'--prefix=([^\' \n]+)', line)
+                if os.path.isdir(d)]
+
+    # Search prefix from the binary's path
+    m = re.match(r'^(.*)/bin/[^/]+$', mpiexec)
+    if m is not None:
+        incdir = m.group(1)
+        if os.path.isdir(incdir):
+            prefixes += [incdir]
+
+    dir_cands = set(inc_paths + [os.path.join(d, 'include') for d in prefixes])
+    try:
+        inc_dir = next(p for p in dir_cands
+                       if os.path.exists(os.path.join(p, 'mpi.h')))
+    except StopIteration:
+        raise FileNotFoundError(
+            "mpi.h not found in {}".format(",".join(dir_cands)))
+
+    return os.path.join(inc_dir, 'mpi.h')
+
+
+class Probe(object):
+    """Results of external tools run against a single MPI installation
+
+    Each tool runs at most once, and the result is shared by MPI type
+    detection and the constructors of MPI classes.
+    """
+
+    def __init__(self, mpiexec, timeout=None):
+        self._mpiexec = mpiexec
+        self._timeout = timeout
+        self._results = {}
+        self._lock = threading.RLock()
+
+    @property
+    def mpiexec(self):
+        return self._mpiexec
+
+    def _memo(self, key, func):
+        with self._lock:
+            if key not in self._results:
+                self._results[key] = func()
+            return self._results[key]
+
+    def _env(self):
+        # Add LD_LIBRARY_PATH
+        bin_dir = os.path.dirname(self._mpiexec)
+        lib_dir = os.path.abspath(os.path.join(bin_dir, os.pardir, 'lib'))
+
+        env = os.environ.copy()
+        ld_lib_path = [lib_dir] + env.get('LD_LIBRARY_PATH', '').split(':')
+        env['LD_LIBRARY_PATH'] = ':'.join(ld_lib_path)
+        return env
+
+    @property
+    def static(self):
+        """Flavor detected from files without running anything, or None"""
+        return self._memo('static', lambda: detect_static(self._mpiexec))
+
+    @property
+    def version_text(self):
+        """Output of `mpiexec --version` (stdout and stderr)"""
+        def run():
+            _, out, err = util.communicate([self._mpiexec, '--version'],
+                                           timeout=self._timeout,
+                                           env=self._env())
+            return util.decode(out + err)
+        return self._memo('version_text', run)
+
+    @property
+    def mpich_version(self):
+        """Parsed `mpiexec --version` of MPICH, including configure options"""
+        return self._memo('mpich_version',
+                          lambda: parse_mpich_version(self.version_text))
+
+    @property
+    def conf_params(self):
+        return self.mpich_version['Configure options']
+
+    @property
+    def mpi_h(self):
+        static = self.static
+        if static is not None and static.header is not None:
+            return static.header.path
+        return self._memo('mpi_h', lambda: search_mpi_h(self._mpiexec,
+                                                        self.version_text))
+
+    @property
+    def header(self):
+        """Version macros defined in mpi.h (see mpienv.header)"""
+        static = self.static
+        if static is not None and static.header is not None:
+            return static.header
+        return self._memo('header', lambda: scan_mpi_h(self.mpi_h))
+
+    def mpicc_show(self, mpicc):
+        """Output of `mpicc -show`"""
+        return self._memo(
+            ('mpicc_show', mpicc),
+            lambda: util.decode(util.check_output([mpicc, '-show'],
+                                                  timeout=self._timeout)))
+
+    def ompi_info_query(self, ompi_info, keys):
+        """Values of `keys` queried from ompi_info (see mpienv.ompi)"""
+        return self._memo(
+            ('ompi_info_query', ompi_info, tuple(sorted(keys))),
+            lambda: query_ompi_info(ompi_info, keys, self._timeout))
+
+    def ompi_info(self, ompi_info, args):
+        """Output of `ompi_info <args>`"""
+        return self._memo(
+            ('ompi_info', ompi_info, tuple(args)),
+            lambda: util.decode(util.check_output([ompi_info] + list(args),
+                                                  timeout=self._timeout,
+                                                  stderr=util.DEVNULL)))
+
+
+_probes = {}
+_probes_lock = threading.Lock()
+
+
+def get_probe(mpiexec, timeout=None):
+    """Return the per-process Probe object of `mpiexec`"""
+    with _probes_lock:
+        if mpiexec not in _probes:
+            _probes[mpiexec] = Probe(mpiexec, timeout)
+        return _probes[mpiexec]
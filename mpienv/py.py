@@ -31,14 +31,18 @@ class PyModule(object):
         self._name = name
         self._conf = conf
 
-        if not os.path.exists(self._pylib_dir):
-            mkdir_p(self._pylib_dir)
+    @property
+    def pylib_dir(self):
+        return self._pylib_dir
 
     def is_installed(self):
         libs = glob.glob(os.path.join(self._pylib_dir, self._libname, '*.so'))
         return len(libs) > 0
 
     def install(self, env):
+        for d in [self._pylib_dir, self._pybuild_dir]:
+            if not os.path.exists(d):
+                mkdir_p(d)
         sys.stderr.write(
             "Installing {} using pip...".format(self._libname))
         sys.stderr.flush()
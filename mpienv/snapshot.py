@@ -0,0 +1,118 @@
+# coding: utf-8
+"""Precomputed shell snapshot of the active MPI
+
+`mpienv use` writes a shell script that activates the MPI without
+running Python. The script sourced by the init hook (see mpienv_init)
+checks its validation stamps first, and sets `__mpienv_snapshot_ok`
+only if the snapshot is up to date. Otherwise, the hook falls back to
+`mpienv restore`.
+"""
+import os
+import os.path
+import sys
+
+from mpienv.cache import file_fingerprint
+
+
+def snapshot_path(root_dir):
+    return os.path.join(root_dir, 'shell', 'active.sh')
+
+
+def _quote(s):
+    """Quote `s` for POSIX shells"""
+    return "'" + s.replace("'", "'\\''") + "'"
+
+
+def _strip(var, dirs):
+    # Remove `dirs` from `var`
+    return ('__mpienv_p=":${{{var}:-}}:"\n'
+            '    for __mpienv_d in {dirs}; do\n'
+            '        while :; do\n'
+            '            case "$__mpienv_p" in\n'
+            '                *:"$__mpienv_d":*) __mpienv_p='
+            '"${{__mpienv_p%%:"$__mpienv_d":*}}:'
+            '${{__mpienv_p#*:"$__mpienv_d":}}" ;;\n'
+            '                *) break ;;\n'
+            '            esac\n'
+            '        done\n'
+            '    done\n'
+            '    __mpienv_p=${{__mpienv_p#:}}\n'
+            '    {var}=${{__mpienv_p%:}}').format(
+                var=var, dirs=' '.join(_quote(d) for d in dirs))
+
+
+def _prepend(var, path):
+    # Prepend `path` to `var` unless it is already a part of it
+    return ('case ":${{{var}:-}}:" in\n'
+            '        *:{p}:*) ;;\n'
+            '        *) export {var}={p}"${{{var}:+:${var}}}" ;;\n'
+            '    esac').format(var=var, p=_quote(path))
+
+
+def generate_snapshot(path, name, ini_path, mpiexec,
+                      bin_dir, lib_dirs, pylib_dir=None, strip_dirs=None,
+                      per_shell=True):
+    """Generate the contents of the snapshot script
+
+    Directories in `strip_dirs` (those of the other MPIs) are removed
+    from PATH and LD_LIBRARY_PATH before activation. If `per_shell` is
+    False (i.e. with views), the active MPI is not recorded in the
+    environment.
+    """
+    # Validation stamps. The snapshot is stale if the Python interpreter
+    # differs, the MPI is removed, or the configuration or mpiexec is
+    # modified after the snapshot is written.
+    stamps = [
+        '[ "${{PYTHON:-}}" = {} ]'.format(_quote(sys.executable)),
+        '[ -x {} ]'.format(_quote(mpiexec)),
+        '[ ! {} -nt {} ]'.format(_quote(ini_path), _quote(path)),
+        '[ ! {} -nt {} ]'.format(_quote(mpiexec), _quote(path)),
+    ]
+    if pylib_dir is not None:
+        stamps.append('[ -d {} ]'.format(_quote(pylib_dir)))
+
+    lines = [
+        "# Generated by `mpienv use`. Do not edit.",
+        "# Activation snapshot of '{}'".format(name),
+        "if " + " \\\n   && ".join(stamps) + "; then",
+    ]
+    if strip_dirs:
+        lines.append("    " + _strip('PATH', strip_dirs))
+        lines.append("    " + _strip('LD_LIBRARY_PATH', strip_dirs))
+        lines.append("    unset __mpienv_p __mpienv_d")
+    lines.append("    " + _prepend('PATH', bin_dir))
+    for lib_dir in reversed(lib_dirs):
+        lines.append("    " + _prepend('LD_LIBRARY_PATH', lib_dir))
+    if pylib_dir is not None:
+        lines.append("    " + _prepend('PYTHONPATH', pylib_dir))
+    if per_shell:
+        lines += [
+            "    export MPIENV_ACTIVE={}".format(_quote(name)),
+            "    export MPIENV_ACTIVE_FINGERPRINT={}".format(
+                file_fingerprint(mpiexec)),
+            "    export MPIENV_MPI4PY={}".format(
+                0 if pylib_dir is None else 1),
+        ]
+    lines += [
+        "    __mpienv_snapshot_ok=1",
+        "fi",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def write_snapshot(path, *args, **kwargs):
+    """Write the snapshot script to `path` atomically"""
+    dir_name = os.path.dirname(path)
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(generate_snapshot(path, *args, **kwargs))
+    os.rename(tmp, path)
+
+
+def remove_snapshot(path):
+    if os.path.exists(path):
+        os.remove(path)
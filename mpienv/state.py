@@ -0,0 +1,86 @@
+# coding: utf-8
+"""Compiled read-only snapshot of the mpienv state
+
+Parsing mpienv.ini and config.json, and creating the directories under
+MPIENV_ROOT on every invocation puts a lot of metadata load on shared
+file systems when many processes start at once. Mutating commands write
+everything the hot path needs into a single versioned and checksummed
+JSON file, which is loaded with a single read. The snapshot is valid
+only while mpienv.ini and config.json are unchanged.
+"""
+import hashlib
+import json
+import os
+import os.path
+
+from mpienv.cache import file_stamp
+
+FORMAT = 1
+
+
+def state_path(root_dir):
+    return os.path.join(root_dir, 'state.json')
+
+
+def _checksum(payload):
+    text = json.dumps(payload, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def load_state(path, sources):
+    """Load the compiled state, or return None if it is missing or stale
+
+    `sources` is the list of files the state is compiled from.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get('format') != FORMAT:
+        return None
+
+    payload = data.get('payload')
+    if payload is None or data.get('checksum') != _checksum(payload):
+        return None
+
+    stamps = payload.get('stamps', {})
+    if sorted(stamps.keys()) != sorted(sources):
+        return None
+    for src in sources:
+        if file_stamp(src) != stamps[src]:
+            return None
+
+    return payload
+
+
+def save_state(path, sources, sections, conf, probe):
+    """Write the compiled state atomically as a read-only file"""
+    payload = {
+        'stamps': dict((src, file_stamp(src)) for src in sources),
+        'sections': sections,
+        'conf': conf,
+        'probe': probe,
+    }
+    data = {
+        'format': FORMAT,
+        'checksum': _checksum(payload),
+        'payload': payload,
+    }
+
+    tmp = "{}.{}.{}.tmp".format(path, os.uname()[1], os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+        os.chmod(tmp, 0o444)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        # The compiled state is just an optimization.
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def remove_state(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,55 @@
+# coding: utf-8
+"""Concurrency-safe storage of mpienv.ini
+
+Readers never lock: writers replace the file atomically with rename(2),
+so a reader sees either the old or the new contents, never a truncated
+file. Writers serialize on an advisory lock (a separate `.lock` file)
+and re-read the ini under the lock, so concurrent updates are not lost.
+
+The ini format itself is unchanged, so existing installations keep
+working without any migration. (SQLite was considered, but its WAL mode
+is not safe on NFS, where MPIENV_ROOT often lives on clusters.)
+"""
+from configparser import ConfigParser
+import contextlib
+import os
+import os.path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on `path`"""
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_ini(path):
+    config = ConfigParser()
+    if os.path.exists(path):
+        config.read(path)
+    return config
+
+
+def write_ini(path, config):
+    """Write `config` to `path` atomically"""
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            config.write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -3,7 +3,13 @@ import glob
 import json
 import os.path
 import re
+import shutil
+from subprocess import CalledProcessError
+from subprocess import PIPE
+from subprocess import Popen
 import sys
+import tempfile
+import threading
 
 try:
     from subprocess import DEVNULL  # py3k
@@ -24,6 +30,57 @@ def glob_list(dire, pat_list):
     return [item for sublist in lol for item in sublist]
 
 
+def make_version_dir(path):
+    """Create and return a new, empty version of directory `path`
+
+    The version is `<path>.<suffix>`, next to `path`, and is published
+    with `switch_dir(path, version)` once it is complete.
+    """
+    parent = os.path.dirname(path)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    version = tempfile.mkdtemp(prefix=os.path.basename(path) + '.',
+                               dir=parent)
+    os.chmod(version, 0o755)
+    return version
+
+
+def switch_dir(path, version):
+    """Point the symlink `path` to the directory `version` atomically
+
+    The directory `path` pointed to before is removed afterwards, so
+    readers always see a complete directory at `path`, either the old
+    one or the new one.
+    """
+    old = None
+    if os.path.islink(path):
+        old = os.path.join(os.path.dirname(path), os.readlink(path))
+    elif os.path.isdir(path):
+        # A plain directory left by an older version of mpienv
+        shutil.rmtree(path)
+
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    # A relative link keeps working if MPIENV_ROOT is moved
+    os.symlink(os.path.basename(version), tmp)
+    os.rename(tmp, path)
+
+    if old is not None and os.path.realpath(old) != \
+            os.path.realpath(version):
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def remove_dir(path):
+    """Remove `path` and the directory it points to, if it is a symlink"""
+    if os.path.islink(path):
+        target = os.path.join(os.path.dirname(path), os.readlink(path))
+        os.remove(path)
+        shutil.rmtree(target, ignore_errors=True)
+    elif os.path.exists(path):
+        shutil.rmtree(path)
+
+
 def escape_shell_commands(cmds):
     new_cmds = []
 
@@ -59,3 +116,96 @@ def dump_json(obj):
         return json.dumps(obj)
     except TypeError:
         return obj.to_dict()
+
+
+class ProbeTimeout(RuntimeError):
+    """Raised when an external command does not finish in time"""
+    pass
+
+
+def communicate(cmd, timeout=None, env=None, stdout=PIPE, stderr=PIPE):
+    """Run `cmd` and return (returncode, stdout, stderr).
+
+    If `timeout` (in seconds) is given, the process is killed after the
+    time limit and ProbeTimeout is raised.
+    """
+    p = Popen(cmd, stdout=stdout, stderr=stderr, env=env)
+
+    # Popen.communicate() of Python 2 does not support timeout,
+    # so we kill the process from a timer thread.
+    expired = []
+    timer = None
+    if timeout:
+        def _kill():
+            expired.append(True)
+            try:
+                p.kill()
+            except OSError:
+                pass
+        timer = threading.Timer(timeout, _kill)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        out, err = p.communicate()
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if expired:
+        raise ProbeTimeout("'{}' did not respond in {} seconds".format(
+            ' '.join(cmd), timeout))
+
+    return p.returncode, out, err
+
+
+def check_output(cmd, timeout=None, env=None, stderr=None):
+    """subprocess.check_output() with a timeout"""
+    ret, out, _ = communicate(cmd, timeout=timeout, env=env, stderr=stderr)
+    if ret != 0:
+        raise CalledProcessError(ret, cmd)
+    return out
+
+
+def iter_output_lines(cmd, timeout=None, env=None):
+    """Yield lines of the standard output of `cmd` as they are produced.
+
+    The process is killed when the caller stops the iteration early or
+    when `timeout` (in seconds) expires, in which case ProbeTimeout is
+    raised.
+    """
+    p = Popen(cmd, stdout=PIPE, stderr=DEVNULL, env=env)
+
+    expired = []
+
+    def _kill():
+        if p.poll() is None:
+            try:
+                p.kill()
+            except OSError:
+                pass
+
+    def _expire():
+        expired.append(True)
+        _kill()
+
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, _expire)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        for line in iter(p.stdout.readline, b''):
+            yield decode(line)
+        p.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        _kill()
+        p.stdout.close()
+        p.wait()
+
+    if expired:
+        raise ProbeTimeout("'{}' did not respond in {} seconds".format(
+            ' '.join(cmd), timeout))
@@ -0,0 +1,105 @@
+# coding: utf-8
+"""Symlink-farm views of MPI installations
+
+Each registered MPI gets a view directory, $MPIENV_ROOT/views/<name>,
+which mirrors its bin, lib, include and libexec directories with
+symlinks. $MPIENV_ROOT/current is a symlink to the view of the active
+MPI, so PATH and LD_LIBRARY_PATH only need one constant entry each
+($MPIENV_ROOT/current/bin and $MPIENV_ROOT/current/lib), and switching
+the MPI is a single rename(2) that new shells and ssh sessions see
+without re-sourcing anything.
+
+views/<name> is itself a symlink to a version directory
+(views/<name>.<suffix>), so a view is rebuilt without ever being
+missing.
+"""
+import os
+import os.path
+import shutil
+
+from mpienv.cache import file_fingerprint
+from mpienv.util import make_version_dir
+from mpienv.util import remove_dir
+from mpienv.util import switch_dir
+
+# File in a view that records the mpiexec it was built from
+_STAMP = '.mpiexec'
+
+
+def views_dir(root_dir):
+    return os.path.join(root_dir, 'views')
+
+
+def view_path(root_dir, name):
+    return os.path.join(views_dir(root_dir), name)
+
+
+def current_path(root_dir):
+    return os.path.join(root_dir, 'current')
+
+
+def current_name(root_dir):
+    """Return the name of the MPI `current` points to, or None"""
+    try:
+        return os.path.basename(os.readlink(current_path(root_dir)))
+    except OSError:
+        return None
+
+
+def is_up_to_date(root_dir, name, mpiexec):
+    try:
+        with open(os.path.join(view_path(root_dir, name), _STAMP)) as f:
+            return f.read() == file_fingerprint(mpiexec)
+    except (IOError, OSError):
+        return False
+
+
+def build_view(root_dir, name, mpi, pylib_dir=None):
+    """(Re)build the view of `mpi`
+
+    The view is built into a new version directory and then published
+    by switching the `views/<name>` symlink, so `current` never points
+    to a missing or partially built view.
+    """
+    tmp = make_version_dir(view_path(root_dir, name))
+    try:
+        mpi.mirror_to(tmp)
+        if pylib_dir is not None:
+            os.symlink(pylib_dir, os.path.join(tmp, 'python'))
+        with open(os.path.join(tmp, _STAMP), 'w') as f:
+            f.write(file_fingerprint(mpi.mpiexec))
+        switch_dir(view_path(root_dir, name), tmp)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def switch_view(root_dir, name):
+    """Point `current` to the view of `name` atomically"""
+    link = current_path(root_dir)
+    tmp = "{}.{}.tmp".format(link, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    # A relative link keeps working if MPIENV_ROOT is moved
+    os.symlink(os.path.join('views', name), tmp)
+    os.rename(tmp, link)
+
+
+def remove_view(root_dir, name):
+    remove_dir(view_path(root_dir, name))
+
+
+def rename_view(root_dir, name_from, name_to, pylib_dir):
+    path = view_path(root_dir, name_from)
+    if not os.path.lexists(path):
+        return
+    os.rename(path, view_path(root_dir, name_to))
+
+    # mpi4py is moved together with the MPI
+    link = os.path.join(view_path(root_dir, name_to), 'python')
+    if os.path.lexists(link):
+        os.remove(link)
+        os.symlink(pylib_dir, link)
+
+    if current_name(root_dir) == name_from:
+        switch_view(root_dir, name_to)
@@ -0,0 +1,169 @@
+# coding: utf-8
+"""Launch wrappers that need no LD_LIBRARY_PATH
+
+For each command of an MPI (mpiexec, mpicc, ...), a wrapper is put in
+$MPIENV_ROOT/wrappers/<name>/bin:
+
+ * Binaries whose RPATH/RUNPATH already covers the MPI's library
+   directories, and scripts, are just symlinked.
+ * Other binaries are started through the dynamic loader with
+   `--library-path`, which applies to that process only and is not
+   inherited by its children (setuid launchers ignore LD_LIBRARY_PATH
+   anyway).
+ * Compiler wrappers add `-Wl,-rpath` so that the programs they build
+   find libmpi with a single directory search.
+
+The environment of the user is left untouched.
+"""
+import glob
+import os
+import os.path
+import shutil
+
+from mpienv.cache import file_fingerprint
+from mpienv.elf import ElfError
+from mpienv.elf import ElfFile
+import mpienv.pathenv as pathenv
+from mpienv.util import make_version_dir
+from mpienv.util import remove_dir
+from mpienv.util import switch_dir
+
+COMPILERS = ['mpicc', 'mpicxx', 'mpic++', 'mpiCC',
+             'mpif77', 'mpif90', 'mpifort']
+
+# Marker written in generated scripts, followed by the wrapped command
+_MARKER = '# mpienv-wrapper: '
+
+# File that records the mpiexec the wrappers were generated from
+_STAMP = '.mpiexec'
+
+
+def wrappers_path(root_dir, name):
+    return os.path.join(root_dir, 'wrappers', name)
+
+
+def bin_path(root_dir, name):
+    return os.path.join(wrappers_path(root_dir, name), 'bin')
+
+
+def _quote(s):
+    return "'" + s.replace("'", "'\\''") + "'"
+
+
+def wrapped_command(path):
+    """Return the command wrapped by the script `path`, or `path`"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(512).decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return path
+    for line in head.splitlines()[:3]:
+        if line.startswith(_MARKER):
+            return line[len(_MARKER):]
+    return path
+
+
+def _covers(paths, exe, lib_dirs):
+    origin = os.path.dirname(os.path.realpath(exe))
+    dirs = set(os.path.normpath(p.replace('$ORIGIN', origin)
+                                .replace('${ORIGIN}', origin))
+               for p in paths)
+    return all(os.path.normpath(d) in dirs for d in lib_dirs)
+
+
+def _inspect(exe, lib_dirs):
+    """Return the dynamic loader to run `exe` with, or None"""
+    try:
+        with ElfFile(os.path.realpath(exe)) as elf:
+            if elf.interp is None:
+                return None  # Statically linked
+            if _covers(elf.rpath + elf.runpath, exe, lib_dirs):
+                return None
+            return elf.interp
+    except (ElfError, IOError, OSError):
+        return None  # Scripts etc.
+
+
+def _write_script(path, cmd, lines):
+    with open(path, 'w') as f:
+        f.write("#!/bin/sh\n")
+        f.write(_MARKER + cmd + "\n")
+        f.write("# Generated by mpienv. Do not edit.\n")
+        f.write("\n".join(lines) + "\n")
+    os.chmod(path, 0o755)
+
+
+def _generate(dst_dir, cmd, lib_dirs):
+    dst = os.path.join(dst_dir, os.path.basename(cmd))
+    lib_path = ':'.join(lib_dirs)
+
+    if os.path.basename(cmd) in COMPILERS and len(lib_dirs) > 0:
+        rpath = ' '.join("-Wl,-rpath,{}".format(_quote(d))
+                         for d in lib_dirs)
+        _write_script(dst, cmd, ['exec {} "$@" {}'.format(_quote(cmd),
+                                                          rpath)])
+        return
+
+    loader = _inspect(cmd, lib_dirs) if len(lib_dirs) > 0 else None
+    if loader is None:
+        os.symlink(cmd, dst)
+    else:
+        _write_script(dst, cmd, [
+            'exec {} --library-path {} {} "$@"'.format(
+                _quote(loader), _quote(lib_path), _quote(cmd))])
+
+
+def is_up_to_date(root_dir, name, mpiexec):
+    stamp = os.path.join(wrappers_path(root_dir, name), _STAMP)
+    try:
+        with open(stamp) as f:
+            return f.read() == file_fingerprint(mpiexec)
+    except (IOError, OSError):
+        return False
+
+
+def wrapped_commands(mpi):
+    """Return the commands of `mpi` to wrap
+
+    If the prefix is shared with other software (e.g. /usr), only the
+    MPI's own files are, since bin/mpi* may match unrelated tools.
+    """
+    cmds = mpi.bin_files()
+    if os.path.normpath(mpi.prefix) in pathenv.shared_prefixes():
+        cmds += [mpi.mpiexec, mpi.mpicc, mpi.mpicxx]
+    else:
+        bin_dir = os.path.join(mpi.prefix, 'bin')
+        cmds += glob.glob(os.path.join(bin_dir, 'mpi*'))
+    return sorted(set(cmds))
+
+
+def generate_wrappers(root_dir, name, mpi, lib_dirs):
+    """(Re)generate the wrappers of `mpi`
+
+    Like views (see mpienv/view.py), the wrappers are generated into a
+    new version directory and published by switching a symlink.
+    """
+    tmp = make_version_dir(wrappers_path(root_dir, name))
+    try:
+        tmp_bin = os.path.join(tmp, 'bin')
+        os.makedirs(tmp_bin)
+        cmds = wrapped_commands(mpi)
+        for cmd in cmds:
+            if os.path.isfile(cmd) and os.access(cmd, os.X_OK):
+                _generate(tmp_bin, cmd, lib_dirs)
+        with open(os.path.join(tmp, _STAMP), 'w') as f:
+            f.write(file_fingerprint(mpi.mpiexec))
+        switch_dir(wrappers_path(root_dir, name), tmp)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def remove_wrappers(root_dir, name):
+    remove_dir(wrappers_path(root_dir, name))
+
+
+def rename_wrappers(root_dir, name_from, name_to):
+    path = wrappers_path(root_dir, name_from)
+    if os.path.lexists(path):
+        os.rename(path, wrappers_path(root_dir, name_to))
@@ -0,0 +1,86 @@
+# coding: utf-8
+
+import time
+
+from mpienv.batch import format_summary
+from mpienv.batch import job_size
+from mpienv.batch import read_batch
+from mpienv.batch import run_batch
+from mpienv.batch import SlotPool
+from mpienv.hosts import HostList
+
+
+def test_read_batch():
+    jobs = read_batch(["# parameter sweep\n",
+                       "-n 4 ./sim --param 1\n",
+                       "\n",
+                       "-np 2 ./sim --param 'a b'  # second\n",
+                       "./post\n"])
+    assert [j.index for j in jobs] == [1, 2, 3]
+    assert jobs[1].args == ['-np', '2', './sim', '--param', 'a b']
+    assert [j.np for j in jobs] == [4, 2, 1]
+    assert job_size(['-x', 'A=1', '-n', '8', 'a.out']) == 8
+
+
+def test_slot_pool():
+    hl = HostList()
+    hl.add('n1', 2)
+    hl.add('n2', 2)
+    pool = SlotPool(hl)
+    assert pool.total == 4
+
+    a = pool.allocate(3)
+    assert list(a.items()) == [('n1', 2), ('n2', 1)]
+    assert pool.allocate(2) is None
+    b = pool.allocate(1)
+    assert list(b.items()) == [('n2', 1)]
+    pool.release(a)
+    assert list(pool.allocate(2).items()) == [('n1', 2)]
+
+    # A job larger than the pool gets all the slots when it is free
+    pool = SlotPool(HostList(['n1', 'n2']))
+    assert list(pool.allocate(5).items()) == [('n1', 1), ('n2', 1)]
+    assert pool.allocate(1) is None
+
+    pool = SlotPool(HostList(), local_slots=3)
+    assert pool.total == 3
+    assert list(pool.allocate(2).items()) == [('localhost', 2)]
+
+
+class _Proc(object):
+    def __init__(self, returncode, seconds):
+        self._returncode = returncode
+        self._seconds = seconds
+
+    def wait(self):
+        time.sleep(self._seconds)
+        return self._returncode
+
+
+def test_run_batch():
+    jobs = read_batch(["-n 2 a", "-n 2 b", "-n 1 c", "-n 1 d"])
+    running = []
+    peak = [0]
+
+    def launch(job):
+        running.append(job.np)
+        peak[0] = max(peak[0], sum(running))
+        return _Proc(1 if job.index == 3 else 0, 0.05)
+
+    # Slots are released (and running updated) after the jobs end
+    pool = SlotPool(HostList(), local_slots=3)
+    orig = pool.release
+
+    def release(alloc):
+        running.remove(sum(n for _, n in alloc.items()))
+        orig(alloc)
+    pool.release = release
+
+    run_batch(jobs, pool, launch)
+    assert peak[0] <= 3
+    assert [j.returncode for j in jobs] == [0, 0, 1, 0]
+    assert all(j.seconds >= 0.05 for j in jobs)
+
+    lines = format_summary(jobs, 0.1)
+    assert len(lines) == 6
+    assert lines[-1].startswith("4 jobs, 1 failed")
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+
+from mpienv.cache import ProbeCache
+
+
+def test_probe_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        mpiexec = os.path.join(tmpdir, 'mpiexec')
+        mpicc = os.path.join(tmpdir, 'mpicc')
+        for path in [mpiexec, mpicc]:
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\n')
+
+        cache = ProbeCache(tmpdir)
+        assert cache.get(mpiexec) is None
+
+        cache.put(mpiexec, [mpicc, None], {'version': '1.0'})
+        assert cache.get(mpiexec) == {'version': '1.0'}
+
+        # Reload from the disk
+        cache = ProbeCache(tmpdir)
+        assert cache.get(mpiexec) == {'version': '1.0'}
+
+        # Modifying a dependent file invalidates the entry
+        with open(mpicc, 'a') as f:
+            f.write('echo modified\n')
+        assert cache.get(mpiexec) is None
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,11 @@
+import importlib
+
+from mpienv.command import COMMANDS
+
+
+def test_command_registry():
+    # Descriptions in the registry must be in sync with the parsers
+    for name, desc in COMMANDS:
+        mod = importlib.import_module("mpienv.command.{}".format(name))
+        assert mod.parser.description == desc
+        assert callable(mod.main)
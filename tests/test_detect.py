@@ -0,0 +1,136 @@
+# coding: utf-8
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+from mpienv.detect import detect_static
+from mpienv.mpich import Mpich
+from mpienv.mvapich import Mvapich
+from mpienv.probe import Probe
+import mpienv.util as util
+
+
+def _cc(src, out, args):
+    # Build an ELF file with `src` in .rodata
+    c = out + '.c'
+    with open(c, 'w') as f:
+        f.write(src)
+    try:
+        ret = subprocess.call(['cc', '-o', out, c] + args)
+    except OSError:
+        ret = -1
+    os.remove(c)
+    if ret != 0:
+        pytest.skip("A C compiler is needed to build the fixtures")
+
+
+def _program(marker):
+    return ('const char marker[] = "{}";\n'
+            'int main(void) {{ return marker[0] == 0; }}\n'.format(marker))
+
+
+def _make_mpi(prefix, marker=None, soname=None, mpi_h=None):
+    for d in ['bin', 'lib', 'include']:
+        os.makedirs(os.path.join(prefix, d))
+    mpiexec = os.path.join(prefix, 'bin', 'mpiexec')
+    if marker is None:
+        shutil.copy('/bin/true', mpiexec)
+    else:
+        _cc(_program(marker), mpiexec, [])
+    if soname is not None:
+        _cc('int MPI_Init(void) { return 0; }\n',
+            os.path.join(prefix, 'lib', soname),
+            ['-shared', '-fPIC', '-Wl,-soname,' + soname])
+    if mpi_h is not None:
+        with open(os.path.join(prefix, 'include', 'mpi.h'), 'w') as f:
+            f.write(mpi_h)
+    return mpiexec
+
+
+_OMPI_H = ("#define OMPI_MAJOR_VERSION 4\n"
+           "#define OMPI_MINOR_VERSION 0\n"
+           "#define OMPI_RELEASE_VERSION 1\n")
+_MPICH_H = '#define MPICH_VERSION "3.3"\n'
+_MVAPICH_H = _MPICH_H + '#define MVAPICH2_VERSION "2.3"\n'
+
+
+@pytest.fixture
+def tmpdir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+def test_detect_openmpi(tmpdir):
+    mpiexec = _make_mpi(os.path.join(tmpdir, 'ompi'), 'Open MPI',
+                        'libmpi.so.40', _OMPI_H)
+    info = detect_static(mpiexec)
+    assert info.flavor == 'Open MPI'
+    assert info.version == '4.0.1'
+    assert len(info.evidence) == 3
+
+
+def test_detect_mpich(tmpdir):
+    mpiexec = _make_mpi(os.path.join(tmpdir, 'mpich'),
+                        'HYDRA build details', 'libmpi.so.12', _MPICH_H)
+    info = detect_static(mpiexec)
+    assert info.flavor == 'MPICH'
+    assert info.version == '3.3'
+
+    # The more specific flavor of the MPICH family wins
+    mpiexec = _make_mpi(os.path.join(tmpdir, 'mvapich'),
+                        'HYDRA build details', 'libmpi.so.12', _MVAPICH_H)
+    info = detect_static(mpiexec)
+    assert info.flavor == 'MVAPICH'
+    assert info.version == '2.3'
+
+
+def test_detect_unknown(tmpdir):
+    # No evidence at all
+    mpiexec = _make_mpi(os.path.join(tmpdir, 'none'))
+    assert detect_static(mpiexec) is None
+
+    # mpiexec of MPICH and mpi.h of Open MPI in the same prefix
+    mpiexec = _make_mpi(os.path.join(tmpdir, 'mixed'),
+                        'HYDRA build details', None, _OMPI_H)
+    assert detect_static(mpiexec) is None
+
+
+_MPICH_VERSION = """HYDRA build details:
+    Version:                                 3.3
+    Configure options:                       '--prefix=/opt/mpich' '--enable-g'
+"""
+
+
+def test_mpich_without_running(tmpdir, monkeypatch):
+    # MPICH objects are built from the static detection, and
+    # `mpiexec --version` only runs when the configure options are needed
+    cmds = []
+
+    def communicate(cmd, **kwargs):
+        cmds.append(cmd)
+        return 0, _MPICH_VERSION.encode('utf-8'), b''
+    monkeypatch.setattr(util, 'communicate', communicate)
+
+    for cls, h, version in [(Mpich, _MPICH_H, '3.3'),
+                            (Mvapich, _MVAPICH_H, '2.3')]:
+        prefix = os.path.join(tmpdir, cls.__name__)
+        mpiexec = _make_mpi(prefix, 'HYDRA build details', 'libmpi.so.12',
+                            h)
+        open(os.path.join(prefix, 'bin', 'mpicc'), 'w').close()
+
+        mpi = cls(mpiexec, {}, probe=Probe(mpiexec))
+        d = mpi.to_probe_dict()
+        assert d['prefix'] == prefix
+        assert d['inc_dir'] == os.path.join(prefix, 'include')
+        assert d['lib_dir'] == os.path.join(prefix, 'lib')
+        assert mpi.version == version
+        assert cmds == []
+
+        assert mpi.conf_params['--enable-g'] is True
+        assert cmds == [[mpiexec, '--version']]
+        del cmds[:]
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+
+from mpienv import discover
+from mpienv.discover import DiscoverIndex
+from mpienv.discover import mount_type
+from mpienv.discover import network_mounts
+from mpienv.discover import walk
+
+
+def _touch_mpiexec(prefix):
+    os.makedirs(os.path.join(prefix, 'bin'))
+    with open(os.path.join(prefix, 'bin', 'mpiexec'), 'w'):
+        pass
+
+
+def test_walk():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        found = [os.path.join(tmpdir, 'a'),
+                 os.path.join(tmpdir, 'b', 'c')]
+        pruned = [os.path.join(tmpdir, 'node_modules', 'x'),
+                  os.path.join(tmpdir, 'd', '.git', 'y')]
+        deep = [os.path.join(tmpdir, 'e', 'f', 'g', 'h')]
+        for prefix in found + pruned + deep:
+            _touch_mpiexec(prefix)
+        os.makedirs(os.path.join(tmpdir, 'i', 'bin'))
+
+        assert sorted(walk([tmpdir])) == sorted(found + deep)
+        assert sorted(walk([tmpdir], max_depth=2)) == sorted(found)
+        assert list(walk([os.path.join(tmpdir, 'none')])) == []
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_network_mounts():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        mounts = os.path.join(tmpdir, 'mounts')
+        with open(mounts, 'w') as f:
+            f.write("/dev/sda1 / ext4 rw 0 0\n"
+                    "srv:/home /home nfs4 rw 0 0\n"
+                    "srv:/a\\040b /mnt/a\\040b nfs rw 0 0\n")
+        assert network_mounts(mounts) == set(['/home', '/mnt/a b'])
+        assert mount_type('/home/user', mounts) == 'nfs4'
+        assert mount_type('/homes', mounts) == 'ext4'
+        assert mount_type('/mnt/a b/c', mounts) == 'nfs'
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_walk_with_index():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmpdir, 'root')
+        _touch_mpiexec(os.path.join(root, 'a'))
+        os.makedirs(os.path.join(root, 'b', 'c'))
+
+        def age(path, t=1000000000):
+            # Old enough not to be regarded as racy
+            for dirpath, dirs, files in os.walk(path):
+                for n in dirs + files:
+                    os.utime(os.path.join(dirpath, n), (t, t))
+            os.utime(path, (t, t))
+
+        age(root)
+        cache_dir = os.path.join(tmpdir, 'cache')
+        index = DiscoverIndex(cache_dir)
+        assert list(walk([root], index=index)) == [os.path.join(root, 'a')]
+
+        index = DiscoverIndex(cache_dir)
+        scanned = []
+        orig = discover._scandir
+
+        def _scandir(path):
+            scanned.append(path)
+            return orig(path)
+        discover._scandir = _scandir
+        try:
+            # Nothing is scanned if nothing changed
+            assert list(walk([root], index=index)) == [
+                os.path.join(root, 'a')]
+            assert scanned == []
+
+            # Only the modified directory is scanned
+            _touch_mpiexec(os.path.join(root, 'b', 'c', 'd'))
+            age(os.path.join(root, 'b', 'c'), 1000000001)
+            index = DiscoverIndex(cache_dir)
+            assert sorted(walk([root], index=index)) == [
+                os.path.join(root, 'a'), os.path.join(root, 'b', 'c', 'd')]
+            assert os.path.join(root, 'b', 'c') in scanned
+            assert root not in scanned
+        finally:
+            discover._scandir = orig
+    finally:
+        shutil.rmtree(tmpdir)
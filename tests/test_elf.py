@@ -0,0 +1,23 @@
+import sys
+
+import pytest
+
+from mpienv.elf import ElfError
+from mpienv.elf import ElfFile
+from mpienv.elf import is_elf
+
+
+def test_elf_file():
+    if not is_elf(sys.executable):
+        pytest.skip("The Python interpreter is not an ELF binary")
+
+    with ElfFile(sys.executable) as elf:
+        assert '.text' in elf.section_names
+        assert elf.section('.no-such-section') is None
+        # Dynamically linked against libc (or a static binary)
+        assert all(isinstance(n, str) for n in elf.needed)
+
+
+def test_not_elf():
+    with pytest.raises(ElfError):
+        ElfFile(__file__)
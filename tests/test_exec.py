@@ -0,0 +1,121 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import mpienv.core
+from mpienv.mpich import Mpich
+from mpienv.openmpi import OpenMPI
+
+_ENV = [('PATH', '/opt/mpi/bin:/usr/bin'), ('MPIENV_MPI_NAME', 'a b')]
+
+
+@pytest.fixture
+def root(monkeypatch):
+    tmpdir = tempfile.mkdtemp()
+    env = mpienv.core.Mpienv(os.path.join(tmpdir, 'root'))
+    env._conf['script_dir'] = os.path.join(tmpdir, 'scripts')
+    os.makedirs(os.path.join(tmpdir, 'mpi', 'bin'))
+    open(os.path.join(tmpdir, 'mpi', 'bin', 'mpiexec'), 'w').close()
+    monkeypatch.setattr(mpienv.core.mpienv, '_obj', env)
+    yield env
+    shutil.rmtree(tmpdir)
+
+
+def _mpi(cls, env):
+    prefix = os.path.join(os.path.dirname(env.root_dir()), 'mpi')
+    d = {'prefix': prefix, 'mpicc': os.path.join(prefix, 'bin', 'mpicc'),
+         'inc_dir': None, 'lib_dir': None, '_type': cls.__name__,
+         '_version': '1.0'}
+    return cls.from_probe_dict(os.path.join(prefix, 'bin', 'mpiexec'), d,
+                               env._conf, 'mpi')
+
+
+def test_env_args(root):
+    assert _mpi(OpenMPI, root)._env_args(_ENV) == [
+        '-x', 'PATH=/opt/mpi/bin:/usr/bin', '-x', 'MPIENV_MPI_NAME=a b']
+    assert _mpi(Mpich, root)._env_args(_ENV) == [
+        '-genv', 'PATH', '/opt/mpi/bin:/usr/bin',
+        '-genv', 'MPIENV_MPI_NAME', 'a b']
+
+
+def test_exec_env(root):
+    mpi = _mpi(OpenMPI, root)
+    env = dict(mpi._exec_env())
+    assert env['PATH'].split(':')[0] == os.path.join(mpi.prefix, 'bin')
+    assert env['MPIENV_MPI_NAME'] == 'mpi'
+    assert env['MPIENV_MPI_VERSION'] == '1.0'
+
+
+def _dry_run(mpi, capsys, **kwargs):
+    mpi.exec_(['-n', '2', 'hostname'], dry_run=True, verbose=False,
+              no_python_abspath=True, **kwargs)
+    return capsys.readouterr().out.splitlines()
+
+
+def test_exec_native(root, capsys):
+    mpi = _mpi(OpenMPI, root)
+    out = _dry_run(mpi, capsys)
+    args = out[0].split()
+    assert args[0] == mpi.mpiexec
+    assert args[1] == '-x'
+    assert args[args.index('MPIENV_MPI_NAME=mpi') - 1] == '-x'
+    assert args[-3:] == ['-n', '2', 'hostname']
+
+    args = _dry_run(_mpi(Mpich, root), capsys)[0].split()
+    i = args.index('MPIENV_MPI_NAME')
+    assert args[i - 1:i + 2] == ['-genv', 'MPIENV_MPI_NAME', 'mpi']
+    assert args[-3:] == ['-n', '2', 'hostname']
+
+
+@pytest.mark.parametrize('mode', ['option', 'conf'])
+def test_exec_script(root, capsys, mode):
+    # --script, or "exec_mode": "script", runs the ranks through a script
+    if mode == 'option':
+        out = _dry_run(_mpi(Mpich, root), capsys, script=True)
+    else:
+        root._conf['exec_mode'] = 'script'
+        out = _dry_run(_mpi(Mpich, root), capsys)
+    args = out[0].split()
+    assert '-genv' not in args
+    assert args[1:3] == ['-n', '2']
+    script = args[3]
+    assert script.startswith(root._conf['script_dir'])
+    assert args[4:] == ['hostname']
+    with open(script) as f:
+        text = f.read()
+    assert 'export MPIENV_MPI_NAME="mpi"' in text
+    assert text.endswith('exec "$@"\n')
+
+    # The script depends only on the environment
+    mpi = _mpi(Mpich, root)
+    mpi.exec_(['-n', '4', 'uname', '-a'], dry_run=True, verbose=False,
+              no_python_abspath=True, script=True)
+    args = capsys.readouterr().out.split()
+    assert args[3:] == [script, 'uname', '-a']
+
+
+def test_exec_batch(root, capsys):
+    batch = os.path.join(root.root_dir(), 'jobs.txt')
+    with open(batch, 'w') as f:
+        f.write("-n 2 ./a.out 1\n"
+                "-n 1 --bind-to core ./a.out 2\n")
+
+    # The slots on the local host are passed to mpiexec
+    _mpi(OpenMPI, root).exec_batch([], batch, verbose=False,
+                                   no_python_abspath=True, dry_run=True,
+                                   slots=4)
+    out = [line.split() for line in capsys.readouterr().out.splitlines()]
+    assert out[0][-8:] == ['-H', 'localhost:2', '--bind-to', 'none',
+                           '-n', '2', './a.out', '1']
+    assert out[1][-8:] == ['-H', 'localhost:1', '-n', '1',
+                           '--bind-to', 'core', './a.out', '2']
+
+    _mpi(Mpich, root).exec_batch([], batch, verbose=False,
+                                 no_python_abspath=True, dry_run=True,
+                                 nodelist='n[1-2]:1')
+    out = [line.split() for line in capsys.readouterr().out.splitlines()]
+    assert out[0][-6:] == ['-hosts', 'n1:1,n2:1', '-n', '2', './a.out', '1']
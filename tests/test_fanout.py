@@ -0,0 +1,120 @@
+import os
+import shutil
+import stat
+import tempfile
+
+from mpienv.fanout import distribute
+
+# Stand-ins of scp and ssh. A "host" is a directory under $FAKE_HOSTS,
+# in which commands run by ssh are run and paths are relative to.
+# Copies are logged to $FAKE_HOSTS/log.
+FAKE_SCP = """#!/bin/sh
+src=$1
+[ -n "$FAKE_FROM" ] && src="$FAKE_HOSTS/$FAKE_FROM/$1"
+host=${2%%:*}
+dst=${2#*:}
+[ "$host" = bad ] && { echo "connection refused" >&2; exit 1; }
+cp "$src" "$FAKE_HOSTS/$host/$dst" || exit 1
+echo "${FAKE_FROM:-local} $host" >> "$FAKE_HOSTS/log"
+"""
+
+FAKE_SSH = """#!/bin/sh
+[ "$1" = bad ] && { echo "connection refused" >&2; exit 255; }
+cd "$FAKE_HOSTS/$1" && FAKE_FROM=$1 sh -c "$2"
+"""
+
+HOSTS = ['h1', 'bad', 'h3', 'h4', 'h5', 'h6', 'h7']
+
+
+def _script(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, stat.S_IRWXU)
+
+
+def _setup(tmpdir):
+    scp = os.path.join(tmpdir, 'scp')
+    ssh = os.path.join(tmpdir, 'ssh')
+    _script(scp, FAKE_SCP)
+    _script(ssh, FAKE_SSH)
+    for host in HOSTS:
+        os.makedirs(os.path.join(tmpdir, host, 'scripts'))
+    src = os.path.join(tmpdir, 'a.sh')
+    with open(src, 'w') as f:
+        f.write('echo hello\n')
+    os.environ['FAKE_HOSTS'] = tmpdir
+    return src, scp + ' {src} {host}:{dst}', ssh
+
+
+def _log(tmpdir):
+    if not os.path.exists(os.path.join(tmpdir, 'log')):
+        return []
+    with open(os.path.join(tmpdir, 'log')) as f:
+        return sorted(tuple(ln.split()) for ln in f)
+
+
+def test_distribute():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src, copy_cmd, ssh_cmd = _setup(tmpdir)
+        hosts = ['localhost', 'h1', 'h3', 'h4', 'h1']
+        results = distribute(src, hosts, 'scripts/a.sh', copy_cmd=copy_cmd,
+                             ssh_cmd=ssh_cmd, jobs=2)
+        assert [(r.host, r.ok, r.via) for r in results] == [
+            ('h1', True, None), ('h3', True, None), ('h4', True, None)]
+        assert _log(tmpdir) == [('local', 'h1'), ('local', 'h3'),
+                                ('local', 'h4')]
+        assert os.path.exists(os.path.join(tmpdir, 'h4', 'scripts', 'a.sh'))
+    finally:
+        shutil.rmtree(tmpdir)
+        os.environ.pop('FAKE_HOSTS', None)
+
+
+def test_distribute_tree():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src, copy_cmd, ssh_cmd = _setup(tmpdir)
+        results = distribute(src, HOSTS, 'scripts/a.sh', copy_cmd=copy_cmd,
+                             ssh_cmd=ssh_cmd, tree=2)
+        assert [(r.host, r.ok, r.via) for r in results] == [
+            ('h1', True, None), ('bad', False, None),
+            ('h3', True, 'h1'), ('h4', True, 'h1'),
+            # Children of a failed host are served directly
+            ('h5', True, None), ('h6', True, None),
+            ('h7', True, 'h3')]
+        assert results[1].error == 'connection refused'
+        assert _log(tmpdir) == [('h1', 'h3'), ('h1', 'h4'), ('h3', 'h7'),
+                                ('local', 'h1'), ('local', 'h5'),
+                                ('local', 'h6')]
+    finally:
+        shutil.rmtree(tmpdir)
+        os.environ.pop('FAKE_HOSTS', None)
+
+
+def test_distribute_skip_existing():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src, copy_cmd, ssh_cmd = _setup(tmpdir)
+        shutil.copy(src, os.path.join(tmpdir, 'h3', 'scripts', 'a.sh'))
+        # A partial copy
+        with open(os.path.join(tmpdir, 'h4', 'scripts', 'a.sh'), 'w') as f:
+            f.write('echo')
+
+        for tree in [0, 2]:
+            hosts = ['h1', 'h3', 'h4', 'h5']
+            results = distribute(src, hosts, 'new/a.sh', copy_cmd=copy_cmd,
+                                 ssh_cmd=ssh_cmd, tree=tree,
+                                 skip_existing=True)
+            # The directory is created
+            assert all(r.ok for r in results)
+            results = distribute(src, hosts, 'scripts/a.sh',
+                                 copy_cmd=copy_cmd, ssh_cmd=ssh_cmd,
+                                 tree=tree, skip_existing=True)
+            assert [(r.host, r.ok) for r in results if not r.skipped] == \
+                ([('h1', True), ('h4', True), ('h5', True)]
+                 if tree == 0 else [])
+        with open(os.path.join(tmpdir, 'h4', 'scripts', 'a.sh')) as f:
+            assert f.read() == 'echo hello\n'
+    finally:
+        shutil.rmtree(tmpdir)
+        os.environ.pop('FAKE_HOSTS', None)
@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+from mpienv.header import scan_mpi_h
+
+
+_test_mpi_h = """
+#ifndef MPI_INCLUDED
+#define MPI_INCLUDED
+
+#define MPI_VERSION    3
+#define MPI_SUBVERSION 1
+
+/* MPICH version */
+#define MPICH_VERSION "3.2.1"
+#  define MVAPICH2_VERSION "2.3rc1"  /* MVAPICH2 */
+#define MPICH_VERSION "9.9.9"
+#endif
+"""
+
+
+def _scan(text):
+    temp = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        temp.write(text.encode('utf-8'))
+        temp.close()
+        return scan_mpi_h(temp.name)
+    finally:
+        os.remove(temp.name)
+
+
+def test_scan_mpi_h():
+    h = _scan(_test_mpi_h)
+    assert h.get('MPICH_VERSION') == '3.2.1'
+    assert h.get('MVAPICH2_VERSION') == '2.3rc1'
+    assert h.flavor == 'MVAPICH'
+    assert h.version == '2.3rc1'
+    assert h.mpi_version == '3.1'
+    assert 'OMPI_MAJOR_VERSION' not in h
+
+    h = _scan("#define OMPI_MAJOR_VERSION 4\n"
+              "#define OMPI_MINOR_VERSION 0\n"
+              "#define OMPI_RELEASE_VERSION 1\n")
+    assert h.flavor == 'Open MPI'
+    assert h.version == '4.0.1'
+
+    h = _scan("")
+    assert h.flavor is None
+    assert h.version is None
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+
+from mpienv.hosts import expand_nodelist
+from mpienv.hosts import from_env
+from mpienv.hosts import from_mpi_args
+from mpienv.hosts import from_nodelist
+from mpienv.hosts import parse_hostfile
+
+
+def test_parse_hostfile():
+    hostlist = parse_hostfile([
+        "# Open MPI\n",
+        "host1 slots=4 max_slots=8\n",
+        "host2: slots=2  # comment\n",
+        "\n",
+        "# MPICH\n",
+        "host3:3\n",
+        "host4\n",
+        "host4\n",
+        "host1 slots=2\n",
+    ])
+    assert list(hostlist.items()) == [
+        ('host1', 6), ('host2', 2), ('host3', 3), ('host4', 2)]
+
+
+def test_expand_nodelist():
+    assert expand_nodelist('node[001-003,010],login,gpu[8-9]-ib') == [
+        'node001', 'node002', 'node003', 'node010', 'login',
+        'gpu8-ib', 'gpu9-ib']
+    assert expand_nodelist('r[1-2]n[1-2]') == ['r1n1', 'r1n2',
+                                               'r2n1', 'r2n2']
+    assert expand_nodelist('host') == ['host']
+    for bad in ['node[1-', 'node[3-1]', 'node[a-b]']:
+        try:
+            expand_nodelist(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+    assert list(from_nodelist('n[1-2]:4,m').items()) == [
+        ('n1', 4), ('n2', 4), ('m', None)]
+
+    start = time.time()
+    hosts = expand_nodelist('node[00001-10000]')
+    assert len(hosts) == 10000 and hosts[-1] == 'node10000'
+    assert time.time() - start < 0.5
+
+
+def test_from_env():
+    env = {'SLURM_JOB_NODELIST': 'n[1-4]',
+           'SLURM_TASKS_PER_NODE': '2(x3),1'}
+    assert list(from_env(env).items()) == [
+        ('n1', 2), ('n2', 2), ('n3', 2), ('n4', 1)]
+
+    temp = tempfile.NamedTemporaryFile(mode='w', delete=False)
+    try:
+        temp.write("b\nb\na\n")
+        temp.close()
+        assert list(from_env({'PBS_NODEFILE': temp.name}).items()) == [
+            ('b', 2), ('a', None)]
+    finally:
+        os.remove(temp.name)
+
+    assert from_env({}) is None
+
+
+def test_from_mpi_args():
+    hostlist = from_mpi_args(['-n', '4', '-H', 'b:2,a', '-hosts', 'c'])
+    assert list(hostlist.items()) == [('b', 2), ('a', None), ('c', None)]
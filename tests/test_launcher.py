@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import time
+
+from mpienv.launcher import prune_scripts
+from mpienv.launcher import store_script
+
+
+def test_store_script():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        script_dir = os.path.join(tmpdir, 'scripts')
+        path = store_script(script_dir, "#!/bin/sh\nhostname\n")
+        assert os.path.dirname(path) == script_dir
+        assert oct(os.stat(script_dir).st_mode & 0o777) == oct(0o700)
+
+        # The same content is stored under the same name
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+        assert store_script(script_dir, "#!/bin/sh\nhostname\n") == path
+        assert os.stat(path).st_mtime > old
+        path2 = store_script(script_dir, "#!/bin/sh\nuptime\n")
+        assert path2 != path
+
+        # A broken script is written again
+        with open(path, 'w') as f:
+            f.write("#!/bin/sh\n")
+        assert store_script(script_dir, "#!/bin/sh\nhostname\n") == path
+        with open(path) as f:
+            assert f.read() == "#!/bin/sh\nhostname\n"
+
+        os.utime(path2, (old, old))
+        prune_scripts(script_dir, 60)
+        assert os.listdir(script_dir) == [os.path.basename(path)]
+
+        # The script just stored is kept, and 0 means never
+        os.utime(path, (old, old))
+        prune_scripts(script_dir, 0)
+        prune_scripts(script_dir, 60, keep=path)
+        assert os.listdir(script_dir) == [os.path.basename(path)]
+
+        # Directories writable by others are rejected
+        os.chmod(script_dir, 0o777)
+        try:
+            store_script(script_dir, "#!/bin/sh\nhostname\n")
+            assert False
+        except RuntimeError:
+            pass
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,38 @@
+import struct
+
+from mpienv.ldcache import LdCacheError
+from mpienv.ldcache import parse_ld_cache
+
+LIBS = [('libmpi.so.40', '/usr/lib/x86_64-linux-gnu/libmpi.so.40'),
+        ('libc.so.6', '/lib/x86_64-linux-gnu/libc.so.6')]
+
+
+def _new_format():
+    strings = b''
+    offsets = []
+    start = 48 + 24 * len(LIBS)
+    for name, path in LIBS:
+        offsets.append((start + len(strings),
+                        start + len(strings) + len(name) + 1))
+        strings += name.encode() + b'\0' + path.encode() + b'\0'
+    buf = b'glibc-ld.so.cache1.1'
+    buf += struct.pack('<IIB3xI12x', len(LIBS), len(strings), 0, 0)
+    for key, value in offsets:
+        buf += struct.pack('<iIIIQ', 0x303, key, value, 0, 0)
+    return buf + strings
+
+
+def test_parse_ld_cache():
+    buf = _new_format()
+    assert parse_ld_cache(buf) == LIBS
+
+    # The new format following empty old entries
+    old = b'ld.so-1.7.0\0' + struct.pack('<I', 0)
+    assert parse_ld_cache(old + buf) == LIBS
+
+    for broken in [b'', b'garbage', buf[:60]]:
+        try:
+            parse_ld_cache(broken)
+            assert False
+        except LdCacheError:
+            pass
@@ -0,0 +1,67 @@
+import os
+import shutil
+import struct
+import tempfile
+
+from mpienv.locatedb import find_prefixes
+from mpienv.locatedb import LocateDbError
+
+# (directory, [(type, name)]) where type is 0 (file) or 1 (directory)
+TREE = [
+    ('/', [(1, 'opt'), (1, 'usr')]),
+    ('/opt', [(1, 'mpich')]),
+    ('/opt/mpich', [(1, 'bin')]),
+    ('/opt/mpich/bin', [(0, 'mpicc'), (0, 'mpiexec'), (0, 'mpiexec.hydra')]),
+    ('/usr', [(1, 'bin')]),
+    ('/usr/bin', [(0, 'ls'), (0, 'mpiexec.openmpi')]),
+    ('/usr/share', [(1, 'mpiexec')]),
+]
+
+
+def _mlocate_db(path):
+    with open(path, 'wb') as f:
+        conf = b'prunepaths\0/tmp\0\0'
+        f.write(b'\0mlocate' + struct.pack('>IBBxx', len(conf), 0, 0))
+        f.write(b'/\0' + conf)
+        for d, entries in TREE:
+            f.write(struct.pack('>QIxxxx', 0, 0) + d.encode() + b'\0')
+            for t, name in entries:
+                f.write(struct.pack('B', t) + name.encode() + b'\0')
+            f.write(b'\2')
+
+
+def _locate02_db(path):
+    paths = sorted(os.path.join(d, n) for d, ents in TREE for _, n in ents)
+    with open(path, 'wb') as f:
+        f.write(b'\0LOCATE02\0')
+        prev = ''
+        count = 0
+        for p in paths:
+            common = len(os.path.commonprefix([prev, p]))
+            diff = common - count
+            if -127 <= diff <= 127:
+                f.write(struct.pack('b', diff))
+            else:
+                f.write(b'\x80' + struct.pack('>h', diff))
+            f.write(p[common:].encode() + b'\0')
+            prev, count = p, common
+
+
+def test_locatedb():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for gen in [_mlocate_db, _locate02_db]:
+            db = os.path.join(tmpdir, 'locate.db')
+            gen(db)
+            assert sorted(find_prefixes(db)) == ['/opt/mpich', '/usr']
+            assert find_prefixes(db, ['/opt']) == ['/opt/mpich']
+
+        with open(db, 'wb') as f:
+            f.write(b'\0plocate')
+        try:
+            find_prefixes(db)
+            assert False
+        except LocateDbError:
+            pass
+    finally:
+        shutil.rmtree(tmpdir)
@@ -1,8 +1,11 @@
 import os
+import shutil
 import tempfile
 
+import mpienv.mpibase
 from mpienv.mpibase import parse_hosts
 from mpienv.mpibase import split_mpi_user_prog
+from mpienv.openmpi import OpenMPI
 
 
 _test_hostfile = """
@@ -37,7 +40,8 @@ def test_parse_hosts():
 
     for opt in ['-H', '-host', '--host']:
         assert ['host1', 'host2'] == parse_hosts([opt, 'host1,host2'])
-        assert ['host1', 'host2'] == parse_hosts([opt, 'host2,host1'])
+        # The order is preserved
+        assert ['host2', 'host1'] == parse_hosts([opt, 'host2,host1'])
         assert ['host1'] == parse_hosts([opt, 'host1,host1'])
 
         assert ['host1', 'host2'] == parse_hosts([opt, 'host1:slot=2,host2'])
@@ -64,3 +68,43 @@ def test_split_mpi_user_prog():
     usr = ['python', 'train_mnist.py', '-g']
     ans = (mpi, usr)
     assert ans == split_mpi_user_prog(cmd)
+
+
+def _fake_openmpi(prefix, lib_dir, inc_dir):
+    d = {'prefix': prefix, 'mpicc': os.path.join(prefix, 'bin', 'mpicc'),
+         'inc_dir': inc_dir, 'lib_dir': lib_dir}
+    return OpenMPI.from_probe_dict(os.path.join(prefix, 'bin', 'mpiexec'),
+                                   d, {}, 'ompi')
+
+
+def test_view_files(monkeypatch):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # Debian-like layout: the MPI's own lib/ and include/ under
+        # the multiarch library directory of a shared prefix
+        triplet = os.path.join(tmpdir, 'lib', 'x86_64-linux-gnu')
+        lib_dir = os.path.join(triplet, 'openmpi', 'lib')
+        inc_dir = os.path.join(triplet, 'openmpi', 'include')
+        for d in [lib_dir, inc_dir, os.path.join(tmpdir, 'bin')]:
+            os.makedirs(d)
+        for f in [os.path.join(lib_dir, 'libmpi.so'),
+                  os.path.join(inc_dir, 'mpi.h'),
+                  os.path.join(triplet, 'libz.so')]:
+            open(f, 'w').close()
+
+        monkeypatch.setattr(mpienv.mpibase.pathenv, 'shared_prefixes',
+                            lambda: [tmpdir])
+        mpi = _fake_openmpi(tmpdir, lib_dir, inc_dir)
+        files = [(sub, os.path.basename(f)) for sub, f, _ in
+                 mpi.view_files()]
+        assert ('lib', 'libmpi.so') in files
+        assert ('include', 'mpi.h') in files
+        assert mpi._lib_dirs() == [lib_dir]
+
+        # The multiarch directory itself has other software's files
+        mpi = _fake_openmpi(tmpdir, triplet, inc_dir)
+        files = [(sub, os.path.basename(f)) for sub, f, _ in
+                 mpi.view_files()]
+        assert ('lib', 'libz.so') not in files
+    finally:
+        shutil.rmtree(tmpdir)
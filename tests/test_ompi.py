@@ -0,0 +1,21 @@
+from mpienv.ompi import parse_ompi_info_lines
+
+
+def test_parse_ompi_info_lines():
+    lines = iter([
+        "package:Open MPI builder Distribution",
+        "ompi:version:full:3.1.2",
+        "bindings:c:yes",
+        "",
+        "bindings:cxx:no",
+        "this line must not be consumed",
+    ])
+    info = parse_ompi_info_lines(lines, ['ompi:version:full',
+                                         'bindings:c', 'bindings:cxx'])
+    assert info.get('ompi:version:full') == '3.1.2'
+    assert info.get('bindings:c') is True
+    assert info.get('bindings:cxx') is False
+    assert info.get('package') is None
+
+    # Parsing stops as soon as all the keys are found
+    assert next(lines) == "this line must not be consumed"
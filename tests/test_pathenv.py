@@ -0,0 +1,18 @@
+from mpienv.pathenv import mpi_dirs
+from mpienv.pathenv import normalize
+
+
+def test_mpi_dirs():
+    assert mpi_dirs('/opt/ompi/bin/mpiexec') == [
+        '/opt/ompi/bin', '/opt/ompi/lib', '/opt/ompi/lib64']
+    # Directories shared with other software are never removed
+    assert mpi_dirs('/usr/bin/mpiexec') == []
+
+
+def test_normalize():
+    known = mpi_dirs('/opt/a/bin/mpiexec') + mpi_dirs('/opt/b/bin/mpiexec')
+    paths = ['/opt/a/bin', '/usr/bin', '', '/opt/b/bin', '/usr/bin',
+             '/opt/a/bin/']
+    result, removed = normalize(paths, known, ['/opt/b/bin'])
+    assert result == ['/opt/b/bin', '/usr/bin']
+    assert removed == ['/opt/a/bin', '', '/usr/bin', '/opt/a/bin/']
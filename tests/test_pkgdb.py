@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+
+from mpienv.core import Mpienv
+from mpienv.openmpi import OpenMPI
+from mpienv.pkgdb import parse_easyconfig
+from mpienv.pkgdb import PkgDbError
+from mpienv.pkgdb import read_easybuild
+from mpienv.pkgdb import read_spack_db
+
+_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_read_spack_db():
+    records = read_spack_db(os.path.join(_dir, 'spack_index.json'))
+    assert [(r['package'], r['class'], r['version'], r['compiler'])
+            for r in records] == [
+                ('openmpi', 'OpenMPI', '4.1.1', 'gcc-9.3.0'),
+                ('mpich', 'Mpich', '3.4.2', 'intel-2021.1')]
+    assert records[0]['variants'] == {'cuda': False, 'fabrics': ['ucx']}
+    assert records[1]['prefix'].endswith('mpich-3.4.2-bcdefgh')
+
+    try:
+        read_spack_db(_dir + '/none')
+        assert False
+    except PkgDbError:
+        pass
+
+
+def test_parse_easyconfig():
+    text = ("name = 'OpenMPI'\n"
+            "version = '4.1.1'\n"
+            "toolchain = {'name': 'GCC', 'version': '10.3.0'}\n"
+            "configopts = '--without-verbs'\n")
+    assert parse_easyconfig(text) == ('4.1.1', 'GCC-10.3.0',
+                                      '--without-verbs')
+    assert parse_easyconfig("version = \"3.3\"\ntoolchain = SYSTEM\n") == \
+        ('3.3', None, None)
+
+
+def test_read_easybuild():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        prefix = os.path.join(tmpdir, 'software', 'OpenMPI',
+                              '4.1.1-GCC-10.3.0')
+        os.makedirs(os.path.join(prefix, 'easybuild'))
+        with open(os.path.join(prefix, 'easybuild',
+                               'OpenMPI-4.1.1-GCC-10.3.0.eb'), 'w') as f:
+            f.write("version = '4.1.1'\n"
+                    "toolchain = {'name': 'GCC', 'version': '10.3.0'}\n")
+        os.makedirs(os.path.join(tmpdir, 'software', 'zlib', '1.2.11',
+                                 'easybuild'))
+
+        records = read_easybuild(tmpdir)
+        assert [(r['package'], r['version'], r['compiler'], r['prefix'])
+                for r in records] == [
+                    ('openmpi', '4.1.1', 'GCC-10.3.0', prefix)]
+
+        # Module trees
+        modules = os.path.join(tmpdir, 'modules', 'all', 'OpenMPI')
+        os.makedirs(modules)
+        with open(os.path.join(modules, '4.1.1-GCC-10.3.0.lua'), 'w') as f:
+            f.write('local root = "{}"\n'.format(prefix))
+        records = read_easybuild(os.path.join(tmpdir, 'modules'))
+        assert [r['prefix'] for r in records] == [prefix]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _record(prefix, version):
+    return {'package': 'openmpi', 'class': 'OpenMPI', 'version': version,
+            'prefix': prefix, 'compiler': 'gcc-9.3.0', 'variants': {},
+            'id': 'abcdefg', 'source': 'spack'}
+
+
+def test_import_and_verify(monkeypatch, capsys):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        prefixes = []
+        for v in ['4.1.1', '4.0.5']:
+            prefix = os.path.join(tmpdir, 'openmpi-' + v)
+            for d in ['bin', 'lib', 'include']:
+                os.makedirs(os.path.join(prefix, d))
+            for f in ['bin/mpiexec', 'bin/mpicc', 'include/mpi.h']:
+                open(os.path.join(prefix, f), 'w').close()
+            prefixes.append(prefix)
+
+        root = os.path.join(tmpdir, 'root')
+        env = Mpienv(root)
+        saves = []
+        save = env._probe_cache.save
+        monkeypatch.setattr(env._probe_cache, 'save',
+                            lambda: saves.append(1) or save())
+        imported = env.import_mpis([_record(prefixes[0], '4.1.1'),
+                                    _record(prefixes[1], '4.0.5'),
+                                    _record(tmpdir + '/none', '1.0')])
+        assert [name for name, _ in imported] == ['openmpi-4.1.1',
+                                                  'openmpi-4.0.5']
+        # The probe cache is written once for all the records
+        assert saves == [1]
+
+        # Registered in mpienv.ini, with the probe results not probed
+        env = Mpienv(root)
+        assert sorted(env.keys()) == ['openmpi-4.0.5', 'openmpi-4.1.1']
+        mpiexec = env['openmpi-4.1.1'].mpiexec
+        info = env._probe_cache.get(mpiexec)
+        assert info['imported'] == 'spack'
+        assert info['_version'] == '4.1.1'
+        assert env['openmpi-4.1.1'].version == '4.1.1'
+
+        # verify probes again: 4.0.5 turns out to be 4.0.6
+        probed = []
+
+        def construct(mpiexec, name=None):
+            probed.append(name)
+            d = dict(env._imported_probe_dict(
+                mpiexec, _record(os.path.dirname(os.path.dirname(mpiexec)),
+                                 '4.0.6'))[1])
+            del d['imported']
+            mpi = OpenMPI.from_probe_dict(mpiexec, d, env._conf, name)
+            env._probe_cache.put(mpiexec, mpi.probe_files(),
+                                 mpi.to_probe_dict())
+            return mpi
+        monkeypatch.setattr(env, '_construct_mpi', construct)
+
+        capsys.readouterr()
+        assert env.verify(['openmpi-4.0.5']) == []
+        assert probed == ['openmpi-4.0.5']
+        assert ("'openmpi-4.0.5' is Open MPI 4.0.6, but Open MPI 4.0.5 "
+                "is recorded by spack") in capsys.readouterr().err
+        info = Mpienv(root)._probe_cache.get(
+            env['openmpi-4.0.5'].mpiexec)
+        assert info['_version'] == '4.0.6'
+        assert 'imported' not in info
+
+        # Only the MPIs not verified yet are probed by default
+        assert env.verify() == []
+        assert probed == ['openmpi-4.0.5', 'openmpi-4.1.1']
+    finally:
+        shutil.rmtree(tmpdir)
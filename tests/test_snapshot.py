@@ -0,0 +1,74 @@
+# coding: utf-8
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mpienv.snapshot import write_snapshot
+
+
+def _source(path, env):
+    out = subprocess.check_output(
+        ['sh', '-c', '. "$1"; echo "$__mpienv_snapshot_ok|$PATH|'
+         '${LD_LIBRARY_PATH:-}|${MPIENV_ACTIVE:-}"', 'sh', path], env=env)
+    return out.decode('utf-8').strip().split('|')
+
+
+def test_snapshot():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ini = os.path.join(tmpdir, 'mpienv.ini')
+        open(ini, 'w').close()
+        bin_dir = os.path.join(tmpdir, 'mpi a', 'bin')
+        lib_dir = os.path.join(tmpdir, 'mpi a', 'lib')
+        os.makedirs(bin_dir)
+        os.makedirs(lib_dir)
+        mpiexec = os.path.join(bin_dir, 'mpiexec')
+        with open(mpiexec, 'w') as f:
+            f.write('#!/bin/sh\n')
+        os.chmod(mpiexec, 0o755)
+        # Make the inputs older than the snapshot
+        past = time.time() - 10
+        for f in [ini, mpiexec]:
+            os.utime(f, (past, past))
+
+        other = os.path.join(tmpdir, 'mpi-b')
+        path = os.path.join(tmpdir, 'shell', 'active.sh')
+        write_snapshot(path, "it's", ini, mpiexec, bin_dir, [lib_dir],
+                       strip_dirs=[os.path.join(other, 'bin'),
+                                   os.path.join(other, 'lib')])
+
+        env = {'PYTHON': sys.executable,
+               'PATH': '{}/bin:/usr/bin:/bin'.format(other),
+               'LD_LIBRARY_PATH': '{}/lib'.format(other)}
+        ok, path_, ldlib, active = _source(path, env)
+        assert ok == '1'
+        assert path_ == '{}:/usr/bin:/bin'.format(bin_dir)
+        assert ldlib == lib_dir
+        assert active == "it's"
+
+        # Stale if mpienv.ini is modified later: the caller falls back
+        # to `mpienv restore` and the environment is left untouched
+        future = time.time() + 10
+        os.utime(ini, (future, future))
+        ok, path_, ldlib, active = _source(path, env)
+        assert ok == ''
+        assert path_ == env['PATH']
+        assert ldlib == env['LD_LIBRARY_PATH']
+        assert active == ''
+
+        # Stale if mpiexec is replaced (e.g. the MPI is rebuilt)
+        os.utime(ini, (past, past))
+        os.utime(mpiexec, (future, future))
+        assert _source(path, env)[0] == ''
+
+        # Stale for another Python interpreter
+        os.utime(mpiexec, (past, past))
+        assert _source(path, env)[0] == '1'
+        env['PYTHON'] = '/no/such/python'
+        assert _source(path, env)[0] == ''
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Budget of the startup overhead of light-weight commands, in seconds,
+# on top of the bare interpreter startup. It is generous to avoid
+# flaky failures, but catches slow imports (e.g. distutils, pip) and
+# eager probing at import time.
+STARTUP_BUDGET = 0.2
+
+_proj_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _min_time(cmd, env, n=3):
+    best = None
+    for _ in range(n):
+        t0 = time.time()
+        subprocess.check_call(cmd, env=env,
+                              stdout=open(os.devnull, 'w'),
+                              stderr=open(os.devnull, 'w'))
+        t = time.time() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+
+def test_startup_time():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        env = os.environ.copy()
+        env['MPIENV_ROOT'] = os.path.join(tmpdir, 'mpienv')
+        env['PYTHONPATH'] = _proj_dir
+
+        base = _min_time([sys.executable, '-c', 'pass'], env)
+
+        t = _min_time([sys.executable, '-m', 'mpienv', 'help'], env)
+        assert t - base < STARTUP_BUDGET
+
+        # `help` must not even load the configuration
+        assert not os.path.exists(env['MPIENV_ROOT'])
+
+        t = _min_time([sys.executable, '-m', 'mpienv', 'prefix', 'foo'], env)
+        assert t - base < STARTUP_BUDGET
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_help_imports():
+    # `help` must not import mpienv.core (and the MPI classes), nor slow
+    # modules like multiprocessing
+    code = ("import sys\n"
+            "from mpienv.__main__ import main\n"
+            "try:\n"
+            "    main(['help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "sys.stderr.write(' '.join(sys.modules))\n")
+    env = os.environ.copy()
+    env['PYTHONPATH'] = _proj_dir
+    p = subprocess.Popen([sys.executable, '-c', code], env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = p.communicate()
+    modules = err.decode('utf-8').split()
+    assert 'mpienv.command.help' in modules
+    for mod in ['mpienv.core', 'mpienv.mpibase', 'multiprocessing',
+                'subprocess']:
+        assert mod not in modules
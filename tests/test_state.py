@@ -0,0 +1,40 @@
+import json
+import os
+import shutil
+import tempfile
+
+from mpienv.state import load_state
+from mpienv.state import save_state
+
+
+def test_state():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ini = os.path.join(tmpdir, 'mpienv.ini')
+        with open(ini, 'w') as f:
+            f.write('[DEFAULT]\n')
+        path = os.path.join(tmpdir, 'state.json')
+
+        assert load_state(path, [ini]) is None
+
+        sections = {'DEFAULT': {'active': 'foo'}}
+        save_state(path, [ini], sections, {}, {})
+        state = load_state(path, [ini])
+        assert state['sections'] == sections
+
+        # A corrupted state is rejected
+        with open(path) as f:
+            data = json.load(f)
+        data['payload']['sections']['DEFAULT']['active'] = 'bar'
+        os.chmod(path, 0o644)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        assert load_state(path, [ini]) is None
+
+        # Modifying a source invalidates the state
+        save_state(path, [ini], sections, {}, {})
+        with open(ini, 'a') as f:
+            f.write('active = bar\n')
+        assert load_state(path, [ini]) is None
+    finally:
+        shutil.rmtree(tmpdir)
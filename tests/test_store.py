@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from mpienv.store import file_lock
+from mpienv.store import read_ini
+from mpienv.store import write_ini
+
+
+def test_concurrent_updates():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ini = os.path.join(tmpdir, 'mpienv.ini')
+
+        def add(name):
+            with file_lock(ini + '.lock'):
+                config = read_ini(ini)
+                config.add_section(name)
+                config[name]['mpiexec'] = '/' + name
+                write_ini(ini, config)
+
+        threads = [threading.Thread(target=add, args=('mpi{}'.format(i),))
+                   for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        config = read_ini(ini)
+        assert len(config.sections()) == 16
+        assert sorted(os.listdir(tmpdir)) == ['mpienv.ini', 'mpienv.ini.lock']
+    finally:
+        shutil.rmtree(tmpdir)
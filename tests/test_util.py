@@ -1,4 +1,8 @@
+import pytest
+
+from mpienv.util import communicate
 from mpienv.util import escape_shell_commands
+from mpienv.util import ProbeTimeout
 
 
 def test_escape_shell_commands():
@@ -21,3 +25,12 @@ def test_escape_shell_commands():
     inp = ['some special chars *']
     ans = ['"some special chars *"']
     assert ans == escape_shell_commands(inp)
+
+
+def test_communicate_timeout():
+    ret, out, _ = communicate(['echo', 'hello'], timeout=10)
+    assert ret == 0
+    assert out.strip() == b'hello'
+
+    with pytest.raises(ProbeTimeout):
+        communicate(['sleep', '10'], timeout=0.1)
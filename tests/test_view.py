@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+
+from mpienv import view
+
+
+class _FakeMPI(object):
+    def __init__(self, prefix):
+        self.mpiexec = os.path.join(prefix, 'bin', 'mpiexec')
+
+    def mirror_to(self, dst_dir):
+        os.makedirs(os.path.join(dst_dir, 'bin'))
+        os.symlink(self.mpiexec, os.path.join(dst_dir, 'bin', 'mpiexec'))
+
+
+def test_view():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name in ['a', 'b']:
+            os.makedirs(os.path.join(tmpdir, name, 'bin'))
+            with open(os.path.join(tmpdir, name, 'bin', 'mpiexec'), 'w'):
+                pass
+            mpi = _FakeMPI(os.path.join(tmpdir, name))
+            assert not view.is_up_to_date(tmpdir, name, mpi.mpiexec)
+            view.build_view(tmpdir, name, mpi)
+            assert view.is_up_to_date(tmpdir, name, mpi.mpiexec)
+
+        assert view.current_name(tmpdir) is None
+        mpiexec = os.path.join(view.current_path(tmpdir), 'bin', 'mpiexec')
+        for name in ['a', 'b']:
+            view.switch_view(tmpdir, name)
+            assert view.current_name(tmpdir) == name
+            assert os.path.realpath(mpiexec) == os.path.join(
+                os.path.realpath(tmpdir), name, 'bin', 'mpiexec')
+
+        # Rebuilding the current view replaces it in place
+        old = os.path.realpath(view.view_path(tmpdir, 'b'))
+        view.build_view(tmpdir, 'b', mpi)
+        assert not os.path.exists(old)
+        assert os.path.realpath(mpiexec) == os.path.join(
+            os.path.realpath(tmpdir), 'b', 'bin', 'mpiexec')
+
+        view.rename_view(tmpdir, 'b', 'c', None)
+        assert view.current_name(tmpdir) == 'c'
+        assert os.path.exists(mpiexec)
+        view.remove_view(tmpdir, 'a')
+        # Only `c` and the version directory it points to remain
+        c = view.view_path(tmpdir, 'c')
+        assert sorted(os.listdir(view.views_dir(tmpdir))) == sorted(
+            ['c', os.readlink(c)])
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from mpienv import wrapper
+
+
+class _FakeMPI(object):
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.mpiexec = os.path.join(prefix, 'bin', 'mpiexec')
+
+    def bin_files(self):
+        return []
+
+
+def test_wrappers():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        prefix = os.path.join(tmpdir, 'mpi')
+        bin_dir = os.path.join(prefix, 'bin')
+        lib_dir = os.path.join(prefix, 'lib')
+        os.makedirs(bin_dir)
+        os.makedirs(lib_dir)
+
+        # An ELF binary without RPATH, and a script
+        shutil.copy('/bin/true', os.path.join(bin_dir, 'mpiexec'))
+        with open(os.path.join(bin_dir, 'mpicc'), 'w') as f:
+            f.write('#!/bin/sh\necho "$@"\n')
+        os.chmod(os.path.join(bin_dir, 'mpicc'), 0o755)
+
+        mpi = _FakeMPI(prefix)
+        root = os.path.join(tmpdir, 'root')
+        assert not wrapper.is_up_to_date(root, 'foo', mpi.mpiexec)
+        wrapper.generate_wrappers(root, 'foo', mpi, [lib_dir])
+        assert wrapper.is_up_to_date(root, 'foo', mpi.mpiexec)
+
+        wbin = wrapper.bin_path(root, 'foo')
+        mpiexec = os.path.join(wbin, 'mpiexec')
+        assert not os.path.islink(mpiexec)
+        assert wrapper.wrapped_command(mpiexec) == mpi.mpiexec
+        assert subprocess.call([mpiexec, '-n', '2']) == 0
+
+        out = subprocess.check_output([os.path.join(wbin, 'mpicc'), '-c'])
+        assert out.decode('utf-8').split() == [
+            '-c', '-Wl,-rpath,{}'.format(lib_dir)]
+
+        # Regenerating replaces the old version
+        old = os.path.realpath(wrapper.wrappers_path(root, 'foo'))
+        wrapper.generate_wrappers(root, 'foo', mpi, [lib_dir])
+        assert not os.path.exists(old)
+        assert os.path.exists(mpiexec)
+        wrapper.remove_wrappers(root, 'foo')
+        assert os.listdir(os.path.join(root, 'wrappers')) == []
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_wrapped_commands(monkeypatch):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        bin_dir = os.path.join(tmpdir, 'bin')
+        os.makedirs(bin_dir)
+        for cmd in ['mpiexec', 'mpicc', 'mpicxx', 'mpicalc']:
+            open(os.path.join(bin_dir, cmd), 'w').close()
+
+        mpi = _FakeMPI(tmpdir)
+        mpi.mpicc = os.path.join(bin_dir, 'mpicc')
+        mpi.mpicxx = os.path.join(bin_dir, 'mpicxx')
+        assert [os.path.basename(c)
+                for c in wrapper.wrapped_commands(mpi)] == [
+                    'mpicalc', 'mpicc', 'mpicxx', 'mpiexec']
+
+        # bin/mpi* of a shared prefix may be unrelated tools
+        monkeypatch.setattr(wrapper.pathenv, 'shared_prefixes',
+                            lambda: [tmpdir])
+        assert [os.path.basename(c)
+                for c in wrapper.wrapped_commands(mpi)] == [
+                    'mpicc', 'mpicxx', 'mpiexec']
+    finally:
+        shutil.rmtree(tmpdir)